@@ -1,3 +1,40 @@
-from .client import AsyncRxClient
-from .wrapper import ConvenientWrapper
-from .aibrx import IB, ConvenientIB
+"""
+The client classes are imported on first use, so importing a module of the
+package, e.g. aib.ticks or aib.shm in a reader process, does not load
+aib.client, aib.aibrx and ibapi.client for them. Those modules still import
+aib.decoder, and with it ibapi.decoder, for TickSink.
+"""
+
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+_exports = {
+    'AsyncRxClient': 'aib.client',
+    'ConvenientWrapper': 'aib.wrapper',
+    'IB': 'aib.aibrx',
+    'ConvenientIB': 'aib.aibrx',
+    'RequestError': 'aib.routing',
+    'Subscription': 'aib.routing',
+}
+
+__all__ = list(_exports)
+
+if TYPE_CHECKING:
+    from .client import AsyncRxClient
+    from .wrapper import ConvenientWrapper
+    from .aibrx import IB, ConvenientIB
+    from .routing import RequestError, Subscription
+
+
+def __getattr__(name: str):
+    module = _exports.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
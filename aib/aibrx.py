@@ -1,23 +1,69 @@
 import asyncio
 import logging as _logging
 
-from typing import Optional
-from ibapi.wrapper import EWrapper, Contract, TagValueList
+from typing import TYPE_CHECKING, Any, Optional, Callable, Dict, Iterable, List, Set, Union
+from ibapi.wrapper import EWrapper, Contract, TagValueList, ContractDetails, BarData, Execution, \
+                          TickerId, TickType, TickAttrib, TickAttribBidAsk, TickAttribLast, \
+                          SetOfString, SetOfFloat, ListOfHistoricalTick, ListOfHistoricalTickBidAsk, \
+                          ListOfHistoricalTickLast, ListOfContractDescription
 from ibapi.client import FaDataType, ScannerSubscription, ExecutionFilter, Order
-
-from aib import AsyncRxClient, ConvenientWrapper
+from ibapi.commission_report import CommissionReport
+from ibapi.order_state import OrderState
+from ibapi.utils import Decimal
+from ibapi.common import UNSET_DECIMAL, OrderId
+
+from aib.client import AsyncRxClient
+from aib.wrapper import ConvenientWrapper
+from aib.objects import Error, Snap, Last, MidPoint, TickPrice, TickSize, TickString, TickGeneric, \
+                        TickOptionComputation, MktDepth, MktDepthL2, RealTimeBar, PnL, PnLSingle, \
+                        ResponseExecDetails, ResponseSecDefOptParams
+from aib.contracts import ContractRegistry, registry, query_key
+from aib.encoder import OrderTemplate
+from aib.metrics import Metrics
+from aib.orders import OrderStore, TrackedOrder
+from aib.queues import BoundedQueue, BLOCK, event_key
+from aib.routing import WARNING_CODES, DEPTH_RESET, RequestError, Route, DepthSink, Request, Subscription
+
+if TYPE_CHECKING:
+    from aib.ticks import TickRingBuffer
+    from aib.bars import BarAggregator, BarSpec
+    from aib.book import OrderBook
+    from aib.history import HistoricalDownloader
 
 _logger = _logging.getLogger(__name__)
 _logger.setLevel(_logging.ERROR)
 
 
+def _float_size(size: Decimal) -> float:
+    return float('nan') if size == UNSET_DECIMAL else float(size)
+
+
 class IB(EWrapper, AsyncRxClient):
-    def __init__(self, client_id=1, host='127.0.0.1', port=7497):
+    def __init__(self, client_id=1, host='127.0.0.1', port=7497, contracts: Optional[ContractRegistry] = None,
+                 reconnect: bool = False):
         AsyncRxClient.__init__(self, wrapper=self)
+        # Contract details cache and interned contracts, shared by the clients of the process by default
+        self.contracts = contracts if contracts is not None else registry
         self.ib_client_id = client_id
         self.ib_host = host
         self.ib_port = port
         self.req_id: Optional[int] = None
+        # Pending requests and subscriptions by reqId
+        self._routes: Dict[int, Route] = {}
+        # a_run() keeps the connection up with a_supervise()
+        self.reconnect = reconnect
+        self.supervised = False
+        # Request of every open stream (Route or tick sink, by identity), replayed after a reconnect
+        self._streams: Dict[Any, Callable[[int], None]] = {}
+        # Set by nextValidId, see a_wait_ready()
+        self._ready = asyncio.Event()
+        # Executions and commission reports seen, so the resync after a reconnect does not repeat them
+        self._exec_ids: Set[str] = set()
+        self._commission_ids: Set[str] = set()
+        self._last_exec_time = ''
+        self._resync_ids: Set[int] = set()
+        # State of the orders and fills by orderId, permId, parentId and execId
+        self.orders = OrderStore(client_id)
 
     async def a_client_run(self):
         raise NotImplementedError
@@ -28,22 +74,298 @@ class IB(EWrapper, AsyncRxClient):
     def ready(self) -> bool:
         return self.req_id is not None
 
+    async def a_wait_ready(self, timeout: Optional[float] = None) -> int:
+        """ Wait for nextValidId and return the next reqId. Raises asyncio.TimeoutError after timeout seconds,
+        None waits forever, and ConnectionError when a connection in progress closes first. """
+        if self._ready.is_set():
+            return self.req_id
+        connecting = not self._disconnected.is_set()
+        waits = [asyncio.ensure_future(self._ready.wait())]
+        if connecting:
+            waits.append(asyncio.ensure_future(self._disconnected.wait()))
+        try:
+            await asyncio.wait(waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for wait in waits:
+                wait.cancel()
+        if self._ready.is_set():
+            return self.req_id
+        if connecting and self._disconnected.is_set():
+            raise ConnectionError('Connection to TWS closed before nextValidId')
+        raise asyncio.TimeoutError(f'No nextValidId within {timeout}s')
+
+    def intern_contract(self, contract: Contract) -> Contract:
+        return self.contracts.intern(contract)
+
     def nextValidId(self, orderId: int):
         self.req_id = orderId
+        self._ready.set()
         _logging.debug(f'[IB.nextValidId] use request id = {self.req_id}')
 
+    ####################################################################################################################
+    # Routing of the answers to awaitable requests and subscriptions by reqId
+
+    def error(self, reqId: TickerId, errorCode: int, errorString: str, advancedOrderRejectJson=""):
+        e = Error(reqId, errorCode, errorString, advancedOrderRejectJson)
+        # Orders and requests share the id sequence
+        self.orders.on_error(e)
+        sink = self.tick_sinks.get(reqId)
+        if sink is not None and errorCode not in WARNING_CODES:
+            del self.tick_sinks[reqId]
+            self._streams.pop(sink, None)
+            sink.fail(RequestError(e))
+        route = self._routes.get(reqId)
+        if route is not None:
+            if errorCode in WARNING_CODES:
+                route.warn(e)
+            elif errorCode == DEPTH_RESET:
+                route.reset(e)
+            else:
+                del self._routes[reqId]
+                self._streams.pop(route, None)
+                route.fail(RequestError(e))
+        EWrapper.error(self, reqId, errorCode, errorString, advancedOrderRejectJson)
+
+    def connectionClosed(self):
+        self.req_id = None
+        self._ready.clear()
+        routes = self._routes
+        self._routes = {}
+        if not self.supervised:
+            self._streams.clear()
+            sinks = list(self.tick_sinks.values())
+            # Cleared in place, the decoder holds the dict
+            self.tick_sinks.clear()
+            for sink in sinks:
+                sink.fail(ConnectionError('Connection to TWS closed'))
+        for route in routes.values():
+            # Streams of a supervised client are requested again once it reconnects
+            if route not in self._streams:
+                route.fail(ConnectionError('Connection to TWS closed'))
+
+    def _put(self, reqId: int, event):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(event)
+
+    def _end(self, reqId: int):
+        route = self._routes.pop(reqId, None)
+        if route is not None:
+            self._streams.pop(route, None)
+            route.end()
+
+    def contractDetails(self, reqId: int, contractDetails: ContractDetails):
+        self._put(reqId, self.contracts.add_details(contractDetails))
+
+    def bondContractDetails(self, reqId: int, contractDetails: ContractDetails):
+        self._put(reqId, self.contracts.add_details(contractDetails))
+
+    def contractDetailsEnd(self, reqId: int):
+        self._end(reqId)
+
+    def historicalData(self, reqId: int, bar: BarData):
+        self._put(reqId, bar)
+
+    def historicalDataEnd(self, reqId: int, start: str, end: str):
+        self._end(reqId)
+
+    def orderStatus(self, orderId: OrderId, status: str, filled: Decimal, remaining: Decimal, avgFillPrice: float,
+                    permId: int, parentId: int, lastFillPrice: float, clientId: int, whyHeld: str,
+                    mktCapPrice: float):
+        self.orders.on_order_status(orderId, status, filled, remaining, avgFillPrice, permId, parentId,
+                                    lastFillPrice, clientId, whyHeld, mktCapPrice)
+
+    def openOrder(self, orderId: OrderId, contract: Contract, order: Order, orderState: OrderState):
+        self.orders.on_open_order(orderId, self.contracts.intern(contract), order, orderState)
+
+    def completedOrder(self, contract: Contract, order: Order, orderState: OrderState):
+        self.orders.on_completed_order(self.contracts.intern(contract), order, orderState)
+
+    def is_duplicate_order_status(self, *args) -> bool:
+        """ True when an orderStatus repeats the last status of its order """
+        return self.orders.is_duplicate_status(*args)
+
+    def execDetails(self, reqId: int, contract: Contract, execution: Execution):
+        contract = self.contracts.intern(contract)
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(ResponseExecDetails(reqId, contract, execution))
+        self.orders.on_execution(contract, execution)
+        self._exec_ids.add(execution.execId)
+        if execution.time > self._last_exec_time:
+            self._last_exec_time = execution.time
+
+    def execDetailsEnd(self, reqId: int):
+        self._resync_ids.discard(reqId)
+        self._end(reqId)
+
+    def commissionReport(self, commissionReport: CommissionReport):
+        self._commission_ids.add(commissionReport.execId)
+        self.orders.on_commission(commissionReport)
+
+    def is_duplicate_execution(self, reqId: int, execution: Execution) -> bool:
+        """ True for a live or resynced execution that was already delivered, e.g. answered again by the resync
+        after a reconnect. Executions requested with reqExecutions are never duplicates. """
+        return (reqId == -1 or reqId in self._resync_ids) and execution.execId in self._exec_ids
+
+    def is_duplicate_commission(self, commissionReport: CommissionReport) -> bool:
+        return commissionReport.execId in self._commission_ids
+
+    def _historical_ticks(self, reqId: int, ticks: list, done: bool):
+        route = self._routes.get(reqId)
+        if route is not None:
+            for tick in ticks:
+                route.put(tick)
+            if done:
+                self._end(reqId)
+
+    def historicalTicks(self, reqId: int, ticks: ListOfHistoricalTick, done: bool):
+        self._historical_ticks(reqId, ticks, done)
+
+    def historicalTicksBidAsk(self, reqId: int, ticks: ListOfHistoricalTickBidAsk, done: bool):
+        self._historical_ticks(reqId, ticks, done)
+
+    def historicalTicksLast(self, reqId: int, ticks: ListOfHistoricalTickLast, done: bool):
+        self._historical_ticks(reqId, ticks, done)
+
+    def headTimestamp(self, reqId: int, headTimestamp: str):
+        self._put(reqId, headTimestamp)
+        self._end(reqId)
+
+    def securityDefinitionOptionParameter(self, reqId: int, exchange: str,
+                                          underlyingConId: int, tradingClass: str, multiplier: str,
+                                          expirations: SetOfString, strikes: SetOfFloat):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(ResponseSecDefOptParams(reqId, exchange, underlyingConId, tradingClass,
+                                              multiplier, expirations, strikes))
+
+    def securityDefinitionOptionParameterEnd(self, reqId: int):
+        self._end(reqId)
+
+    def symbolSamples(self, reqId: int, contractDescriptions: ListOfContractDescription):
+        route = self._routes.get(reqId)
+        if route is not None:
+            for contractDescription in contractDescriptions:
+                route.put(contractDescription)
+            self._end(reqId)
+
+    def fundamentalData(self, reqId: TickerId, data: str):
+        self._put(reqId, data)
+        self._end(reqId)
+
+    def tickByTickBidAsk(self, reqId: int, time: int, bidPrice: float, askPrice: float,
+                         bidSize: Decimal, askSize: Decimal, tickAttribBidAsk: TickAttribBidAsk):
+        sink = self.tick_sinks.get(reqId)
+        if sink is not None:
+            sink.on_bid_ask(time, bidPrice, askPrice, _float_size(bidSize), _float_size(askSize),
+                            tickAttribBidAsk.bidPastLow | tickAttribBidAsk.askPastHigh << 1)
+            return
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(Snap(reqId, time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk))
+
+    def tickByTickAllLast(self, reqId: int, tickType: int, time: int, price: float, size: Decimal,
+                          tickAttribLast: TickAttribLast, exchange: str, specialConditions: str):
+        sink = self.tick_sinks.get(reqId)
+        if sink is not None:
+            sink.on_last(tickType, time, price, _float_size(size),
+                         tickAttribLast.pastLimit | tickAttribLast.unreported << 1, exchange, specialConditions)
+            return
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(Last(reqId, tickType, time, price, size, tickAttribLast, exchange, specialConditions))
+
+    def tickByTickMidPoint(self, reqId: int, time: int, midPoint: float):
+        sink = self.tick_sinks.get(reqId)
+        if sink is not None:
+            sink.on_mid_point(time, midPoint)
+            return
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(MidPoint(reqId, time, midPoint))
+
+    def tickPrice(self, reqId: TickerId, tickType: TickType, price: float, attrib: TickAttrib):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(TickPrice(reqId, tickType, price, attrib))
+
+    def tickSize(self, reqId: TickerId, tickType: TickType, size: Decimal):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(TickSize(reqId, tickType, size))
+
+    def tickString(self, reqId: TickerId, tickType: TickType, value: str):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(TickString(reqId, tickType, value))
+
+    def tickGeneric(self, reqId: TickerId, tickType: TickType, value: float):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(TickGeneric(reqId, tickType, value))
+
+    def tickOptionComputation(self, reqId: TickerId, tickType: TickType, tickAttrib: int,
+                              impliedVol: float, delta: float, optPrice: float, pvDividend: float,
+                              gamma: float, vega: float, theta: float, undPrice: float):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(TickOptionComputation(reqId, tickType, tickAttrib, impliedVol, delta, optPrice,
+                                            pvDividend, gamma, vega, theta, undPrice))
+
+    def tickSnapshotEnd(self, reqId: int):
+        self._end(reqId)
+
+    def updateMktDepth(self, reqId: TickerId, position: int, operation: int,
+                       side: int, price: float, size: Decimal):
+        route = self._routes.get(reqId)
+        if route is not None:
+            if isinstance(route, DepthSink):
+                route.update(position, operation, side, price, _float_size(size))
+            else:
+                route.put(MktDepth(reqId, position, operation, side, price, size))
+
+    def updateMktDepthL2(self, reqId: TickerId, position: int, marketMaker: str,
+                         operation: int, side: int, price: float, size: Decimal, isSmartDepth: bool):
+        route = self._routes.get(reqId)
+        if route is not None:
+            if isinstance(route, DepthSink):
+                route.update(position, operation, side, price, _float_size(size), marketMaker)
+            else:
+                route.put(MktDepthL2(reqId, position, marketMaker, operation, side, price, size, isSmartDepth))
+
+    def realtimeBar(self, reqId: TickerId, time: int, open_: float, high: float, low: float, close: float,
+                    volume: Decimal, wap: Decimal, count: int):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(RealTimeBar(reqId, time, open_, high, low, close, volume, wap, count))
+
+    def pnl(self, reqId: int, dailyPnL: float, unrealizedPnL: float, realizedPnL: float):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(PnL(reqId, dailyPnL, unrealizedPnL, realizedPnL))
+
+    def pnlSingle(self, reqId: int, pos: Decimal, dailyPnL: float, unrealizedPnL: float,
+                  realizedPnL: float, value: float):
+        route = self._routes.get(reqId)
+        if route is not None:
+            route.put(PnLSingle(reqId, pos, dailyPnL, unrealizedPnL, realizedPnL, value))
+
     async def _a_client_run_if_ready(self):
-        while not self.ready:
+        if not self.ready:
             note = 'Waiting for connection'
             print(note)
             _logger.debug(f'[IB._a_client_run_if_ready] {note}')
-            await asyncio.sleep(2)
+            await self._ready.wait()
         await self.a_client_run()
 
     async def a_run(self):
         note = f'Connecting to {self.ib_host}:{self.ib_port} with client id = {self.ib_client_id}'
         print(note)
         _logger.debug(f'[IB.a_run] {note}')
+        if self.reconnect:
+            await asyncio.gather(self._a_client_run_if_ready(), self.a_supervise())
+            return
         # TODO: add exception handling
         await self.connect(self.ib_host, self.ib_port, self.ib_client_id)
         note2 = f'Starting run'
@@ -51,6 +373,80 @@ class IB(EWrapper, AsyncRxClient):
         _logger.debug(f'[IB.a_run] {note2}')
         await asyncio.gather(self._a_client_run_if_ready(), self.run())
 
+    ####################################################################################################################
+    # Supervised connection: reconnect, replay the streams and resync the order state
+
+    async def a_supervise(self, connect_timeout: float = 10.0, backoff_min: float = 0.5, backoff_max: float = 30.0):
+        """ Keep the connection up until cancelled, also runs run(). Connects with a timeout and reconnects at once
+        after a connection is lost, then with exponential backoff while the attempts fail. After a reconnect the open
+        streams are requested again with fresh reqIds (see Route.resume()), and open orders, positions and the
+        executions since the last one seen are requested, without repeating executions already delivered (see
+        is_duplicate_execution()). """
+        self.supervised = True
+        self.connect_timeout = connect_timeout
+        run_task = asyncio.ensure_future(self.run())
+        backoff = backoff_min
+        connected_before = False
+        try:
+            while True:
+                if await self._a_connect_ready(connect_timeout):
+                    backoff = backoff_min
+                    if connected_before:
+                        self._resume_streams()
+                        self._resync()
+                    connected_before = True
+                    await self._disconnected.wait()
+                    _logger.warning(f'[IB.a_supervise] connection lost, reconnecting')
+                    continue
+                await asyncio.sleep(backoff)
+                backoff = min(2 * backoff, backoff_max)
+        finally:
+            self.supervised = False
+            run_task.cancel()
+            if self.isConnected():
+                await self.disconnect()
+
+    async def _a_connect_ready(self, timeout: float) -> bool:
+        await self.connect(self.ib_host, self.ib_port, self.ib_client_id)
+        if not self.isConnected():
+            return False
+        try:
+            await self.a_wait_ready(timeout)
+        except ConnectionError:
+            return False
+        except asyncio.TimeoutError:
+            _logger.warning(f'[IB._a_connect_ready] no nextValidId within {timeout}s')
+            await self.disconnect()
+            return False
+        return True
+
+    def _resume_streams(self):
+        streams = self._streams
+        self._streams = {}
+        for target, request in streams.items():
+            req_id = self._new_req_id()
+            if isinstance(target, Route):
+                self._routes[req_id] = target
+                target.resume(req_id)
+            else:
+                # Tick sink
+                if self.tick_sinks.get(target.req_id) is target:
+                    del self.tick_sinks[target.req_id]
+                self.tick_sinks[req_id] = target
+                target.req_id = req_id
+            self._streams[target] = request
+            request(req_id)
+
+    def _resync(self):
+        self.reqOpenOrders()
+        self.reqPositions()
+        execFilter = ExecutionFilter()
+        # yyyymmdd hh:mm:ss of the last execution, executions of that second are deduplicated by execId
+        execFilter.time = self._last_exec_time[:17]
+        req_id = self._new_req_id()
+        self._resync_ids.add(req_id)
+        self.reqExecutions(req_id, execFilter)
+
     ####################################################################################################################
 
     def req_mkt_data(self,
@@ -67,6 +463,45 @@ class IB(EWrapper, AsyncRxClient):
         self.reqTickByTickData(self.req_id, contract, tickType, numberOfTicks, ignoreSize)
         self.req_id += 1
 
+    def req_tick_by_tick_buffer(self, contract: Contract, tickType: str, capacity: int,
+                                ignoreSize: bool = False) -> 'TickRingBuffer':
+        """ Subscribe to tick-by-tick data kept in a NumPy ring buffer of the last capacity ticks. These ticks go to
+        the buffer only, not to the wrapper callbacks; an error of the request ends the stream and is set in
+        buffer.error. """
+        # numpy is optional, only needed by the buffers
+        from aib.ticks import tick_ring_buffer
+        buffer = tick_ring_buffer(tickType, capacity)
+        buffer.req_id = self.req_id
+        self.tick_sinks[buffer.req_id] = buffer
+        self._streams[buffer] = lambda req_id: self.reqTickByTickData(req_id, contract, tickType, 0, ignoreSize)
+        self.req_tick_by_tick_data(contract, tickType, 0, ignoreSize)
+        return buffer
+
+    def req_tick_by_tick_bars(self, contract: Contract, tickType: str, specs: Iterable['BarSpec'],
+                              capacity: int = 1000, on_bar: Optional[Callable[['BarSpec', tuple], None]] = None,
+                              ignoreSize: bool = False) -> 'BarAggregator':
+        """ Subscribe to tick-by-tick data aggregated into the bars of specs, see aib.bars.
+        Cancel with cancel_tick_by_tick_buffer(). """
+        # numpy is optional, only needed by the bars
+        from aib.bars import BarAggregator
+        bars = BarAggregator(specs, capacity, on_bar)
+        bars.req_id = self.req_id
+        self.tick_sinks[bars.req_id] = bars
+        self._streams[bars] = lambda req_id: self.reqTickByTickData(req_id, contract, tickType, 0, ignoreSize)
+        self.req_tick_by_tick_data(contract, tickType, 0, ignoreSize)
+        return bars
+
+    def cancel_tick_by_tick_buffer(self, buffer: Union['TickRingBuffer', 'BarAggregator']):
+        self._streams.pop(buffer, None)
+        if self.tick_sinks.pop(buffer.req_id, None) is not None:
+            self.cancelTickByTickData(buffer.req_id)
+
+    def historical_downloader(self, cache_dir: Optional[str] = None, concurrency: int = 4) -> 'HistoricalDownloader':
+        """ Chunked, paced and cached download of long ranges of bars and ticks, see aib.history """
+        # numpy is optional, only needed by the downloader
+        from aib.history import HistoricalDownloader
+        return HistoricalDownloader(self, cache_dir=cache_dir, concurrency=concurrency)
+
     def calculate_implied_volatility(self,
                                      contract: Contract, optionPrice: float,
                                      underPrice: float, implVolOptions: TagValueList):
@@ -84,10 +519,33 @@ class IB(EWrapper, AsyncRxClient):
         self.exerciseOptions(self.req_id, contract, exerciseAction, exerciseQuantity, account, override)
         self.req_id += 1
 
-    def place_order(self, contract: Contract, order: Order):
+    def place_order(self, contract: Contract, order: Order) -> TrackedOrder:
         order.orderId = self.req_id
+        tracked = self.orders.on_place(order.orderId, contract, order)
         self.placeOrder(self.req_id, contract, order)
         self.req_id += 1
+        return tracked
+
+    def order_template(self, contract: Contract, order: Order) -> OrderTemplate:
+        """ Precompiled placeOrder message of contract and order for place_order_fast(), see aib.encoder.
+        Every field but the orderId, quantity and prices is the order's, keep the template for orders like it. """
+        if not self.isConnected():
+            raise ConnectionError('Not connected to TWS')
+        return OrderTemplate(self, contract, order)
+
+    def place_order_fast(self, template: OrderTemplate, quantity, lmtPrice: Optional[float] = None,
+                         auxPrice: Optional[float] = None) -> TrackedOrder:
+        """ Order of template with a new orderId, written to the connection without EClient.placeOrder """
+        order_id = self.req_id
+        self.conn.sendMsg(template.encode(order_id, quantity, lmtPrice, auxPrice))
+        self.req_id += 1
+        return self.orders.on_place(order_id, template.contract, template.make_order(order_id, quantity, lmtPrice,
+                                                                                     auxPrice))
+
+    def modify_order_fast(self, template: OrderTemplate, orderId: int, quantity, lmtPrice: Optional[float] = None,
+                          auxPrice: Optional[float] = None):
+        """ New quantity and prices of an order placed with template """
+        self.conn.sendMsg(template.encode(orderId, quantity, lmtPrice, auxPrice))
 
     def req_account_summary(self, groupName: str, tags: str):
         self.reqAccountSummary(self.req_id, groupName, tags)
@@ -211,16 +669,186 @@ class IB(EWrapper, AsyncRxClient):
         self.reqUserInfo(self.req_id)
         self.req_id += 1
 
+    ####################################################################################################################
+    # Awaitable requests: return all the answers once the ...End callback arrives or raise RequestError
+
+    def _new_req_id(self) -> int:
+        req_id = self.req_id
+        self.req_id += 1
+        return req_id
+
+    async def _a_request(self, request: Callable[[int], None],
+                         cancel: Optional[Callable[[int], None]] = None, timeout: Optional[float] = None) -> List:
+        if not self.isConnected():
+            raise ConnectionError('Not connected to TWS')
+        req_id = self._new_req_id()
+        route = Request()
+        self._routes[req_id] = route
+        try:
+            request(req_id)
+            return await route.result(timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if cancel is not None and req_id in self._routes:
+                cancel(req_id)
+            raise
+        finally:
+            self._routes.pop(req_id, None)
+
+    async def a_req_contract_details(self, contract: Contract, timeout: Optional[float] = None,
+                                     use_cache: bool = True) -> List[ContractDetails]:
+        """ Answered from self.contracts when the same contract was requested before """
+        if use_cache:
+            details = self.contracts.query(contract)
+            if details is not None:
+                return details
+        details = await self._a_request(lambda req_id: self.reqContractDetails(req_id, contract), timeout=timeout)
+        self.contracts.add_query(contract, details)
+        return details
+
+    async def a_req_historical_data(self, contract: Contract, endDateTime: str,
+                                    durationStr: str, barSizeSetting: str, whatToShow: str,
+                                    useRTH: int, formatDate: int, chartOptions: TagValueList = None,
+                                    timeout: Optional[float] = None) -> List[BarData]:
+        return await self._a_request(
+            lambda req_id: self.reqHistoricalData(req_id, contract, endDateTime, durationStr, barSizeSetting,
+                                                  whatToShow, useRTH, formatDate, False, chartOptions or []),
+            cancel=self.cancelHistoricalData, timeout=timeout)
+
+    async def a_req_historical_ticks(self, contract: Contract, startDateTime: str,
+                                     endDateTime: str, numberOfTicks: int, whatToShow: str,
+                                     useRth: int, ignoreSize: bool, miscOptions: TagValueList = None,
+                                     timeout: Optional[float] = None) -> List:
+        return await self._a_request(
+            lambda req_id: self.reqHistoricalTicks(req_id, contract, startDateTime, endDateTime, numberOfTicks,
+                                                   whatToShow, useRth, ignoreSize, miscOptions or []),
+            timeout=timeout)
+
+    async def a_req_executions(self, execFilter: ExecutionFilter,
+                               timeout: Optional[float] = None) -> List[ResponseExecDetails]:
+        return await self._a_request(lambda req_id: self.reqExecutions(req_id, execFilter), timeout=timeout)
+
+    async def a_req_head_time_stamp(self, contract: Contract, whatToShow: str, useRTH: int, formatDate: int,
+                                    timeout: Optional[float] = None) -> str:
+        result = await self._a_request(
+            lambda req_id: self.reqHeadTimeStamp(req_id, contract, whatToShow, useRTH, formatDate),
+            cancel=self.cancelHeadTimeStamp, timeout=timeout)
+        return result[0]
+
+    async def a_req_sec_def_opt_params(self, underlyingSymbol: str, futFopExchange: str,
+                                       underlyingSecType: str, underlyingConId: int,
+                                       timeout: Optional[float] = None) -> List[ResponseSecDefOptParams]:
+        return await self._a_request(
+            lambda req_id: self.reqSecDefOptParams(req_id, underlyingSymbol, futFopExchange,
+                                                   underlyingSecType, underlyingConId),
+            timeout=timeout)
+
+    async def a_req_matching_symbols(self, pattern: str, timeout: Optional[float] = None) -> List:
+        return await self._a_request(lambda req_id: self.reqMatchingSymbols(req_id, pattern), timeout=timeout)
+
+    async def a_req_fundamental_data(self, contract: Contract, reportType: str,
+                                     fundamentalDataOptions: TagValueList = None,
+                                     timeout: Optional[float] = None) -> str:
+        result = await self._a_request(
+            lambda req_id: self.reqFundamentalData(req_id, contract, reportType, fundamentalDataOptions or []),
+            cancel=self.cancelFundamentalData, timeout=timeout)
+        return result[0]
+
+    ####################################################################################################################
+    # Subscriptions: async iterators fed only with the events of their reqId
+
+    def _subscribe(self, request: Callable[[int], None], cancel: Callable[[int], None],
+                   snapshot: bool = False) -> Subscription:
+        if not self.isConnected():
+            raise ConnectionError('Not connected to TWS')
+        req_id = self._new_req_id()
+        subscription = Subscription(req_id, cancel=lambda i: self._cancel_route(i, cancel, subscription))
+        self._routes[req_id] = subscription
+        if not snapshot:
+            self._streams[subscription] = request
+        request(req_id)
+        return subscription
+
+    def _cancel_route(self, req_id: int, cancel: Callable[[int], None], route: Optional[Route] = None):
+        routed = self._routes.pop(req_id, None)
+        # The stream of a route is also forgotten while reconnecting, when it is not routed
+        self._streams.pop(route if route is not None else routed, None)
+        if routed is not None and self.isConnected():
+            cancel(req_id)
+
+    def subscribe_mkt_data(self, contract: Contract, genericTickList: str = '', snapshot: bool = False,
+                           regulatorySnapshot: bool = False, mktDataOptions: TagValueList = None) -> Subscription:
+        return self._subscribe(
+            lambda req_id: self.reqMktData(req_id, contract, genericTickList, snapshot,
+                                           regulatorySnapshot, mktDataOptions or []),
+            self.cancelMktData, snapshot=snapshot or regulatorySnapshot)
+
+    def subscribe_tick_by_tick_data(self, contract: Contract, tickType: str,
+                                    numberOfTicks: int = 0, ignoreSize: bool = False) -> Subscription:
+        return self._subscribe(
+            lambda req_id: self.reqTickByTickData(req_id, contract, tickType, numberOfTicks, ignoreSize),
+            self.cancelTickByTickData)
+
+    def subscribe_mkt_depth(self, contract: Contract, numRows: int,
+                            isSmartDepth: bool, mktDepthOptions: TagValueList = None) -> Subscription:
+        return self._subscribe(
+            lambda req_id: self.reqMktDepth(req_id, contract, numRows, isSmartDepth, mktDepthOptions or []),
+            lambda req_id: self.cancelMktDepth(req_id, isSmartDepth))
+
+    def subscribe_order_book(self, contract: Contract, numRows: int = 10, isSmartDepth: bool = False,
+                             mktDepthOptions: TagValueList = None) -> 'OrderBook':
+        """ Market depth kept in an array backed OrderBook instead of MktDepth events, see aib.book """
+        # numpy is optional, only needed by the books
+        from aib.book import OrderBook
+        if not self.isConnected():
+            raise ConnectionError('Not connected to TWS')
+        req_id = self._new_req_id()
+        book = OrderBook(numRows, req_id, cancel=lambda i: self._cancel_route(
+            i, lambda r: self.cancelMktDepth(r, isSmartDepth), book))
+        request = lambda r: self.reqMktDepth(r, contract, numRows, isSmartDepth, mktDepthOptions or [])
+        self._routes[req_id] = book
+        self._streams[book] = request
+        request(req_id)
+        return book
+
+    def subscribe_real_time_bars(self, contract: Contract, barSize: int, whatToShow: str, useRTH: bool,
+                                 realTimeBarsOptions: TagValueList = None) -> Subscription:
+        return self._subscribe(
+            lambda req_id: self.reqRealTimeBars(req_id, contract, barSize, whatToShow, useRTH,
+                                                realTimeBarsOptions or []),
+            self.cancelRealTimeBars)
+
+    def subscribe_pnl(self, account: str, modelCode: str) -> Subscription:
+        return self._subscribe(lambda req_id: self.reqPnL(req_id, account, modelCode), self.cancelPnL)
+
+    def subscribe_pnl_single(self, account: str, modelCode: str, conid: int) -> Subscription:
+        return self._subscribe(lambda req_id: self.reqPnLSingle(req_id, account, modelCode, conid),
+                               self.cancelPnLSingle)
+
 
 class ConvenientIB(ConvenientWrapper, IB):
-    def __init__(self, client_id=1, host='127.0.0.1', port=7497):
-        self._rx_queue = asyncio.Queue()
-        IB.__init__(self, client_id=client_id, host=host, port=port)
+    def __init__(self, client_id=1, host='127.0.0.1', port=7497, rx_queue_size: int = 0, rx_queue_policy: str = BLOCK,
+                 contracts: Optional[ContractRegistry] = None, reconnect: bool = False):
+        # Bounded when rx_queue_size > 0, see aib.queues for the overflow policies
+        self._rx_queue = BoundedQueue(rx_queue_size, rx_queue_policy, event_key)
+        IB.__init__(self, client_id=client_id, host=host, port=port, contracts=contracts, reconnect=reconnect)
 
     @property
-    def rx_queue(self):
+    def rx_queue(self) -> BoundedQueue:
         return self._rx_queue
 
+    async def a_wait_for_consumer(self):
+        if self._rx_queue.full():
+            await self._rx_queue.wait_for_room()
+
+    def _instrument(self, metrics: Metrics):
+        IB._instrument(self, metrics)
+        rx_queue = self._rx_queue
+        rx_queue.instrument(metrics.histogram('rx_queue.dwell'), metrics.histogram('event.age'),
+                            lambda item: item[0] or None)
+        metrics.gauge('rx_queue.depth', rx_queue.qsize)
+        metrics.gauge('rx_queue.dropped', lambda: rx_queue.dropped)
+        metrics.gauge('rx_queue.conflated', lambda: rx_queue.conflated)
+
     def nextValidId(self, orderId: int):
         _logger.debug(f'[ConvenientIB.nextValidId]')
         IB.nextValidId(self, orderId)
@@ -0,0 +1,220 @@
+"""
+Streaming OHLCV bars built from tick-by-tick data, see IB.req_tick_by_tick_bars().
+
+A BarAggregator is a TickSink: every tick is appended once to a staging area
+of plain arrays (time, price, size), then each BarSpec only updates its running
+count, volume or dollar value. When a bar closes its open, high, low, close,
+volume and VWAP are computed with NumPy over the slice of staged ticks it
+covers, and the bar is appended as a row to a TickRingBuffer of BAR_DTYPE.
+Staged ticks are dropped once every spec has closed the bars using them.
+
+- time bars close at the first tick of the next interval of size seconds,
+  intervals without ticks have no bar
+- tick, volume and dollar bars close with the tick that reaches size ticks,
+  shares or price * size, the tick is not split between bars
+
+Last and AllLast ticks are aggregated as they are. BidAsk and MidPoint ticks
+are aggregated at the mid price with a size of 0, so only their time and tick
+bars are meaningful. flush() closes the bars in progress.
+
+Requires numpy (pip install aib[numpy]).
+"""
+
+
+from array import array
+from dataclasses import dataclass
+from math import nan
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from aib.decoder import TickSink
+from aib.ticks import TickRingBuffer
+
+# time and end are the times of the first and last tick, time is the interval start for time bars
+BAR_DTYPE = np.dtype([('time', 'i8'), ('end', 'i8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'),
+                      ('close', 'f8'), ('volume', 'f8'), ('wap', 'f8'), ('count', 'i8')])
+
+TIME = 'time'
+TICK = 'tick'
+VOLUME = 'volume'
+DOLLAR = 'dollar'
+
+# Staged ticks are compacted once this many are no longer needed
+_COMPACT_AT = 4096
+
+
+@dataclass(frozen=True, slots=True)
+class BarSpec:
+    kind: str
+    # Seconds for time bars (a whole number), ticks, shares or price * size for the others
+    size: float
+
+
+class _Builder:
+    __slots__ = ('spec', 'size', 'bars', 'start', 'acc', 'time', 'end')
+
+    def __init__(self, spec: BarSpec, capacity: int):
+        if spec.size <= 0:
+            raise ValueError(f'Bar size must be positive: {spec}')
+        self.spec = spec
+        self.size = spec.size
+        self.bars = TickRingBuffer(capacity, BAR_DTYPE)
+        # First staged tick of the bar in progress
+        self.start = 0
+        self.acc = 0.0
+        self.time = 0
+        self.end = 0
+
+    def tick(self, aggregator: 'BarAggregator', i: int, time: int, price: float, size: float):
+        # The tick was staged at i
+        raise NotImplementedError
+
+
+class _TimeBuilder(_Builder):
+    __slots__ = ()
+
+    def __init__(self, spec: BarSpec, capacity: int):
+        # Tick times are whole seconds
+        if spec.size != int(spec.size) or spec.size < 1:
+            raise ValueError(f'Time bars need a whole number of seconds: {spec}')
+        super().__init__(spec, capacity)
+        self.size = int(spec.size)
+
+    def tick(self, aggregator, i, time, price, size):
+        if time >= self.end:
+            if i > self.start:
+                aggregator._close(self, i)
+            step = self.size
+            self.time = time - time % step
+            self.end = self.time + step
+
+
+class _TickBuilder(_Builder):
+    __slots__ = ()
+
+    def tick(self, aggregator, i, time, price, size):
+        self.acc += 1
+        if self.acc >= self.size:
+            aggregator._close(self, i + 1)
+
+
+class _VolumeBuilder(_Builder):
+    __slots__ = ()
+
+    def tick(self, aggregator, i, time, price, size):
+        if size == size:
+            self.acc += size
+        if self.acc >= self.size:
+            aggregator._close(self, i + 1)
+
+
+class _DollarBuilder(_Builder):
+    __slots__ = ()
+
+    def tick(self, aggregator, i, time, price, size):
+        if size == size:
+            self.acc += price * size
+        if self.acc >= self.size:
+            aggregator._close(self, i + 1)
+
+
+_BUILDERS = {TIME: _TimeBuilder, TICK: _TickBuilder, VOLUME: _VolumeBuilder, DOLLAR: _DollarBuilder}
+
+
+class BarAggregator(TickSink):
+    def __init__(self, specs: Iterable[BarSpec], capacity: int = 1000,
+                 on_bar: Optional[Callable[[BarSpec, tuple], None]] = None):
+        """ Keeps the last capacity bars of every spec, on_bar is called with every bar closed """
+        self.req_id = None
+        self.on_bar = on_bar
+        self._builders: List[_Builder] = []
+        for spec in specs:
+            builder = _BUILDERS.get(spec.kind)
+            if builder is None:
+                raise ValueError(f'Unknown bar kind {spec.kind}')
+            self._builders.append(builder(spec, capacity))
+        if not self._builders:
+            raise ValueError('No bar specs')
+        self.bars: Dict[BarSpec, TickRingBuffer] = {b.spec: b.bars for b in self._builders}
+        # Number of ticks aggregated since creation
+        self.count = 0
+        self._times = array('q')
+        self._prices = array('d')
+        self._sizes = array('d')
+
+    ####################################################################################################################
+    # TickSink
+
+    def on_last(self, tickType: int, time: int, price: float, size: float, mask: int,
+                exchange: str, specialConditions: str):
+        self.add(time, price, size)
+
+    def on_bid_ask(self, time: int, bidPrice: float, askPrice: float,
+                   bidSize: float, askSize: float, mask: int):
+        self.add(time, (bidPrice + askPrice) / 2, 0.0)
+
+    def on_mid_point(self, time: int, midPoint: float):
+        self.add(time, midPoint, 0.0)
+
+    ####################################################################################################################
+
+    def add(self, time: int, price: float, size: float):
+        i = len(self._prices)
+        self._times.append(time)
+        self._prices.append(price)
+        self._sizes.append(size)
+        self.count += 1
+        for builder in self._builders:
+            builder.tick(self, i, time, price, size)
+        if i >= _COMPACT_AT:
+            self._compact()
+
+    def _close(self, builder: _Builder, end: int):
+        start = builder.start
+        prices = np.frombuffer(self._prices, dtype=np.float64)[start:end]
+        sizes = np.frombuffer(self._sizes, dtype=np.float64)[start:end]
+        volume = float(np.nansum(sizes))
+        wap = float(np.nansum(prices * sizes)) / volume if volume else nan
+        row = (builder.time if builder.spec.kind == TIME else self._times[start], self._times[end - 1],
+               prices[0], prices.max(), prices.min(), prices[-1], volume, wap, end - start)
+        # The views of the staging arrays must be gone before they are appended to again
+        del prices, sizes
+        builder.bars.append(row)
+        builder.start = end
+        builder.acc = 0.0
+        if self.on_bar is not None:
+            self.on_bar(builder.spec, row)
+
+    def _compact(self):
+        drop = min(b.start for b in self._builders)
+        if drop < _COMPACT_AT:
+            return
+        del self._times[:drop]
+        del self._prices[:drop]
+        del self._sizes[:drop]
+        for builder in self._builders:
+            builder.start -= drop
+
+    def flush(self):
+        """ Close the bars in progress, e.g. at the end of the session """
+        end = len(self._prices)
+        for builder in self._builders:
+            if end > builder.start:
+                self._close(builder, end)
+                if builder.spec.kind == TIME:
+                    builder.end = 0
+
+    def last(self, spec: BarSpec, n: int = None) -> np.ndarray:
+        """ View of the last n closed bars of spec, oldest first """
+        return self.bars[spec].last(n)
+
+    def clear(self):
+        del self._times[:]
+        del self._prices[:]
+        del self._sizes[:]
+        for builder in self._builders:
+            builder.start = 0
+            builder.acc = 0.0
+            builder.end = 0
+            builder.bars.clear()
@@ -0,0 +1,223 @@
+"""
+L2 order book of a market depth subscription, see IB.subscribe_order_book().
+
+Each side keeps its prices and sizes in Python lists, best level first, and
+insert, update and delete operations are list operations: an insert drops
+the last row when the book is full. For a book of a few rows they are faster
+than writing NumPy scalars and shifting short slices, see bench_book.py.
+bids and asks are NumPy structured arrays of (price, size) rows built when
+read and kept until the side changes; they are copies, not views of the book.
+
+With smart depth (updateMktDepthL2) the market maker of every row is kept in
+a list alongside the prices. changed() wakes a consumer only when a level
+above the depth it watches moves, e.g. the top of book.
+
+Requires numpy (pip install aib[numpy]).
+"""
+
+
+import asyncio
+
+from math import nan
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from aib.objects import Error
+from aib.routing import DepthSink
+
+LEVEL_DTYPE = np.dtype([('price', 'f8'), ('size', 'f8')])
+
+# updateMktDepth operation and side
+INSERT = 0
+UPDATE = 1
+DELETE = 2
+ASK = 0
+BID = 1
+
+
+class _Side:
+    __slots__ = ('prices', 'sizes', 'market_makers', 'levels')
+
+    def __init__(self):
+        self.prices: List[float] = []
+        self.sizes: List[float] = []
+        self.market_makers: List[str] = []
+        # Array of the rows, built on demand and dropped by every change
+        self.levels: Optional[np.ndarray] = None
+
+    def array(self) -> np.ndarray:
+        levels = self.levels
+        if levels is None:
+            levels = self.levels = np.empty(len(self.prices), dtype=LEVEL_DTYPE)
+            levels['price'] = self.prices
+            levels['size'] = self.sizes
+        return levels
+
+
+class OrderBook(DepthSink):
+    def __init__(self, rows: int = 10, req_id: Optional[int] = None,
+                 cancel: Optional[Callable[[int], None]] = None):
+        if rows <= 0:
+            raise ValueError('rows must be positive')
+        self.rows = rows
+        self.req_id = req_id
+        self._cancel = cancel
+        self.done = False
+        # Number of updates applied since creation
+        self.version = 0
+        self._sides = (_Side(), _Side())
+        # (depth, side, future) of the consumers waiting in changed()
+        self._waiters: List[Tuple[int, Optional[int], asyncio.Future]] = []
+
+    ####################################################################################################################
+
+    def update(self, position: int, operation: int, side: int, price: float, size: float, marketMaker: str = ''):
+        book_side = self._sides[side]
+        prices = book_side.prices
+        sizes = book_side.sizes
+        mms = book_side.market_makers
+        n = len(prices)
+        if operation == INSERT:
+            if position > n:
+                position = n
+            if position >= self.rows:
+                return
+            if n == self.rows:
+                # Full: the last row drops off
+                prices.pop()
+                sizes.pop()
+                mms.pop()
+            prices.insert(position, price)
+            sizes.insert(position, size)
+            mms.insert(position, marketMaker)
+        elif operation == UPDATE:
+            if position >= self.rows:
+                return
+            if position >= n:
+                # Update of a row not inserted yet, TWS sends these for the row after the last
+                pad = position + 1 - n
+                prices.extend([nan] * pad)
+                sizes.extend([0.0] * pad)
+                mms.extend([''] * pad)
+            prices[position] = price
+            sizes[position] = size
+            mms[position] = marketMaker
+        elif operation == DELETE:
+            if position >= n:
+                return
+            del prices[position]
+            del sizes[position]
+            del mms[position]
+        book_side.levels = None
+        self.version += 1
+        if self._waiters:
+            self._wake(side, position)
+
+    def _wake(self, side: int, position: int):
+        waiting = []
+        for waiter in self._waiters:
+            depth, waited_side, future = waiter
+            if future.done():
+                continue
+            if position < depth and (waited_side is None or waited_side == side):
+                future.set_result((side, position))
+            else:
+                waiting.append(waiter)
+        self._waiters = waiting
+
+    async def changed(self, depth: int = 1, side: Optional[int] = None) -> Tuple[int, int]:
+        """ Wait until a level above depth of side (or of either side) changes, returns (side, position) """
+        if self.done:
+            raise ConnectionError('Order book subscription ended')
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((depth, side, future))
+        return await future
+
+    def clear(self):
+        for book_side in self._sides:
+            book_side.prices.clear()
+            book_side.sizes.clear()
+            book_side.market_makers.clear()
+            book_side.levels = None
+        self.version += 1
+        # Every level changed, the consumers must not go on with the book they saw
+        if self._waiters:
+            self._wake(BID, 0)
+            self._wake(ASK, 0)
+
+    ####################################################################################################################
+    # Route
+
+    def end(self):
+        self._finish(ConnectionError('Order book subscription ended'))
+
+    def fail(self, exc: BaseException):
+        self._finish(exc)
+
+    def reset(self, error: Error):
+        # TWS sends the whole book again
+        self.clear()
+
+    def resume(self, req_id: int):
+        # TWS sends the whole book again for the new request
+        self.req_id = req_id
+        self.clear()
+
+    def _finish(self, exc: BaseException):
+        self.done = True
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.set_exception(exc)
+        self._waiters = []
+
+    def cancel(self):
+        """ Cancel the market depth subscription at TWS """
+        if not self.done and self._cancel is not None:
+            self._cancel(self.req_id)
+        self._finish(ConnectionError('Order book subscription cancelled'))
+
+    ####################################################################################################################
+
+    @property
+    def bids(self) -> np.ndarray:
+        """ The bid levels, best first, do not modify """
+        return self._sides[BID].array()
+
+    @property
+    def asks(self) -> np.ndarray:
+        """ The ask levels, best first, do not modify """
+        return self._sides[ASK].array()
+
+    @property
+    def bid_market_makers(self) -> List[str]:
+        return self._sides[BID].market_makers
+
+    @property
+    def ask_market_makers(self) -> List[str]:
+        return self._sides[ASK].market_makers
+
+    @property
+    def best_bid(self) -> float:
+        prices = self._sides[BID].prices
+        return prices[0] if prices else nan
+
+    @property
+    def best_ask(self) -> float:
+        prices = self._sides[ASK].prices
+        return prices[0] if prices else nan
+
+    @property
+    def mid(self) -> float:
+        return (self.best_bid + self.best_ask) / 2
+
+    @property
+    def spread(self) -> float:
+        return self.best_ask - self.best_bid
+
+    def imbalance(self, n: int = 1) -> float:
+        """ (bid size - ask size) / (bid size + ask size) of the top n levels, in [-1, 1], nan for an empty book """
+        bid_size = sum(self._sides[BID].sizes[:n])
+        ask_size = sum(self._sides[ASK].sizes[:n])
+        total = bid_size + ask_size
+        return (bid_size - ask_size) / total if total else nan
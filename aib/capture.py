@@ -0,0 +1,146 @@
+"""
+Raw capture of the inbound frames and their replay without TWS.
+
+A capture file starts with a header (magic, server version) followed by one
+record per frame: receive time in ns since the epoch, payload length and the
+payload, the frame without its size prefix. Files are append-only and are
+memory-mapped for replay, so captures larger than RAM can be replayed.
+"""
+
+
+import mmap
+import asyncio
+import logging
+
+from struct import Struct
+from typing import Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AIBCAP1\0"
+_header = Struct("!8sI")
+_record = Struct("!qI")
+_size_prefix = Struct("!I")
+
+
+class CaptureWriter:
+    def __init__(self, path: str, server_version: int, buffering: int = 1 << 20):
+        self.path = path
+        self._file = open(path, "ab", buffering=buffering)
+        if self._file.tell() == 0:
+            self._file.write(_header.pack(MAGIC, server_version))
+        self.frames = 0
+
+    def write(self, recv_ns: int, frame: bytes):
+        self._file.write(_record.pack(recv_ns, len(frame)))
+        self._file.write(frame)
+        self.frames += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class CaptureReader:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.server_version = _header.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not an aib capture file')
+
+    def __iter__(self) -> Iterator[Tuple[int, bytes]]:
+        """ Receive time and payload of every frame """
+        m = self._map
+        pos = _header.size
+        end = len(m)
+        unpack_from = _record.unpack_from
+        while pos + _record.size <= end:
+            recv_ns, size = unpack_from(m, pos)
+            pos += _record.size
+            if pos + size > end:
+                logger.warning("truncated record at the end of %s", self.path)
+                break
+            yield recv_ns, m[pos:pos + size]
+            pos += size
+
+    def close(self):
+        self._map.close()
+
+
+class ReplayConnection:
+    """
+    Stands in for Connection and returns the captured frames from recvMsg,
+    as fast as possible or at their original pacing scaled by speed.
+    """
+
+    def __init__(self, path: str, read_size: int = 4096, realtime: bool = False, speed: float = 1.0):
+        self.capture = CaptureReader(path)
+        self.server_version = self.capture.server_version
+        self.read_size = read_size
+        self.realtime = realtime
+        self.speed = speed
+        self._frames = iter(self.capture)
+        self._next: Optional[Tuple[int, bytes]] = None
+        self._start: Optional[Tuple[int, float]] = None
+        self._done = False
+        self.wrapper = None
+
+    def isConnected(self):
+        return not self._done
+
+    def sendMsg(self, msg):
+        return None
+
+    async def a_send_msg(self, msg):
+        return None
+
+    def _pop(self) -> Optional[Tuple[int, bytes]]:
+        item = self._next
+        if item is None:
+            item = next(self._frames, None)
+        self._next = None
+        return item
+
+    def _due(self, recv_ns: int, now: float) -> float:
+        if self._start is None:
+            self._start = (recv_ns, now)
+        return self._start[1] + (recv_ns - self._start[0]) / 1e9 / self.speed
+
+    async def recvMsg(self):
+        item = self._pop()
+        if item is None:
+            self._done = True
+            return None
+        loop = asyncio.get_running_loop()
+        if self.realtime:
+            delay = self._due(item[0], loop.time()) - loop.time()
+            await asyncio.sleep(delay if delay > 0 else 0)
+        else:
+            # Let the client decode what was read so far
+            await asyncio.sleep(0)
+        frame = item[1]
+        chunks = [_size_prefix.pack(len(frame)), frame]
+        size = 4 + len(frame)
+        now = loop.time()
+        # Add the frames that are due as well, up to read_size bytes
+        while size < self.read_size:
+            item = self._pop()
+            if item is None:
+                break
+            frame = item[1]
+            if size + 4 + len(frame) > self.read_size or (self.realtime and self._due(item[0], now) > now):
+                self._next = item
+                break
+            chunks.append(_size_prefix.pack(len(frame)))
+            chunks.append(frame)
+            size += 4 + len(frame)
+        return b"".join(chunks)
+
+    async def disconnect(self):
+        self._done = True
+        self.capture.close()
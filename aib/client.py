@@ -1,9 +1,14 @@
-from typing import Optional
+from typing import Optional, Dict
 
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
 from aib.reader import EReader
+from aib.decoder import FastDecoder, TickSink
 from aib.connection import Connection
+from aib.capture import CaptureWriter, ReplayConnection
+from aib.queues import BoundedQueue, BLOCK, frame_key
+from aib.threaded import DecodeThread
+from aib.metrics import Metrics, TimedWrapper
 
 
 """
@@ -21,6 +26,7 @@ It takes care of almost everything:
 The user just needs to override EWrapper methods to receive the answers.
 """
 
+import time
 import logging
 import socket
 import asyncio
@@ -43,15 +49,80 @@ logger = logging.getLogger(__name__)
 
 class AsyncRxClient(EClient):
 
-    def __init__(self, wrapper: EWrapper):
+    def __init__(self, wrapper: EWrapper, read_size: int = 4096,
+                 batch_size: int = 256, batch_time_budget: float = 0.002, fast_decode: bool = True,
+                 capture_path: Optional[str] = None, queue_size: int = 0, queue_policy: str = BLOCK,
+                 send_rate: Optional[float] = 40.0, send_burst: int = 10, decode_thread: bool = False,
+                 metrics: Optional[Metrics] = None):
+        # Connection lifecycle: socket open, handshake done (server version known) and closed, see a_wait_connected().
+        # Created first, EClient.__init__ already calls setConnState()
+        self._connected = asyncio.Event()
+        self._server_version_known = asyncio.Event()
+        self._disconnected = asyncio.Event()
+        self._disconnected.set()
         EClient.__init__(self, wrapper=wrapper)
+        self.read_size = read_size
+        # Read and decode in a DecodeThread, see aib.threaded; run() is then idle
+        self.decode_thread = decode_thread
+        self.decoder_thread: Optional[DecodeThread] = None
+        # Hot path instrumentation, see aib.metrics; set before connect()
+        self.metrics = metrics
+        # Seconds to open the socket and to complete the handshake, None waits forever
+        self.connect_timeout: Optional[float] = None
+        # perf_counter_ns() when the message being decoded was read from the socket, see aib.reader.epoch_time()
+        self.recv_ns = 0
+        # Outbound messages per second and burst, see aib.pacing; None sends without pacing
+        self.send_rate = send_rate
+        self.send_burst = send_burst
+        # Inbound frames are appended to this file when set, see a_replay()
+        self.capture_path = capture_path
+        # Parse the high rate market data messages with FastDecoder
+        self.fast_decode = fast_decode
+        # Messages decoded per wake-up of run() before yielding to the event loop
+        self.batch_size = batch_size
+        self.batch_time_budget = batch_time_budget
+        # Tick-by-tick data of these reqIds goes to the sink instead of the wrapper, see FastDecoder
+        self.tick_sinks: Dict[int, TickSink] = {}
         # self.msg_queue = queue.Queue()
-        self.msg_queue = Queue()
+        # Inbound frames, bounded when queue_size > 0, see aib.queues for the overflow policies
+        self.msg_queue = BoundedQueue(queue_size, queue_policy, frame_key)
         self.wrapper = wrapper
         self.decoder: Optional[decoder.Decoder] = None
         self.reader: Optional[EReader] = None
         self.reset()
 
+    def setConnState(self, connState):
+        EClient.setConnState(self, connState)
+        if connState == EClient.CONNECTING:
+            self._disconnected.clear()
+            self._connected.set()
+        elif connState == EClient.CONNECTED:
+            self._disconnected.clear()
+            self._connected.set()
+            self._server_version_known.set()
+        else:
+            self._connected.clear()
+            self._server_version_known.clear()
+
+    @staticmethod
+    async def _a_wait(event: asyncio.Event, timeout: Optional[float]):
+        if not event.is_set():
+            await asyncio.wait_for(event.wait(), timeout)
+
+    async def a_wait_connected(self, timeout: Optional[float] = None):
+        """ Wait until the socket to TWS is open. Raises asyncio.TimeoutError after timeout seconds,
+        None waits forever. """
+        await self._a_wait(self._connected, timeout)
+
+    async def a_wait_server_version(self, timeout: Optional[float] = None) -> int:
+        """ Wait for the end of the handshake and return the server version """
+        await self._a_wait(self._server_version_known, timeout)
+        return self.serverVersion()
+
+    async def a_wait_disconnected(self, timeout: Optional[float] = None):
+        """ Wait until the connection is closed and connectionClosed() has run, returns at once when not connected """
+        await self._a_wait(self._disconnected, timeout)
+
     async def a_send_msg(self, msg):
         full_msg = comm.make_msg(msg)
         logger.info("%s %s %s", "SENDING", current_fn_name(1), full_msg)
@@ -107,7 +178,8 @@ class AsyncRxClient(EClient):
             self.clientId = clientId
             logger.debug("Connecting to %s:%d w/ id:%d", self.host, self.port, self.clientId)
 
-            self.conn = Connection(self.host, self.port)
+            self.conn = Connection(self.host, self.port, self.read_size, self.send_rate, self.send_burst,
+                                   self.connect_timeout)
 
             await self.conn.connect()
             self.setConnState(EClient.CONNECTING)
@@ -127,18 +199,26 @@ class AsyncRxClient(EClient):
             logger.debug("REQUEST %s", msg2)
             await self.conn.a_send_msg(msg2)
 
-            self.decoder = decoder.Decoder(self.wrapper, self.serverVersion())
+            decoder_class = FastDecoder if self.fast_decode else decoder.Decoder
+            self.decoder = decoder_class(self.wrapper, self.serverVersion())
+            self.decoder.tick_sinks = self.tick_sinks
+            if self.metrics is not None:
+                self._instrument(self.metrics)
             fields = []
 
             #sometimes I get news before the server version, thus the loop
             while len(fields) != 2:
                 self.decoder.interpret(fields)
-                buf = await self.conn.recvMsg()
+                # Bounded by connect_timeout, TimeoutError is a socket.error
+                buf = await asyncio.wait_for(self.conn.reader.read(self.read_size), self.connect_timeout)
+                if not buf:
+                    raise ConnectionResetError('Connection closed during the handshake')
                 if not self.conn.isConnected():
                     # recvMsg() triggers disconnect() where there's a socket.error or 0 length buffer
                     # if we don't then drop out of the while loop it infinitely loops
                     logger.warning('Disconnected; resetting connection')
                     self.reset()
+                    self._disconnected.set()
                     return
                 logger.debug("ANSWER %s", buf)
                 if len(buf) > 0:
@@ -158,10 +238,16 @@ class AsyncRxClient(EClient):
 
             self.setConnState(EClient.CONNECTED)
 
-            # self.reader = reader.EReader(self.conn, self.msg_queue)
-            self.reader = EReader(self.conn, self.msg_queue)
-            # self.reader.start()   # start thread
-            asyncio.ensure_future(self.reader.run())
+            capture = CaptureWriter(self.capture_path, self.serverVersion()) if self.capture_path else None
+            if self.decode_thread:
+                self._start_decoder_thread(capture)
+            else:
+                # self.reader = reader.EReader(self.conn, self.msg_queue)
+                self.reader = EReader(self.conn, self.msg_queue)
+                self.reader.capture = capture
+                self.reader.metrics = self.metrics
+                # self.reader.start()   # start thread
+                asyncio.ensure_future(self._a_read())
             logger.info("sent startApi")
             await self.startApi()
             self.wrapper.connectAck()
@@ -171,51 +257,166 @@ class AsyncRxClient(EClient):
             logger.info("could not connect")
             await self.disconnect()
 
+    async def _a_read(self):
+        """Runs the reader. A connection closed by TWS ends in disconnect(),
+        and connectionClosed(), as one closed by the client does."""
+        reader = self.reader
+        await reader.run()
+        if self.reader is reader and self.isConnected():
+            logger.warning("connection closed by TWS")
+            await self.disconnect()
+
+    def _start_decoder_thread(self, capture: Optional[CaptureWriter]):
+        # Nothing was sent after the handshake yet, so the stream buffer is empty
+        transport = self.conn.writer.transport
+        transport.pause_reading()
+        sock = transport.get_extra_info('socket')
+        dup = socket.fromfd(sock.fileno(), sock.family, sock.type)
+        dup.setblocking(False)
+        # The decoder gets a CallRecorder, the calls go to the wrapper (or its TimedWrapper) in _dispatch
+        self._dispatch_wrapper = self.decoder.wrapper
+        self.decoder_thread = DecodeThread(dup, self.decoder, self._dispatch, self._decoder_thread_closed,
+                                           asyncio.get_running_loop(), self.read_size, self.fast_decode, capture,
+                                           metrics=self.metrics, time_budget=self.batch_time_budget)
+        self.decoder_thread.start()
+
+    def _dispatch(self, recv_ns: int, batch):
+        """Runs the wrapper calls decoded by the DecodeThread, one batch per read"""
+        self.recv_ns = recv_ns
+        wrapper = self._dispatch_wrapper
+        for name, args in batch:
+            try:
+                getattr(wrapper, name)(*args)
+            except Exception:
+                logger.exception("%s raised", name)
+        self.msgLoopRec()
+
+    def _decoder_thread_closed(self):
+        if self.decoder_thread is not None and self.isConnected():
+            logger.warning("connection closed by TWS")
+            asyncio.ensure_future(self.disconnect())
+
     async def disconnect(self):
         """Call this function to terminate the connections with TWS.
         Calling this function does not cancel orders that have already been
         sent."""
 
         self.setConnState(EClient.DISCONNECTED)
+        if self.reader is not None and self.reader.capture is not None:
+            self.reader.capture.close()
+        thread = self.decoder_thread
+        self.decoder_thread = None
         if self.conn is not None:
             logger.info("disconnecting")
             await self.conn.disconnect()
+            if thread is not None:
+                thread.stop()
+                await asyncio.get_running_loop().run_in_executor(None, thread.join)
+                if thread.capture is not None:
+                    thread.capture.close()
             self.wrapper.connectionClosed()
             self.reset()
+        self._disconnected.set()
+
+    async def a_replay(self, path: str, realtime: bool = False, speed: float = 1.0):
+        """Feed a capture file recorded with capture_path through the reader,
+        run() and the decoder, as if the frames came from TWS. Frames are
+        replayed as fast as possible or, if realtime, at their original pacing
+        scaled by speed. Returns once every frame has been decoded."""
+
+        self.conn = ReplayConnection(path, self.read_size, realtime, speed)
+        self.serverVersion_ = self.conn.server_version
+        decoder_class = FastDecoder if self.fast_decode else decoder.Decoder
+        self.decoder = decoder_class(self.wrapper, self.serverVersion())
+        self.decoder.tick_sinks = self.tick_sinks
+        if self.metrics is not None:
+            self._instrument(self.metrics)
+        self.setConnState(EClient.CONNECTED)
+        self.reader = EReader(self.conn, self.msg_queue)
+        self.reader.metrics = self.metrics
+        run_task = asyncio.ensure_future(self.run())
+        try:
+            await self.reader.run()
+            while not self.msg_queue.empty():
+                await asyncio.sleep(0)
+        finally:
+            run_task.cancel()
+            await self.disconnect()
 
     async def run(self):
-        """This is the function that has the message loop."""
+        """This is the function that has the message loop.
+
+        Every wake-up drains the messages already queued by the reader and
+        decodes them in one pass. It yields back to the event loop after
+        batch_size messages or batch_time_budget seconds, whichever comes
+        first, so other coroutines are not starved during a burst."""
         # TODO: How to handle CancelledError ?
+        msg_queue = self.msg_queue
         while True:
             try:
-                while True:  # self.isConnected() or not self.msg_queue.empty():
-                    try:
-                        try:
-                            text = await self.msg_queue.get()  # block=True, timeout=0.2)
-                            if len(text) > MAX_MSG_LEN:
-                                self.wrapper.error(NO_VALID_ID, BAD_LENGTH.code(),
-                                                   "%s:%d:%s" % (BAD_LENGTH.msg(), len(text), text))
-                                break
-                        except QueueEmpty:
-                            # except queue.Empty:
-                            logger.debug("queue.get: empty")
-                            self.msgLoopTmo()
-                        else:
-                            fields = comm.read_fields(text)
-                            logger.debug("fields %s", fields)
-                            self.decoder.interpret(fields)
-                            self.msgLoopRec()
-                    except (KeyboardInterrupt, SystemExit):
-                        logger.info("detected KeyboardInterrupt, SystemExit")
-                        self.keyboardInterrupt()
-                        self.keyboardInterruptHard()
-                    except BadMessage:
-                        logger.info("BadMessage")
-
-                    logger.debug("conn:%d queue.sz:%d",
-                                 self.isConnected(),
-                                 self.msg_queue.qsize())
+                self.recv_ns, text = await msg_queue.get()  # block=True, timeout=0.2)
+                batch_size = self.batch_size
+                deadline = time.perf_counter() + self.batch_time_budget
+                process_msg = self._process_msg if self.metrics is None else self._process_msg_timed
+                n = 0
+                while True:
+                    process_msg(text)
+                    n += 1
+                    if msg_queue.empty():
+                        break
+                    if n >= batch_size or time.perf_counter() >= deadline:
+                        # Queue still has messages: yield explicitly, get() would not
+                        await asyncio.sleep(0)
+                        break
+                    self.recv_ns, text = msg_queue.get_nowait()
+                await self.a_wait_for_consumer()
+
+                logger.debug("conn:%d batch:%d queue.sz:%d",
+                             self.isConnected(), n,
+                             msg_queue.qsize())
             except asyncio.CancelledError as e:
                 break
             # finally:
             #    await self.disconnect()
+
+    async def a_wait_for_consumer(self):
+        """Called by run() after every batch, override to pause decoding
+        while the consumer of the events is behind."""
+        pass
+
+    def _instrument(self, metrics: Metrics):
+        """Installs the metrics hooks on connect, see aib.metrics"""
+        self.decoder.wrapper = TimedWrapper(self.wrapper, metrics)
+        msg_queue = self.msg_queue
+        msg_queue.instrument(metrics.histogram('msg_queue.dwell'))
+        metrics.gauge('msg_queue.depth', msg_queue.qsize)
+        metrics.gauge('msg_queue.dropped', lambda: msg_queue.dropped)
+        metrics.gauge('msg_queue.conflated', lambda: msg_queue.conflated)
+
+    def _process_msg_timed(self, text):
+        histogram = self.metrics.decode_histogram(text)
+        timed = self.decoder.wrapper
+        timed.callback_ns = 0
+        t0 = time.perf_counter_ns()
+        self._process_msg(text)
+        histogram.record(time.perf_counter_ns() - t0 - timed.callback_ns)
+
+    def _process_msg(self, text):
+        try:
+            if len(text) > MAX_MSG_LEN:
+                self.wrapper.error(NO_VALID_ID, BAD_LENGTH.code(),
+                                   "%s:%d:%s" % (BAD_LENGTH.msg(), len(text), text))
+                return
+            if self.fast_decode:
+                self.decoder.interpret_msg(text)
+            else:
+                fields = comm.read_fields(text)
+                logger.debug("fields %s", fields)
+                self.decoder.interpret(fields)
+            self.msgLoopRec()
+        except (KeyboardInterrupt, SystemExit):
+            logger.info("detected KeyboardInterrupt, SystemExit")
+            self.keyboardInterrupt()
+            self.keyboardInterruptHard()
+        except BadMessage:
+            logger.info("BadMessage")
@@ -16,6 +16,8 @@ from typing import Optional
 from asyncio import StreamReader, StreamWriter
 from asyncio import open_connection as open_socket_connection
 
+from aib.pacing import SendPipeline
+
 
 #TODO: support SSL !!
 
@@ -23,9 +25,17 @@ logger = logging.getLogger(__name__)
 
 
 class Connection:
-    def __init__(self, host, port):
+    def __init__(self, host, port, read_size: int = 4096, send_rate: Optional[float] = 40.0, send_burst: int = 10,
+                 connect_timeout: Optional[float] = None):
         self.host = host
         self.port = port
+        self.read_size = read_size
+        # Seconds to open the socket, TimeoutError after that
+        self.connect_timeout = connect_timeout
+        # Pacing of sendMsg, messages are written as they come when send_rate is None
+        self.send_rate = send_rate
+        self.send_burst = send_burst
+        self.pipeline: Optional[SendPipeline] = None
         self.socket = None
         self.wrapper = None
         """
@@ -35,16 +45,24 @@ class Connection:
         self.writer: Optional[StreamWriter] = None
 
     async def a_connect(self):
-        # TODO: Add error handling + timeout
-        self.reader, self.writer = await open_socket_connection(self.host, self.port)
+        # OSError (TimeoutError included) is handled by AsyncRxClient.connect()
+        self.reader, self.writer = await asyncio.wait_for(open_socket_connection(self.host, self.port),
+                                                          self.connect_timeout)
+        if self.send_rate is not None:
+            self.pipeline = SendPipeline(self.writer, self.send_rate, self.send_burst)
+            self.pipeline.start()
 
     async def a_recv_msg(self):
         try:
-            reader = await self.reader.read(4096)
+            reader = await self.reader.read(self.read_size)
             return reader
+        except OSError as e:
+            # Reset by the peer, as EOF: the client disconnects
+            logger.warning("connection error: %s", e)
+            return b""
         except asyncio.CancelledError:
-            self.writer.close()
-            await self.writer.wait_closed()
+            if self.writer is not None:
+                await self.a_disconnect()
 
     async def a_send_msg(self, msg):
         try:
@@ -58,8 +76,20 @@ class Connection:
             return -1
 
     async def a_disconnect(self):
+        writer = self.writer
+        if writer is None:
+            return
+        if self.pipeline is not None:
+            if len(self.pipeline):
+                logger.warning("disconnecting with %d messages not sent", len(self.pipeline))
+            await self.pipeline.stop()
         self.disconnect_nb()
-        await self.writer.wait_closed()
+        self.writer = None
+        try:
+            await writer.wait_closed()
+        except OSError:
+            # Already reset by the peer
+            pass
 
     def disconnect_nb(self):
         self.writer.close()
@@ -78,7 +108,10 @@ class Connection:
         if not self.isConnected():
             logger.debug("sendMsg attempted while not connected, releasing lock")
             return None
-        self.writer.write(msg)
+        if self.pipeline is not None:
+            self.pipeline.put(msg)
+        else:
+            self.writer.write(msg)
         return None
 
     async def recvMsg(self):
@@ -0,0 +1,240 @@
+"""
+Process-wide registry of contracts and contract details.
+
+Contracts are interned by conId: the events decoded by IB and ConvenientIB
+share one Contract instance per conId, which only holds the fields that
+identify the contract (symbol, expiry, currency...), filled in from every
+copy seen so far. Fields that belong to an event, e.g. the exchange of an
+execution or the combo legs of an order, are never merged into it: a
+contract that sets any of them keeps its own instance, with the identity
+fields it lacks filled in.
+
+Contract details answered by TWS are kept with the query that returned them,
+so repeated reqContractDetails for the same contract are answered locally
+until the details are max_age seconds old, trading hours and the like change.
+The registry is bounded (least recently used conIds and queries are evicted)
+and can be saved to and loaded from a pickle file between runs.
+"""
+
+
+import os
+import time
+import pickle
+import logging
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from ibapi.contract import Contract, ContractDetails
+
+logger = logging.getLogger(__name__)
+
+_QUERY_FIELDS = ('conId', 'symbol', 'secType', 'lastTradeDateOrContractMonth', 'strike', 'right', 'multiplier',
+                 'exchange', 'primaryExchange', 'currency', 'localSymbol', 'tradingClass', 'includeExpired',
+                 'secIdType', 'secId')
+
+
+def query_key(contract: Contract) -> tuple:
+    """ The fields of a contract that reqContractDetails matches on """
+    return tuple(getattr(contract, name) for name in _QUERY_FIELDS)
+
+
+# The fields that identify a contract, the others belong to the event the contract came with
+_IDENTITY_FIELDS = ('conId', 'symbol', 'secType', 'lastTradeDateOrContractMonth', 'strike', 'right', 'multiplier',
+                    'primaryExchange', 'currency', 'localSymbol', 'tradingClass', 'secIdType', 'secId',
+                    'description', 'issuerId')
+_IDENTITY = frozenset(_IDENTITY_FIELDS)
+
+
+def _identity(contract: Contract) -> Contract:
+    shared = Contract()
+    for name in _IDENTITY_FIELDS:
+        setattr(shared, name, getattr(contract, name))
+    return shared
+
+
+def _is_identity(contract: Contract) -> bool:
+    """ True when the contract sets no field of an event """
+    return all(not value or name in _IDENTITY for name, value in vars(contract).items())
+
+
+def _merge(into: Contract, contract: Contract) -> bool:
+    """ Fill in the identity fields into lacks, False if the two disagree on one """
+    agree = True
+    for name in _IDENTITY_FIELDS:
+        value = getattr(contract, name)
+        if value:
+            current = getattr(into, name)
+            if not current:
+                setattr(into, name, value)
+            elif current != value:
+                agree = False
+    return agree
+
+
+class _Entry:
+    __slots__ = ('contract', 'details', 'time')
+
+    def __init__(self, contract: Contract, details: Optional[ContractDetails] = None, time_: float = 0.0):
+        self.contract = contract
+        self.details = details
+        # time.time() the details were answered at
+        self.time = time_
+
+
+class ContractRegistry:
+    def __init__(self, capacity: int = 10000, path: Optional[str] = None, max_age: Optional[float] = 86400.0):
+        """ Contract details older than max_age seconds are requested again, None keeps them """
+        self.capacity = capacity
+        # Saved to and loaded from this pickle file when set
+        self.path = path
+        self.max_age = max_age
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        # conIds by (symbol, secType)
+        self._by_symbol: Dict[Tuple[str, str], Set[int]] = {}
+        # conIds answered by reqContractDetails, by query_key, bounded by capacity as well
+        self._queries: OrderedDict[tuple, List[int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, conId: int) -> bool:
+        return conId in self._entries
+
+    ####################################################################################################################
+
+    def intern(self, contract: Contract) -> Contract:
+        """ The shared instance of the contract's conId, or the contract itself with the identity fields it lacks
+        filled in when it sets fields of its event or disagrees with the shared instance. Contracts without conId
+        and combos are returned as is. """
+        conId = contract.conId
+        if not conId or contract.secType == 'BAG':
+            return contract
+        entry = self._entries.get(conId)
+        if entry is None:
+            # A copy, the caller keeps its contract to itself
+            entry = _Entry(_identity(contract))
+            self._add(entry)
+        else:
+            self._entries.move_to_end(conId)
+        shared = entry.contract
+        if shared is contract:
+            return contract
+        if _merge(shared, contract) and _is_identity(contract):
+            return shared
+        _merge(contract, shared)
+        return contract
+
+    def add_details(self, details: ContractDetails, time_: Optional[float] = None) -> ContractDetails:
+        details.contract = self.intern(details.contract)
+        entry = self._entries.get(details.contract.conId)
+        if entry is not None:
+            entry.details = details
+            entry.time = time.time() if time_ is None else time_
+        return details
+
+    def add_query(self, contract: Contract, details: List[ContractDetails]):
+        for d in details:
+            self.add_details(d)
+        key = query_key(contract)
+        self._queries[key] = [d.contract.conId for d in details]
+        self._queries.move_to_end(key)
+        while len(self._queries) > self.capacity:
+            self._queries.popitem(last=False)
+
+    def query(self, contract: Contract) -> Optional[List[ContractDetails]]:
+        """ Cached answer of reqContractDetails for the contract, None if it has to be requested """
+        details = self.details(contract.conId) if contract.conId else None
+        # The details of a conId are those of the exchange they were requested for
+        if details is not None and contract.exchange in ('', details.contract.exchange):
+            self.hits += 1
+            return [details]
+        key = query_key(contract)
+        conIds = self._queries.get(key)
+        if conIds is not None:
+            details = [self.details(conId) for conId in conIds]
+            if all(d is not None for d in details):
+                self._queries.move_to_end(key)
+                self.hits += 1
+                return details
+        self.misses += 1
+        return None
+
+    def get(self, conId: int) -> Optional[Contract]:
+        entry = self._entries.get(conId)
+        return None if entry is None else entry.contract
+
+    def details(self, conId: int) -> Optional[ContractDetails]:
+        """ The contract details of the conId, None if unknown or older than max_age """
+        entry = self._entries.get(conId)
+        if entry is None or entry.details is None:
+            return None
+        if self.max_age is not None and time.time() - entry.time > self.max_age:
+            return None
+        return entry.details
+
+    def lookup(self, symbol: str, secType: str, exchange: str = '', expiry: str = '') -> List[Contract]:
+        """ Contracts by symbol and secType, optionally by exchange (also primary or valid exchanges)
+        and expiry (yyyymm or yyyymmdd) """
+        found = []
+        for conId in self._by_symbol.get((symbol, secType), ()):
+            entry = self._entries[conId]
+            c = entry.contract
+            if expiry and not c.lastTradeDateOrContractMonth.startswith(expiry):
+                continue
+            if exchange and exchange not in (c.exchange, c.primaryExchange) and \
+                    (entry.details is None or (exchange != entry.details.contract.exchange and
+                                               exchange not in entry.details.validExchanges.split(','))):
+                continue
+            found.append(c)
+        return found
+
+    ####################################################################################################################
+
+    def _add(self, entry: _Entry):
+        c = entry.contract
+        self._entries[c.conId] = entry
+        self._by_symbol.setdefault((c.symbol, c.secType), set()).add(c.conId)
+        while len(self._entries) > self.capacity:
+            conId, evicted = self._entries.popitem(last=False)
+            key = (evicted.contract.symbol, evicted.contract.secType)
+            conIds = self._by_symbol.get(key)
+            if conIds is not None:
+                conIds.discard(conId)
+                if not conIds:
+                    del self._by_symbol[key]
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        state = ([(e.contract, e.details, e.time) for e in self._entries.values()], self._queries)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def load(self, path: Optional[str] = None):
+        path = path or self.path
+        try:
+            with open(path, 'rb') as f:
+                entries, queries = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            logger.warning('could not load contracts from %s: %s', path, e)
+            return
+        for contract, details, time_ in entries:
+            # Details keep the time they were answered at, so they expire as if never saved
+            if details is not None:
+                self.add_details(details, time_)
+            else:
+                self.intern(contract)
+        for key, conIds in queries.items():
+            self._queries[key] = conIds
+        while len(self._queries) > self.capacity:
+            self._queries.popitem(last=False)
+
+
+# Shared by all the clients of the process unless they are given their own
+registry = ContractRegistry()
@@ -0,0 +1,283 @@
+"""
+Fast path decoding of the high rate market data messages.
+
+The stock ibapi Decoder walks every message through decode() one field at a
+time. FastDecoder splits the raw frame once and parses the fields of the hot
+message types straight from bytes, then calls the same wrapper methods with
+the same arguments as the stock decoder. Every other message, and any hot
+message that fails to parse, goes through the stock decoder. A handler only
+parses and returns the call to make, which is made once the whole message has
+parsed, so an exception of a callback is never taken for a parse error.
+
+Tick-by-tick messages of a reqId registered in tick_sinks skip the wrapper
+and are handed to the TickSink as plain numbers.
+"""
+
+
+import logging
+
+from typing import Callable, Dict, List, Optional, Tuple
+from ibapi.decoder import Decoder
+from ibapi.message import IN
+from ibapi.ticktype import TickTypeEnum
+from ibapi.common import UNSET_DECIMAL, TickAttrib, TickAttribBidAsk, TickAttribLast
+from ibapi.server_versions import MIN_SERVER_VER_PAST_LIMIT, MIN_SERVER_VER_PRE_OPEN_BID_ASK, \
+                                  MIN_SERVER_VER_SMART_DEPTH
+from ibapi.utils import Decimal
+from math import nan
+
+logger = logging.getLogger(__name__)
+
+_UNSET_DECIMAL_FIELDS = frozenset([b"", b"2147483647", b"9223372036854775807", b"1.7976931348623157E308"])
+
+_SIZE_TICK_TYPE = {
+    TickTypeEnum.BID: TickTypeEnum.BID_SIZE,
+    TickTypeEnum.ASK: TickTypeEnum.ASK_SIZE,
+    TickTypeEnum.LAST: TickTypeEnum.LAST_SIZE,
+    TickTypeEnum.DELAYED_BID: TickTypeEnum.DELAYED_BID_SIZE,
+    TickTypeEnum.DELAYED_ASK: TickTypeEnum.DELAYED_ASK_SIZE,
+    TickTypeEnum.DELAYED_LAST: TickTypeEnum.DELAYED_LAST_SIZE,
+}
+
+# Sizes repeat a lot in a stream, Decimal is immutable so instances can be shared. The tick attribute objects
+# are mutable and every event gets its own.
+_DECIMAL_CACHE_SIZE = 4096
+
+
+def _float_size(s: bytes) -> float:
+    return nan if s in _UNSET_DECIMAL_FIELDS else float(s)
+
+
+# The callback of a parsed message and its arguments
+Call = Optional[Tuple[Callable, tuple]]
+
+
+class TickSink:
+    """
+    Receives the tick-by-tick data of a reqId without any per tick objects.
+    Sizes are floats, nan when unset, and mask is the attribute bit mask.
+    """
+
+    # Why the stream ended, see fail()
+    error: Optional[BaseException] = None
+
+    def on_bid_ask(self, time: int, bidPrice: float, askPrice: float,
+                   bidSize: float, askSize: float, mask: int):
+        pass
+
+    def on_last(self, tickType: int, time: int, price: float, size: float, mask: int,
+                exchange: str, specialConditions: str):
+        pass
+
+    def on_mid_point(self, time: int, midPoint: float):
+        pass
+
+    def fail(self, exc: BaseException):
+        """ The stream ended: TWS rejected the request (RequestError) or the connection closed """
+        self.error = exc
+
+
+def _check_len(fields: List[bytes], n: int):
+    # split() leaves an empty field after the last terminator
+    if len(fields) <= n:
+        raise IndexError("no more fields")
+
+
+class FastDecoder(Decoder):
+    def __init__(self, wrapper, serverVersion):
+        Decoder.__init__(self, wrapper, serverVersion)
+        self._decimals: Dict[bytes, Decimal] = {}
+        self.tick_sinks: Dict[int, TickSink] = {}
+        self.fast_handlers: Dict[bytes, Callable[[List[bytes]], Call]] = {
+            str(IN.TICK_PRICE).encode(): self._tick_price,
+            str(IN.TICK_SIZE).encode(): self._tick_size,
+            str(IN.MARKET_DEPTH).encode(): self._market_depth,
+            str(IN.MARKET_DEPTH_L2).encode(): self._market_depth_l2,
+            str(IN.REAL_TIME_BARS).encode(): self._real_time_bar,
+            str(IN.TICK_BY_TICK).encode(): self._tick_by_tick,
+        }
+
+    def interpret_msg(self, text: bytes):
+        """ Decode a message payload, the frame without its size prefix """
+        fields = text.split(b"\0")
+        handler = self.fast_handlers.get(fields[0])
+        if handler is not None:
+            try:
+                call = handler(fields)
+            except (IndexError, ValueError, ArithmeticError):
+                # Let the stock decoder report it
+                logger.debug("fast path failed for %s", fields)
+            else:
+                if call is not None:
+                    call[0](*call[1])
+                return
+        self.interpret(tuple(fields[:-1]))
+
+    def _decimal(self, s: bytes) -> Decimal:
+        d = self._decimals.get(s)
+        if d is None:
+            if s in _UNSET_DECIMAL_FIELDS:
+                return UNSET_DECIMAL
+            d = Decimal(s.decode())
+            if len(self._decimals) >= _DECIMAL_CACHE_SIZE:
+                self._decimals.clear()
+            self._decimals[s] = d
+        return d
+
+    def _tick_attrib(self, attrMask: int) -> TickAttrib:
+        attrib = TickAttrib()
+        attrib.canAutoExecute = attrMask == 1
+        if self.serverVersion >= MIN_SERVER_VER_PAST_LIMIT:
+            attrib.canAutoExecute = attrMask & 1 != 0
+            attrib.pastLimit = attrMask & 2 != 0
+            if self.serverVersion >= MIN_SERVER_VER_PRE_OPEN_BID_ASK:
+                attrib.preOpen = attrMask & 4 != 0
+        return attrib
+
+    @staticmethod
+    def _bid_ask_attrib(mask: int) -> TickAttribBidAsk:
+        attrib = TickAttribBidAsk()
+        attrib.bidPastLow = mask & 1 != 0
+        attrib.askPastHigh = mask & 2 != 0
+        return attrib
+
+    @staticmethod
+    def _last_attrib(mask: int) -> TickAttribLast:
+        attrib = TickAttribLast()
+        attrib.pastLimit = mask & 1 != 0
+        attrib.unreported = mask & 2 != 0
+        return attrib
+
+    ####################################################################################################################
+
+    def _tick_price(self, fields: List[bytes]) -> Call:
+        # msgId, version, reqId, tickType, price, size, attrMask
+        _check_len(fields, 7)
+        reqId = int(fields[2] or 0)
+        tickType = int(fields[3] or 0)
+        price = float(fields[4] or 0)
+        size = self._decimal(fields[5])
+        attrib = self._tick_attrib(int(fields[6] or 0))
+
+        sizeTickType = _SIZE_TICK_TYPE.get(tickType)
+        if sizeTickType is None:
+            return self.wrapper.tickPrice, (reqId, tickType, price, attrib)
+        return self._tick_price_size, (reqId, tickType, price, attrib, sizeTickType, size)
+
+    def _tick_price_size(self, reqId: int, tickType: int, price: float, attrib: TickAttrib,
+                         sizeTickType: int, size: Decimal):
+        self.wrapper.tickPrice(reqId, tickType, price, attrib)
+        self.wrapper.tickSize(reqId, sizeTickType, size)
+
+    def _tick_size(self, fields: List[bytes]) -> Call:
+        # msgId, version, reqId, tickType, size
+        _check_len(fields, 5)
+        reqId = int(fields[2] or 0)
+        sizeTickType = int(fields[3] or 0)
+        size = self._decimal(fields[4])
+
+        if sizeTickType != TickTypeEnum.NOT_SET:
+            return self.wrapper.tickSize, (reqId, sizeTickType, size)
+        return None
+
+    def _market_depth(self, fields: List[bytes]) -> Call:
+        # msgId, version, reqId, position, operation, side, price, size
+        _check_len(fields, 8)
+        reqId = int(fields[2] or 0)
+        position = int(fields[3] or 0)
+        operation = int(fields[4] or 0)
+        side = int(fields[5] or 0)
+        price = float(fields[6] or 0)
+        size = self._decimal(fields[7])
+
+        return self.wrapper.updateMktDepth, (reqId, position, operation, side, price, size)
+
+    def _market_depth_l2(self, fields: List[bytes]) -> Call:
+        # msgId, version, reqId, position, marketMaker, operation, side, price, size[, isSmartDepth]
+        _check_len(fields, 9)
+        reqId = int(fields[2] or 0)
+        position = int(fields[3] or 0)
+        marketMaker = fields[4].decode(errors='backslashreplace')
+        operation = int(fields[5] or 0)
+        side = int(fields[6] or 0)
+        price = float(fields[7] or 0)
+        size = self._decimal(fields[8])
+        isSmartDepth = False
+        if self.serverVersion >= MIN_SERVER_VER_SMART_DEPTH:
+            _check_len(fields, 10)
+            isSmartDepth = int(fields[9] or 0) != 0
+
+        return self.wrapper.updateMktDepthL2, (reqId, position, marketMaker,
+                                               operation, side, price, size, isSmartDepth)
+
+    def _real_time_bar(self, fields: List[bytes]) -> Call:
+        # msgId, version, reqId, time, open, high, low, close, volume, wap, count
+        _check_len(fields, 11)
+        reqId = int(fields[2] or 0)
+        time = int(fields[3] or 0)
+        open_ = float(fields[4] or 0)
+        high = float(fields[5] or 0)
+        low = float(fields[6] or 0)
+        close = float(fields[7] or 0)
+        volume = self._decimal(fields[8])
+        wap = self._decimal(fields[9])
+        count = int(fields[10] or 0)
+
+        return self.wrapper.realtimeBar, (reqId, time, open_, high, low, close, volume, wap, count)
+
+    def _tick_by_tick(self, fields: List[bytes]) -> Call:
+        # msgId, reqId, tickType, time, ...
+        _check_len(fields, 4)
+        reqId = int(fields[1] or 0)
+        tickType = int(fields[2] or 0)
+        time = int(fields[3] or 0)
+
+        sink = self.tick_sinks.get(reqId)
+        if sink is not None:
+            return self._tick_by_tick_sink(sink, fields, tickType, time)
+
+        if tickType == 3:
+            # BidAsk: bidPrice, askPrice, bidSize, askSize, mask
+            _check_len(fields, 9)
+            bidPrice = float(fields[4] or 0)
+            askPrice = float(fields[5] or 0)
+            bidSize = self._decimal(fields[6])
+            askSize = self._decimal(fields[7])
+            tickAttribBidAsk = self._bid_ask_attrib(int(fields[8] or 0))
+
+            return self.wrapper.tickByTickBidAsk, (reqId, time, bidPrice, askPrice, bidSize,
+                                                   askSize, tickAttribBidAsk)
+        elif tickType == 4:
+            # MidPoint: midPoint
+            _check_len(fields, 5)
+            midPoint = float(fields[4] or 0)
+
+            return self.wrapper.tickByTickMidPoint, (reqId, time, midPoint)
+        elif tickType == 1 or tickType == 2:
+            # Last or AllLast: price, size, mask, exchange, specialConditions
+            _check_len(fields, 9)
+            price = float(fields[4] or 0)
+            size = self._decimal(fields[5])
+            tickAttribLast = self._last_attrib(int(fields[6] or 0))
+            exchange = fields[7].decode(errors='backslashreplace')
+            specialConditions = fields[8].decode(errors='backslashreplace')
+
+            return self.wrapper.tickByTickAllLast, (reqId, tickType, time, price, size, tickAttribLast,
+                                                    exchange, specialConditions)
+        return None
+
+    @staticmethod
+    def _tick_by_tick_sink(sink: TickSink, fields: List[bytes], tickType: int, time: int) -> Call:
+        if tickType == 3:
+            _check_len(fields, 9)
+            return sink.on_bid_ask, (time, float(fields[4] or 0), float(fields[5] or 0),
+                                     _float_size(fields[6]), _float_size(fields[7]), int(fields[8] or 0))
+        if tickType == 4:
+            _check_len(fields, 5)
+            return sink.on_mid_point, (time, float(fields[4] or 0))
+        if tickType == 1 or tickType == 2:
+            _check_len(fields, 9)
+            return sink.on_last, (tickType, time, float(fields[4] or 0), _float_size(fields[5]), int(fields[6] or 0),
+                                  fields[7].decode(errors='backslashreplace'),
+                                  fields[8].decode(errors='backslashreplace'))
+        return None
@@ -0,0 +1,104 @@
+"""
+Precompiled placeOrder messages for the order entry fast path, see IB.order_template().
+
+EClient.placeOrder checks the server version and builds the message from
+about a hundred make_field() strings on every call. An OrderTemplate runs it
+once with sentinel values for the orderId, totalQuantity, lmtPrice and
+auxPrice of a prototype order and keeps the message as a bytes format with
+%b in place of those fields. encode() then only formats the four numbers,
+and the bytes are the ones placeOrder would send for an order that differs
+from the prototype in these fields only.
+
+A template is bound to the server version it was built with, and its order
+fields other than the four are those of the prototype.
+"""
+
+
+from decimal import Decimal
+from struct import Struct
+from typing import Optional
+
+from ibapi.common import UNSET_DOUBLE
+from ibapi.contract import Contract
+from ibapi.order import Order
+from ibapi.server_versions import MIN_SERVER_VER_FRACTIONAL_POSITIONS
+
+_size_prefix = Struct("!I")
+
+# Field values no real order sends, each must appear exactly once in the message
+_ORDER_ID = 987654321
+_QUANTITY = Decimal(876543)
+_LMT_PRICE = 98765.4321
+_AUX_PRICE = 87654.3219
+
+
+class OrderTemplate:
+    __slots__ = ('contract', 'order', 'server_version', 'has_lmt_price', 'has_aux_price', '_format', '_fractional')
+
+    def __init__(self, client, contract: Contract, order: Order):
+        """ Built with the placeOrder of client, which must be connected """
+        self.contract = contract
+        self.order = order
+        self.server_version = client.serverVersion()
+        self.has_lmt_price = order.lmtPrice != UNSET_DOUBLE
+        self.has_aux_price = order.auxPrice != UNSET_DOUBLE
+        self._fractional = self.server_version >= MIN_SERVER_VER_FRACTIONAL_POSITIONS
+        msg = self._capture(client, contract, order)
+        fields = msg.split('\0')
+        slots = [str(_ORDER_ID), str(_QUANTITY)]
+        if self.has_lmt_price:
+            slots.append(str(_LMT_PRICE))
+        if self.has_aux_price:
+            slots.append(str(_AUX_PRICE))
+        for value in slots:
+            if fields.count(value) != 1:
+                raise ValueError(f'Cannot make a template of the order, field {value} found {fields.count(value)} times')
+        fields = [f.replace('%', '%%') for f in fields]
+        for value in slots:
+            fields[fields.index(value)] = '%b'
+        self._format = '\0'.join(fields).encode()
+
+    @staticmethod
+    def _capture(client, contract: Contract, order: Order) -> str:
+        prototype = Order()
+        prototype.__dict__.update(order.__dict__)
+        prototype.totalQuantity = _QUANTITY
+        if prototype.lmtPrice != UNSET_DOUBLE:
+            prototype.lmtPrice = _LMT_PRICE
+        if prototype.auxPrice != UNSET_DOUBLE:
+            prototype.auxPrice = _AUX_PRICE
+        sent = []
+        # The instance attribute shadows EClient.sendMsg for the one call
+        client.sendMsg = sent.append
+        try:
+            client.placeOrder(_ORDER_ID, contract, prototype)
+        finally:
+            del client.sendMsg
+        if not sent:
+            raise ValueError('placeOrder did not send the order, see the errors of the client')
+        return sent[0]
+
+    def make_order(self, orderId: int, quantity, lmtPrice: Optional[float] = None,
+                   auxPrice: Optional[float] = None) -> Order:
+        """ Copy of the prototype with the fields encode() sends """
+        order = Order.__new__(Order)
+        order.__dict__.update(self.order.__dict__)
+        order.orderId = orderId
+        order.totalQuantity = quantity
+        if self.has_lmt_price and lmtPrice is not None:
+            order.lmtPrice = lmtPrice
+        if self.has_aux_price and auxPrice is not None:
+            order.auxPrice = auxPrice
+        return order
+
+    def encode(self, orderId: int, quantity, lmtPrice: Optional[float] = None,
+               auxPrice: Optional[float] = None) -> bytes:
+        """ The placeOrder message with its size prefix. Prices left None keep the prototype's,
+        prices the prototype leaves unset are ignored. """
+        args = [b"%d" % orderId, str(quantity).encode() if self._fractional else b"%d" % int(quantity)]
+        if self.has_lmt_price:
+            args.append(str(self.order.lmtPrice if lmtPrice is None else lmtPrice).encode())
+        if self.has_aux_price:
+            args.append(str(self.order.auxPrice if auxPrice is None else auxPrice).encode())
+        payload = self._format % tuple(args)
+        return _size_prefix.pack(len(payload)) + payload
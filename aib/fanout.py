@@ -0,0 +1,175 @@
+"""
+Sharing of streaming subscriptions between local consumers.
+
+SubscriptionManager dedupes identical subscriptions (same request type,
+contract and parameters) into one reqId, so N consumers of the same
+instrument use one market data line and receive every message once. Each
+consumer gets its own Subscription iterator, all of them receive the same
+event objects. The request is cancelled at TWS when the last consumer
+cancels its Subscription.
+
+A consumer that joins a running subscription first receives the last value
+of every tick type seen so far, since TWS sends the current quote only when
+the request is made. The values are forgotten when the request is sent again
+after a reconnect. Market depth is not shared: its updates are incremental
+and a late consumer could not rebuild the book from them.
+"""
+
+
+import logging
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, List, Optional
+
+from ibapi.contract import Contract
+
+from aib.contracts import query_key
+from aib.objects import Error, Snap, MidPoint, TickPrice, TickSize, TickString, TickGeneric, \
+                        TickOptionComputation, PnL, PnLSingle
+from aib.routing import Route, Subscription
+
+if TYPE_CHECKING:
+    from aib.aibrx import IB
+
+logger = logging.getLogger(__name__)
+
+_BY_TYPE = frozenset([Snap, MidPoint, PnL, PnLSingle])
+_BY_TICK_TYPE = frozenset([TickPrice, TickSize, TickString, TickGeneric, TickOptionComputation])
+
+
+class FanOut(Route):
+    """Route of a shared subscription, puts every event to all its subscribers"""
+
+    def __init__(self, key: Hashable, req_id: int, on_done: Callable[['FanOut'], None]):
+        self.key = key
+        self.req_id = req_id
+        self.subscribers: List[Subscription] = []
+        self.done = False
+        self._on_done = on_done
+        # Last event by type and tick type, replayed to late subscribers
+        self._last: Dict[Hashable, Any] = {}
+
+    def put(self, event: Any):
+        t = type(event)
+        if t in _BY_TICK_TYPE:
+            self._last[t, event.tickType] = event
+        elif t in _BY_TYPE:
+            self._last[t] = event
+        for subscription in self.subscribers:
+            subscription.put(event)
+
+    def warn(self, error: Error):
+        for subscription in self.subscribers:
+            subscription.warn(error)
+
+    def end(self):
+        self._finish()
+        for subscription in self.subscribers:
+            subscription.end()
+
+    def fail(self, exc: BaseException):
+        self._finish()
+        for subscription in self.subscribers:
+            subscription.fail(exc)
+
+    def _finish(self):
+        if not self.done:
+            self.done = True
+            self._on_done(self)
+
+    def resume(self, req_id: int):
+        self.req_id = req_id
+        # Quotes from before the reconnect are stale, TWS sends the current ones again
+        self._last.clear()
+        for subscription in self.subscribers:
+            subscription.resume(req_id)
+
+    def join(self, subscription: Subscription):
+        for event in self._last.values():
+            subscription.put(event)
+        self.subscribers.append(subscription)
+
+
+def _options_key(options: Optional[list]) -> tuple:
+    # TagValue is not hashable
+    return tuple((option.tag, option.value) for option in options or ())
+
+
+class SubscriptionManager:
+    def __init__(self, ib: 'IB'):
+        self.ib = ib
+        self._shared: Dict[Hashable, FanOut] = {}
+
+    def __len__(self) -> int:
+        """ Number of requests open at TWS """
+        return len(self._shared)
+
+    def subscribers(self, subscription: Subscription) -> int:
+        """ Number of local consumers sharing the request of the subscription """
+        for fan in self._shared.values():
+            if fan.req_id == subscription.req_id:
+                return len(fan.subscribers)
+        return 0
+
+    def _subscribe(self, key: Hashable, request: Callable[[int], None], cancel: Callable[[int], None]) -> Subscription:
+        fan = self._shared.get(key)
+        if fan is None:
+            if not self.ib.isConnected():
+                raise ConnectionError('Not connected to TWS')
+            fan = FanOut(key, self.ib._new_req_id(), self._done)
+            self._shared[key] = fan
+            self.ib._routes[fan.req_id] = fan
+            self.ib._streams[fan] = request
+            request(fan.req_id)
+        subscription = Subscription(fan.req_id, cancel=lambda req_id: self._leave(fan, subscription, cancel))
+        fan.join(subscription)
+        return subscription
+
+    def _leave(self, fan: FanOut, subscription: Subscription, cancel: Callable[[int], None]):
+        if subscription in fan.subscribers:
+            fan.subscribers.remove(subscription)
+        if not fan.subscribers and not fan.done:
+            logger.debug('last subscriber of %s left, cancelling reqId %d', fan.key, fan.req_id)
+            fan.done = True
+            self._done(fan)
+            self.ib._cancel_route(fan.req_id, cancel, fan)
+
+    def _done(self, fan: FanOut):
+        if self._shared.get(fan.key) is fan:
+            del self._shared[fan.key]
+
+    ####################################################################################################################
+
+    def subscribe_mkt_data(self, contract: Contract, genericTickList: str = '',
+                           mktDataOptions: Optional[list] = None) -> Subscription:
+        ib = self.ib
+        return self._subscribe(
+            ('mkt_data', query_key(contract), genericTickList, _options_key(mktDataOptions)),
+            lambda req_id: ib.reqMktData(req_id, contract, genericTickList, False, False, mktDataOptions or []),
+            ib.cancelMktData)
+
+    def subscribe_tick_by_tick_data(self, contract: Contract, tickType: str, ignoreSize: bool = False) -> Subscription:
+        ib = self.ib
+        return self._subscribe(
+            ('tick_by_tick', query_key(contract), tickType, ignoreSize),
+            lambda req_id: ib.reqTickByTickData(req_id, contract, tickType, 0, ignoreSize),
+            ib.cancelTickByTickData)
+
+    def subscribe_real_time_bars(self, contract: Contract, barSize: int, whatToShow: str, useRTH: bool,
+                                 realTimeBarsOptions: Optional[list] = None) -> Subscription:
+        ib = self.ib
+        return self._subscribe(
+            ('real_time_bars', query_key(contract), barSize, whatToShow, useRTH, _options_key(realTimeBarsOptions)),
+            lambda req_id: ib.reqRealTimeBars(req_id, contract, barSize, whatToShow, useRTH,
+                                              realTimeBarsOptions or []),
+            ib.cancelRealTimeBars)
+
+    def subscribe_pnl(self, account: str, modelCode: str) -> Subscription:
+        ib = self.ib
+        return self._subscribe(('pnl', account, modelCode),
+                               lambda req_id: ib.reqPnL(req_id, account, modelCode), ib.cancelPnL)
+
+    def subscribe_pnl_single(self, account: str, modelCode: str, conid: int) -> Subscription:
+        ib = self.ib
+        return self._subscribe(('pnl_single', account, modelCode, conid),
+                               lambda req_id: ib.reqPnLSingle(req_id, account, modelCode, conid),
+                               ib.cancelPnLSingle)
@@ -0,0 +1,316 @@
+"""
+Download of long ranges of historical bars and ticks.
+
+The range is split into chunks on a fixed UTC grid, each no longer than the
+longest duration TWS serves for the bar size in one request. Chunks are
+requested concurrently within the historical data pacing rules of TWS:
+- no more than 60 requests in any 10 minutes,
+- no identical request within 15 seconds,
+- no more than 5 requests for the same contract and data type within 2 seconds.
+
+Chunks that lie entirely in the past are cached on disk, one .npy file per
+(contract, barSize, whatToShow, useRTH, chunk range), so the same chunks are
+never requested twice. Results are NumPy structured arrays, or Arrow tables
+with output='arrow'.
+
+Requires numpy (pip install aib[numpy]), and pyarrow for Arrow output.
+"""
+
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Deque, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from ibapi.common import UNSET_DECIMAL
+from ibapi.contract import Contract
+
+from aib.routing import RequestError
+from aib.ticks import BID_ASK_DTYPE, LAST_DTYPE, MID_POINT_DTYPE
+
+if TYPE_CHECKING:
+    from aib.aibrx import IB
+
+logger = logging.getLogger(__name__)
+
+BAR_DTYPE = np.dtype([('time', 'i8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'), ('close', 'f8'),
+                      ('volume', 'f8'), ('wap', 'f8'), ('barCount', 'i8')])
+
+TICK_DTYPES = {'TRADES': LAST_DTYPE, 'BID_ASK': BID_ASK_DTYPE, 'MIDPOINT': MID_POINT_DTYPE}
+
+# Longest range per request by bar size, within the TWS limits on the duration
+CHUNKS = {
+    '1 secs': timedelta(minutes=30), '5 secs': timedelta(hours=1), '10 secs': timedelta(hours=4),
+    '15 secs': timedelta(hours=4), '30 secs': timedelta(hours=8), '1 min': timedelta(days=1),
+    '2 mins': timedelta(days=2), '3 mins': timedelta(weeks=1), '5 mins': timedelta(weeks=1),
+    '10 mins': timedelta(weeks=1), '15 mins': timedelta(weeks=1), '20 mins': timedelta(weeks=1),
+    '30 mins': timedelta(days=28), '1 hour': timedelta(days=28), '2 hours': timedelta(days=28),
+    '3 hours': timedelta(days=28), '4 hours': timedelta(days=28), '8 hours': timedelta(days=28),
+    '1 day': timedelta(days=364), '1 week': timedelta(days=364), '1 month': timedelta(days=364),
+}
+
+# TWS returns at most this many ticks per reqHistoricalTicks
+MAX_TICKS = 1000
+
+# HMDS errors: no data for the range, or a pacing violation
+_NO_DATA = 162
+_PACING = 'pacing violation'
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _utc(dt: datetime) -> datetime:
+    """ Naive datetimes are taken as UTC """
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def _ts(dt: datetime) -> int:
+    return int((dt - _EPOCH).total_seconds())
+
+
+def _tws_time(dt: datetime) -> str:
+    return dt.strftime('%Y%m%d-%H:%M:%S')
+
+
+def duration_str(chunk: timedelta) -> str:
+    if chunk < timedelta(days=1):
+        return f'{int(chunk.total_seconds())} S'
+    if chunk.days % 7 == 0 and chunk.days < 364:
+        return f'{chunk.days // 7} W'
+    if chunk.days >= 364:
+        return f'{round(chunk.days / 364)} Y'
+    return f'{chunk.days} D'
+
+
+def grid(start: datetime, end: datetime, chunk: timedelta) -> List[Tuple[datetime, datetime]]:
+    """ Chunks of the grid of multiples of chunk since the epoch that cover [start, end) """
+    step = int(chunk.total_seconds())
+    first = _ts(start) // step * step
+    return [(_EPOCH + timedelta(seconds=t), _EPOCH + timedelta(seconds=t + step))
+            for t in range(first, _ts(end), step)]
+
+
+def contract_key(contract: Contract) -> Hashable:
+    if contract.conId:
+        return contract.conId, contract.exchange
+    return (contract.symbol, contract.secType, contract.lastTradeDateOrContractMonth, contract.strike,
+            contract.right, contract.multiplier, contract.exchange, contract.primaryExchange,
+            contract.currency, contract.localSymbol)
+
+
+def _size(size) -> float:
+    return float('nan') if size == UNSET_DECIMAL else float(size)
+
+
+def _bar_time(date: str) -> int:
+    # Epoch seconds with formatDate=2, yyyymmdd for daily and longer bars
+    if len(date) == 8:
+        return _ts(datetime.strptime(date, '%Y%m%d').replace(tzinfo=timezone.utc))
+    return int(date.split(' ')[0])
+
+
+def bars_to_array(bars: list) -> np.ndarray:
+    return np.array([(_bar_time(b.date), b.open, b.high, b.low, b.close, _size(b.volume), _size(b.wap), b.barCount)
+                     for b in bars], dtype=BAR_DTYPE)
+
+
+def ticks_to_array(ticks: list, whatToShow: str) -> np.ndarray:
+    if whatToShow == 'TRADES':
+        rows = [(t.time, t.price, _size(t.size), t.tickAttribLast.pastLimit | t.tickAttribLast.unreported << 1)
+                for t in ticks]
+    elif whatToShow == 'BID_ASK':
+        rows = [(t.time, t.priceBid, t.priceAsk, _size(t.sizeBid), _size(t.sizeAsk),
+                 t.tickAttribBidAsk.bidPastLow | t.tickAttribBidAsk.askPastHigh << 1) for t in ticks]
+    else:
+        rows = [(t.time, t.price) for t in ticks]
+    return np.array(rows, dtype=TICK_DTYPES[whatToShow])
+
+
+def to_arrow(data: np.ndarray):
+    import pyarrow as pa
+    return pa.table({name: data[name] for name in data.dtype.names})
+
+
+class HistoricalPacer:
+    def __init__(self, max_requests: int = 60, period: float = 600.0, identical_interval: float = 15.0,
+                 contract_requests: int = 5, contract_period: float = 2.0):
+        self.max_requests = max_requests
+        self.period = period
+        self.identical_interval = identical_interval
+        self.contract_requests = contract_requests
+        self.contract_period = contract_period
+        self._sent: Deque[float] = deque()
+        self._identical: Dict[Hashable, float] = {}
+        self._by_contract: Dict[Hashable, Deque[float]] = {}
+
+    def _delay(self, request: Hashable, contract: Hashable, now: float) -> float:
+        sent = self._sent
+        while sent and sent[0] <= now - self.period:
+            sent.popleft()
+        delay = 0.0
+        if len(sent) >= self.max_requests:
+            delay = sent[len(sent) - self.max_requests] + self.period - now
+        last = self._identical.get(request)
+        if last is not None:
+            delay = max(delay, last + self.identical_interval - now)
+        recent = self._by_contract.get(contract)
+        if recent is not None and len(recent) >= self.contract_requests:
+            delay = max(delay, recent[-self.contract_requests] + self.contract_period - now)
+        return delay
+
+    def _record(self, request: Hashable, contract: Hashable, now: float):
+        self._sent.append(now)
+        self._identical = {k: t for k, t in self._identical.items() if t > now - self.identical_interval}
+        self._identical[request] = now
+        recent = self._by_contract.setdefault(contract, deque(maxlen=self.contract_requests))
+        recent.append(now)
+
+    async def wait(self, request: Hashable, contract: Hashable):
+        """ Wait until the request can be sent without a pacing violation and account for it """
+        while True:
+            now = time.monotonic()
+            delay = self._delay(request, contract, now)
+            if delay <= 0:
+                self._record(request, contract, now)
+                return
+            logger.debug('pacing: %s waits %.1fs', request, delay)
+            await asyncio.sleep(delay)
+
+
+class HistoricalDownloader:
+    def __init__(self, ib: 'IB', cache_dir: Optional[str] = None, concurrency: int = 4,
+                 pacer: Optional[HistoricalPacer] = None, tick_chunk: timedelta = timedelta(hours=1),
+                 timeout: Optional[float] = 120.0, retries: int = 3, retry_delay: float = 10.0):
+        self.ib = ib
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.pacer = pacer if pacer is not None else HistoricalPacer()
+        self.tick_chunk = tick_chunk
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Chunks answered from the cache and from TWS
+        self.cache_hits = 0
+        self.requests = 0
+
+    async def a_bars(self, contract: Contract, start: datetime, end: datetime, barSize: str,
+                     whatToShow: str = 'TRADES', useRTH: bool = True, output: str = 'numpy'):
+        """ Bars of [start, end) as a BAR_DTYPE array, time in epoch seconds """
+        start, end = _utc(start), _utc(end)
+        chunk = CHUNKS[barSize]
+        chunks = await asyncio.gather(*(self._a_bar_chunk(contract, s, e, barSize, whatToShow, useRTH)
+                                        for s, e in grid(start, end, chunk)))
+        return self._output(chunks, BAR_DTYPE, start, end, output)
+
+    async def a_ticks(self, contract: Contract, start: datetime, end: datetime,
+                      whatToShow: str = 'TRADES', useRth: bool = True, output: str = 'numpy'):
+        """ Ticks of [start, end) as a LAST_DTYPE, BID_ASK_DTYPE or MID_POINT_DTYPE array for
+        whatToShow TRADES, BID_ASK or MIDPOINT, time in epoch seconds """
+        start, end = _utc(start), _utc(end)
+        chunks = await asyncio.gather(*(self._a_tick_chunk(contract, s, e, whatToShow, useRth)
+                                        for s, e in grid(start, end, self.tick_chunk)))
+        return self._output(chunks, TICK_DTYPES[whatToShow], start, end, output)
+
+    @staticmethod
+    def _output(chunks: List[np.ndarray], dtype: np.dtype, start: datetime, end: datetime, output: str):
+        data = np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+        t = data['time']
+        data = data[(t >= _ts(start)) & (t < _ts(end))]
+        data = data[np.argsort(data['time'], kind='stable')]
+        if output == 'arrow':
+            return to_arrow(data)
+        return data
+
+    ####################################################################################################################
+
+    def _path(self, key: tuple) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + '.npy')
+
+    def _load(self, key: tuple) -> Optional[np.ndarray]:
+        path = self._path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        self.cache_hits += 1
+        return np.load(path)
+
+    def _store(self, key: tuple, end: datetime, data: np.ndarray):
+        path = self._path(key)
+        # A chunk that reaches into the future is not complete yet
+        if path is None or end > datetime.now(timezone.utc):
+            return
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp, path)
+
+    async def _a_request(self, pacing_key: tuple, contract: Contract, whatToShow: str, request) -> list:
+        for attempt in range(self.retries + 1):
+            async with self._semaphore:
+                await self.pacer.wait(pacing_key, (contract_key(contract), whatToShow))
+                self.requests += 1
+                try:
+                    return await request()
+                except RequestError as e:
+                    if e.error.errorCode != _NO_DATA:
+                        raise
+                    if _PACING not in e.error.errorString.lower():
+                        return []
+                    if attempt == self.retries:
+                        raise
+                    logger.warning('%s, retrying in %.0fs', e, self.retry_delay)
+            await asyncio.sleep(self.retry_delay)
+        return []
+
+    async def _a_bar_chunk(self, contract: Contract, start: datetime, end: datetime, barSize: str,
+                           whatToShow: str, useRTH: bool) -> np.ndarray:
+        key = ('bars', contract_key(contract), barSize, whatToShow, bool(useRTH), _ts(start), _ts(end))
+        data = self._load(key)
+        if data is not None:
+            return data
+        end_str, duration = _tws_time(end), duration_str(end - start)
+        bars = await self._a_request(
+            (key[1], end_str, duration, barSize, whatToShow, useRTH), contract, whatToShow,
+            lambda: self.ib.a_req_historical_data(contract, end_str, duration, barSize, whatToShow,
+                                                  int(useRTH), 2, timeout=self.timeout))
+        data = bars_to_array(bars)
+        data = data[(data['time'] >= _ts(start)) & (data['time'] < _ts(end))]
+        self._store(key, end, data)
+        return data
+
+    async def _a_tick_chunk(self, contract: Contract, start: datetime, end: datetime,
+                            whatToShow: str, useRth: bool) -> np.ndarray:
+        key = ('ticks', contract_key(contract), whatToShow, bool(useRth), _ts(start), _ts(end))
+        data = self._load(key)
+        if data is not None:
+            return data
+        pages = []
+        t = _ts(start)
+        end_ts = _ts(end)
+        while t < end_ts:
+            start_str = _tws_time(_EPOCH + timedelta(seconds=t))
+            ticks = await self._a_request(
+                (key[1], start_str, whatToShow, useRth), contract, whatToShow,
+                lambda: self.ib.a_req_historical_ticks(contract, start_str, '', MAX_TICKS, whatToShow,
+                                                       int(useRth), True, timeout=self.timeout))
+            if not ticks:
+                break
+            pages.append(ticks_to_array(ticks, whatToShow))
+            if len(ticks) < MAX_TICKS or ticks[-1].time >= end_ts:
+                break
+            # TWS completes the last second of a page, the next page starts after it
+            t = ticks[-1].time + 1
+        data = np.concatenate(pages) if pages else np.empty(0, dtype=TICK_DTYPES[whatToShow])
+        data = data[(data['time'] >= _ts(start)) & (data['time'] < end_ts)]
+        self._store(key, end, data)
+        return data
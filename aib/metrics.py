@@ -0,0 +1,254 @@
+"""
+Hot path metrics of AsyncRxClient, off unless client.metrics is set before connect().
+
+With a Metrics instance the client records:
+- bytes and frames read from the socket, frames per message type
+- decode time per message type, without the time spent in the wrapper
+- time spent in each wrapper callback
+- depth and dwell time of msg_queue (and rx_queue of ConvenientIB)
+- age of the events taken from rx_queue
+
+Durations are in ns and kept in log-linear Histograms, HdrHistogram style.
+Without metrics the hooks are not installed: run() picks its decode function
+once per batch and the reader tests one attribute per socket read.
+
+With the decode thread the read and decode metrics are recorded in that
+thread. Every counter and histogram has a single writer; new entries are
+added under a lock, and snapshot() and reset() take the entries under it, so
+the loop never iterates a dict the thread is growing.
+
+Metrics.export() hands a snapshot to the exporter, a no-op by default. Use
+LogExporter, or subclass Exporter to push to a monitoring system, and run
+a_export(interval) as a task to export periodically.
+"""
+
+
+import time
+import asyncio
+import logging
+import threading
+
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ibapi.message import IN
+
+logger = logging.getLogger(__name__)
+
+# Message type names by the id that starts an inbound frame
+MSG_NAMES: Dict[bytes, str] = {b"%d" % v: k for k, v in vars(IN).items() if not k.startswith('_') and isinstance(v, int)}
+
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class Histogram:
+    """
+    Log-linear histogram of non-negative integers, e.g. durations in ns.
+
+    Values below 2**sub_bits are counted exactly, above that every power of two
+    is split into 2**(sub_bits - 1) buckets, so a percentile is off by less than
+    1 / 2**(sub_bits - 1) of its value. Recording is O(1), the memory is fixed.
+    """
+
+    __slots__ = ('sub_bits', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, sub_bits: int = 5):
+        self.sub_bits = sub_bits
+        self.counts: List[int] = [0] * ((1 << sub_bits) + (64 - sub_bits) * (1 << (sub_bits - 1)))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - self.sub_bits
+        # Above 2**sub_bits: (shift << (sub_bits - 1)) + (value >> shift) is the bucket of the top sub_bits bits
+        self.counts[value if shift <= 0 else (shift << (self.sub_bits - 1)) + (value >> shift)] += 1
+        if value > self.max:
+            self.max = value
+        if value < self.min or not self.count:
+            self.min = value
+        self.count += 1
+        self.total += value
+
+    def _upper(self, index: int) -> int:
+        # Highest value counted in the bucket
+        sub_bits = self.sub_bits
+        if index < (1 << sub_bits):
+            return index
+        half = 1 << (sub_bits - 1)
+        shift, m = divmod(index - (1 << sub_bits), half)
+        shift += 1
+        return ((m + half + 1) << shift) - 1
+
+    def percentile(self, p: float) -> int:
+        """ Value at or below which a fraction p of the recorded values fall """
+        if not self.count:
+            return 0
+        rank = max(1, int(p * self.count + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self._upper(index), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other: 'Histogram'):
+        if other.sub_bits != self.sub_bits:
+            raise ValueError('Histograms with different sub_bits')
+        if not other.count:
+            return
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.min = other.min if not self.count else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = self.total = self.min = self.max = 0
+
+    def summary(self) -> Dict[str, float]:
+        summary = {'count': self.count, 'min': self.min, 'mean': self.mean, 'max': self.max}
+        for p in PERCENTILES:
+            summary[f'p{p * 100:g}'] = self.percentile(p)
+        return summary
+
+
+class Exporter:
+    """Receives Metrics.snapshot() on every Metrics.export(), does nothing"""
+
+    def export(self, snapshot: Dict[str, Any]):
+        pass
+
+
+class LogExporter(Exporter):
+    def __init__(self, level: int = logging.INFO):
+        self.level = level
+
+    def export(self, snapshot: Dict[str, Any]):
+        for name, value in sorted(snapshot['counters'].items()):
+            logger.log(self.level, '%s %d', name, value)
+        for name, value in sorted(snapshot['gauges'].items()):
+            logger.log(self.level, '%s %s', name, value)
+        for name, s in sorted(snapshot['histograms'].items()):
+            logger.log(self.level, '%s count %d p50 %d p99 %d p99.9 %d max %d',
+                       name, s['count'], s['p50'], s['p99'], s['p99.9'], s['max'])
+
+
+class Metrics:
+    def __init__(self, exporter: Optional[Exporter] = None, sub_bits: int = 5):
+        self.exporter = exporter or Exporter()
+        self.sub_bits = sub_bits
+        # The counters the reader adds to are there from the start, see add()
+        self.counters: Dict[str, int] = defaultdict(int, bytes_read=0, frames_read=0)
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        # Guards the keys of counters, gauges and histograms
+        self._lock = threading.Lock()
+        # Frame counter and decode histogram by message id, see decode_histogram()
+        self._decode: Dict[bytes, Tuple[str, Histogram]] = {}
+
+    def histogram(self, name: str) -> Histogram:
+        h = self.histograms.get(name)
+        if h is None:
+            with self._lock:
+                h = self.histograms.get(name)
+                if h is None:
+                    h = self.histograms[name] = Histogram(self.sub_bits)
+        return h
+
+    def add(self, name: str, n: int = 1):
+        counters = self.counters
+        if name in counters:
+            counters[name] += n
+        else:
+            with self._lock:
+                counters[name] += n
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """ Read on every snapshot, e.g. the depth of a queue """
+        with self._lock:
+            self.gauges[name] = read
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = list(self.gauges.items())
+            histograms = list(self.histograms.items())
+        return {'time': time.time(),
+                'counters': counters,
+                'gauges': {name: read() for name, read in gauges},
+                'histograms': {name: h.summary() for name, h in histograms if h.count}}
+
+    def export(self):
+        self.exporter.export(self.snapshot())
+
+    async def a_export(self, interval: float = 10.0, reset: bool = False):
+        """ Export every interval seconds, resetting the histograms if reset """
+        while True:
+            await asyncio.sleep(interval)
+            self.export()
+            if reset:
+                with self._lock:
+                    histograms = list(self.histograms.values())
+                for h in histograms:
+                    h.reset()
+
+    def reset(self):
+        # Counters are zeroed rather than removed, their writers add to them without the lock
+        with self._lock:
+            counters = self.counters
+            for name in counters:
+                counters[name] = 0
+            histograms = list(self.histograms.values())
+        for h in histograms:
+            h.reset()
+
+    ####################################################################################################################
+
+    def decode_histogram(self, frame: bytes) -> Histogram:
+        """ Decode time histogram of the frame's message type """
+        msg_id = frame[:frame.find(b"\0")]
+        decode = self._decode.get(msg_id)
+        if decode is None:
+            name = MSG_NAMES.get(msg_id, msg_id.decode(errors='replace'))
+            self.add('frames.' + name, 0)
+            decode = self._decode[msg_id] = ('frames.' + name, self.histogram('decode.' + name))
+        self.counters[decode[0]] += 1
+        return decode[1]
+
+
+class TimedWrapper:
+    """Stands in for the wrapper in the decoder and times every callback"""
+
+    def __init__(self, wrapper, metrics: Metrics):
+        self.wrapper = wrapper
+        self.metrics = metrics
+        # Callback time of the message being decoded, see AsyncRxClient._process_msg_timed
+        self.callback_ns = 0
+
+    def __getattr__(self, name: str):
+        method = getattr(self.wrapper, name)
+        if not callable(method):
+            return method
+        histogram = self.metrics.histogram('callback.' + name)
+        perf_counter_ns = time.perf_counter_ns
+
+        def timed(*args):
+            t0 = perf_counter_ns()
+            try:
+                return method(*args)
+            finally:
+                dt = perf_counter_ns() - t0
+                histogram.record(dt)
+                self.callback_ns += dt
+        # Cached, __getattr__ runs once per callback name
+        self.__dict__[name] = timed
+        return timed
@@ -0,0 +1,235 @@
+"""
+In-process stand-in for TWS/IB gateway, for tests and benchmarks.
+
+MockTWS accepts API connections, performs the handshake (API prefix, version
+exchange, nextValidId and managedAccounts after startApi) and records the
+requests it receives. Streams of inbound messages are pushed to the connected
+clients with send() and blast(). The frame builders produce the messages as
+TWS sends them.
+"""
+
+
+import time
+import asyncio
+import logging
+
+from struct import Struct
+from typing import Callable, Dict, Iterable, List, Optional
+from asyncio import StreamReader, StreamWriter
+from ibapi.message import IN, OUT
+from ibapi.server_versions import MAX_CLIENT_VER, MIN_SERVER_VER_MARKET_CAP_PRICE
+
+logger = logging.getLogger(__name__)
+
+_size_prefix = Struct("!I")
+
+MockHandler = Callable[['MockTWS', StreamWriter, List[bytes]], None]
+
+
+def frame(*fields) -> bytes:
+    """ Message with its size prefix, fields are converted with str() """
+    text = "\0".join(map(str, fields)).encode() + b"\0"
+    return _size_prefix.pack(len(text)) + text
+
+
+def tick_by_tick_bid_ask(reqId: int, time: int, bidPrice: float, askPrice: float,
+                         bidSize, askSize, mask: int = 0) -> bytes:
+    return frame(IN.TICK_BY_TICK, reqId, 3, time, bidPrice, askPrice, bidSize, askSize, mask)
+
+
+def tick_by_tick_all_last(reqId: int, time: int, price: float, size, mask: int = 0,
+                          exchange: str = '', specialConditions: str = '') -> bytes:
+    return frame(IN.TICK_BY_TICK, reqId, 2, time, price, size, mask, exchange, specialConditions)
+
+
+def tick_by_tick_mid_point(reqId: int, time: int, midPoint: float) -> bytes:
+    return frame(IN.TICK_BY_TICK, reqId, 4, time, midPoint)
+
+
+def tick_price(reqId: int, tickType: int, price: float, size, attrMask: int = 0) -> bytes:
+    return frame(IN.TICK_PRICE, 6, reqId, tickType, price, size, attrMask)
+
+
+def market_depth(reqId: int, position: int, operation: int, side: int, price: float, size) -> bytes:
+    return frame(IN.MARKET_DEPTH, 1, reqId, position, operation, side, price, size)
+
+
+def market_depth_l2(reqId: int, position: int, marketMaker: str, operation: int, side: int,
+                    price: float, size, isSmartDepth: bool = False) -> bytes:
+    return frame(IN.MARKET_DEPTH_L2, 1, reqId, position, marketMaker, operation, side, price, size,
+                 int(isSmartDepth))
+
+
+def order_status(orderId: int, status: str, filled, remaining, avgFillPrice: float, permId: int,
+                 parentId: int = 0, lastFillPrice: float = 0.0, clientId: int = 1, whyHeld: str = '',
+                 mktCapPrice: float = 0.0, server_version: int = MAX_CLIENT_VER) -> bytes:
+    fields = [IN.ORDER_STATUS]
+    if server_version < MIN_SERVER_VER_MARKET_CAP_PRICE:
+        fields.append(6)
+    fields += [orderId, status, filled, remaining, avgFillPrice, permId, parentId, lastFillPrice, clientId, whyHeld]
+    if server_version >= MIN_SERVER_VER_MARKET_CAP_PRICE:
+        fields.append(mktCapPrice)
+    return frame(*fields)
+
+
+def historical_data(reqId: int, startDateStr: str, endDateStr: str, bars: Iterable[tuple]) -> bytes:
+    """ bars of (date, open, high, low, close, volume, wap, barCount) """
+    bars = list(bars)
+    fields = [IN.HISTORICAL_DATA, reqId, startDateStr, endDateStr, len(bars)]
+    for bar in bars:
+        fields += bar
+    return frame(*fields)
+
+
+def historical_ticks_last(reqId: int, ticks: Iterable[tuple], done: bool = True) -> bytes:
+    """ ticks of (time, mask, price, size, exchange, specialConditions) """
+    ticks = list(ticks)
+    fields = [IN.HISTORICAL_TICKS_LAST, reqId, len(ticks)]
+    for tick in ticks:
+        fields += tick
+    return frame(*fields, int(done))
+
+
+def execution_data(reqId: int, orderId: int, conId: int, symbol: str, execId: str, time: str, side: str,
+                   shares, price: float, secType: str = 'STK', exchange: str = 'SMART', currency: str = 'USD',
+                   acctNumber: str = 'DU0000001', permId: int = 0, clientId: int = 1) -> bytes:
+    return frame(IN.EXECUTION_DATA, reqId, orderId,
+                 conId, symbol, secType, '', 0.0, '', '', exchange, currency, symbol, symbol,
+                 execId, time, acctNumber, exchange, side, shares, price, permId, clientId, 0, shares, price,
+                 '', '', '', '', 0)
+
+
+def execution_data_end(reqId: int) -> bytes:
+    return frame(IN.EXECUTION_DATA_END, 1, reqId)
+
+
+def commission_report(execId: str, commission: float, currency: str = 'USD', realizedPNL: float = 0.0) -> bytes:
+    return frame(IN.COMMISSION_REPORT, 1, execId, commission, currency, realizedPNL, '', 0)
+
+
+def error(reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson: str = '') -> bytes:
+    return frame(IN.ERR_MSG, 2, reqId, errorCode, errorString, advancedOrderRejectJson)
+
+
+def next_valid_id(orderId: int) -> bytes:
+    return frame(IN.NEXT_VALID_ID, 1, orderId)
+
+
+def managed_accounts(accountsList: str) -> bytes:
+    return frame(IN.MANAGED_ACCTS, 1, accountsList)
+
+
+class MockTWS:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, server_version: int = MAX_CLIENT_VER,
+                 next_valid_id: int = 1, accounts: str = 'DU0000001'):
+        self.host = host
+        self.port = port
+        self.server_version = server_version
+        self.next_valid_id = next_valid_id
+        self.accounts = accounts
+        # Writers of the clients that completed the handshake, by client id
+        self.clients: Dict[int, StreamWriter] = {}
+        # Every request received after the handshake: (client id, fields)
+        self.requests: List[tuple] = []
+        self.handlers: Dict[int, MockHandler] = {
+            OUT.START_API: MockTWS._start_api,
+            OUT.REQ_IDS: MockTWS._req_ids,
+        }
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._client_ids: Dict[StreamWriter, int] = {}
+        self._tasks = set()
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        for writer in list(self._client_ids):
+            writer.close()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    ####################################################################################################################
+
+    @staticmethod
+    async def _read_msg(reader: StreamReader) -> bytes:
+        size = _size_prefix.unpack(await reader.readexactly(4))[0]
+        return await reader.readexactly(size)
+
+    async def _serve(self, reader: StreamReader, writer: StreamWriter):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            if await reader.readexactly(4) != b"API\0":
+                writer.close()
+                return
+            await self._read_msg(reader)
+            conn_time = time.strftime('%Y%m%d %H:%M:%S UTC', time.gmtime())
+            writer.write(frame(self.server_version, conn_time))
+            self._client_ids[writer] = -1
+            while True:
+                fields = (await self._read_msg(reader)).split(b"\0")[:-1]
+                self.requests.append((self._client_ids[writer], fields))
+                handler = self.handlers.get(int(fields[0]))
+                if handler is not None:
+                    handler(self, writer, fields)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            client_id = self._client_ids.pop(writer, None)
+            if self.clients.get(client_id) is writer:
+                del self.clients[client_id]
+            writer.close()
+            self._tasks.discard(task)
+
+    def _start_api(self, writer: StreamWriter, fields: List[bytes]):
+        client_id = int(fields[2])
+        self._client_ids[writer] = client_id
+        self.clients[client_id] = writer
+        writer.write(managed_accounts(self.accounts) + next_valid_id(self.next_valid_id))
+
+    def _req_ids(self, writer: StreamWriter, fields: List[bytes]):
+        writer.write(next_valid_id(self.next_valid_id))
+
+    ####################################################################################################################
+
+    def send(self, data: bytes, client_id: Optional[int] = None):
+        """ Write frames to one client or to all of them """
+        writers = self.clients.values() if client_id is None else [self.clients[client_id]]
+        for writer in writers:
+            writer.write(data)
+
+    async def blast(self, frames: Iterable[bytes], batch: int = 256, client_id: Optional[int] = None):
+        """ Write the frames in batches of frames, draining the sockets between batches """
+        pending = []
+        for f in frames:
+            pending.append(f)
+            if len(pending) >= batch:
+                await self._write(b"".join(pending), client_id)
+                pending = []
+        if pending:
+            await self._write(b"".join(pending), client_id)
+
+    async def _write(self, data: bytes, client_id: Optional[int]):
+        writers = list(self.clients.values()) if client_id is None else [self.clients[client_id]]
+        for writer in writers:
+            writer.write(data)
+        for writer in writers:
+            await writer.drain()
+
+    def disconnect(self, client_id: int):
+        """ Drop a client connection, as a gateway restart would """
+        writer = self.clients.pop(client_id, None)
+        if writer is not None:
+            writer.close()
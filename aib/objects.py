@@ -1,10 +1,12 @@
 from dataclasses import dataclass,field
 from typing import Optional
-from ibapi.wrapper import TickerId, TickAttribBidAsk, Contract, Order, OrderState, ContractDetails, Execution
+from ibapi.wrapper import TickerId, TickAttrib, TickAttribBidAsk, TickAttribLast, TickType, SetOfString, SetOfFloat, \
+                          Contract, Order, OrderState, ContractDetails, Execution, BarData, ListOfHistoricalTick, \
+                          ListOfHistoricalTickBidAsk, ListOfHistoricalTickLast, ListOfContractDescription
 from ibapi.utils import Decimal
 
 
-@dataclass
+@dataclass(slots=True)
 class Error:
     reqId: TickerId
     errorCode: int
@@ -12,7 +14,7 @@ class Error:
     advancedOrderRejectJson: str = field(default='')
 
 
-@dataclass
+@dataclass(slots=True)
 class OrderUpdate:
     orderId: int
     status: str
@@ -27,7 +29,7 @@ class OrderUpdate:
     mktCapPrice: float = 0.0
 
 
-@dataclass
+@dataclass(slots=True)
 class OpenOrder:
     orderId: int
     contract: Contract
@@ -35,24 +37,24 @@ class OpenOrder:
     orderState: OrderState
 
 
-@dataclass
+@dataclass(slots=True)
 class OpenOrderEnd:
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class CompletedOrder:
     contract: Contract
     order: Order
     orderState: OrderState
 
 
-@dataclass
+@dataclass(slots=True)
 class CompletedOrdersEnd:
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class Snap:
     reqId: int
     time: int
@@ -63,30 +65,30 @@ class Snap:
     tickAttribBidAsk: TickAttribBidAsk
 
 
-@dataclass
+@dataclass(slots=True)
 class ResponseContractDetails:
     reqId: int
     contractDetails: ContractDetails
 
 
-@dataclass
+@dataclass(slots=True)
 class ResponseContractDetailsEnd:
     reqId: int
 
 
-@dataclass
+@dataclass(slots=True)
 class ResponseExecDetails:
     reqId: int
     contract: Contract
     execution: Execution
 
 
-@dataclass
+@dataclass(slots=True)
 class ResponseExecDetailsEnd:
     reqId: int
 
 
-@dataclass
+@dataclass(slots=True)
 class Position:
     account: str
     contract: Contract
@@ -94,7 +96,7 @@ class Position:
     avgCost: float
 
 
-@dataclass
+@dataclass(slots=True)
 class ResponseAccountSummary:
     reqId: int
     account: str
@@ -103,6 +105,277 @@ class ResponseAccountSummary:
     currency: str
 
 
-@dataclass
+@dataclass(slots=True)
 class ResponseAccountSummaryEnd:
     reqId: int
+
+
+@dataclass(slots=True)
+class Last:
+    reqId: int
+    tickType: int
+    time: int
+    price: float
+    size: Decimal
+    tickAttribLast: TickAttribLast
+    exchange: str
+    specialConditions: str
+
+
+@dataclass(slots=True)
+class MidPoint:
+    reqId: int
+    time: int
+    midPoint: float
+
+
+@dataclass(slots=True)
+class TickPrice:
+    reqId: TickerId
+    tickType: TickType
+    price: float
+    attrib: TickAttrib
+
+
+@dataclass(slots=True)
+class TickSize:
+    reqId: TickerId
+    tickType: TickType
+    size: Decimal
+
+
+@dataclass(slots=True)
+class TickString:
+    reqId: TickerId
+    tickType: TickType
+    value: str
+
+
+@dataclass(slots=True)
+class TickGeneric:
+    reqId: TickerId
+    tickType: TickType
+    value: float
+
+
+@dataclass(slots=True)
+class TickOptionComputation:
+    reqId: TickerId
+    tickType: TickType
+    tickAttrib: int
+    impliedVol: float
+    delta: float
+    optPrice: float
+    pvDividend: float
+    gamma: float
+    vega: float
+    theta: float
+    undPrice: float
+
+
+@dataclass(slots=True)
+class MktDepth:
+    reqId: TickerId
+    position: int
+    operation: int
+    side: int
+    price: float
+    size: Decimal
+
+
+@dataclass(slots=True)
+class MktDepthL2:
+    reqId: TickerId
+    position: int
+    marketMaker: str
+    operation: int
+    side: int
+    price: float
+    size: Decimal
+    isSmartDepth: bool
+
+
+@dataclass(slots=True)
+class RealTimeBar:
+    reqId: TickerId
+    time: int
+    open_: float
+    high: float
+    low: float
+    close: float
+    volume: Decimal
+    wap: Decimal
+    count: int
+
+
+@dataclass(slots=True)
+class PnL:
+    reqId: int
+    dailyPnL: float
+    unrealizedPnL: float
+    realizedPnL: float
+
+
+@dataclass(slots=True)
+class PnLSingle:
+    reqId: int
+    pos: Decimal
+    dailyPnL: float
+    unrealizedPnL: float
+    realizedPnL: float
+    value: float
+
+
+@dataclass(slots=True)
+class ResponseSecDefOptParams:
+    reqId: int
+    exchange: str
+    underlyingConId: int
+    tradingClass: str
+    multiplier: str
+    expirations: SetOfString
+    strikes: SetOfFloat
+
+
+@dataclass(slots=True)
+class TickSnapshotEnd:
+    reqId: int
+
+
+@dataclass(slots=True)
+class MarketDataType:
+    reqId: TickerId
+    marketDataType: int
+
+
+@dataclass(slots=True)
+class ResponseHistoricalData:
+    reqId: int
+    bar: BarData
+
+
+@dataclass(slots=True)
+class ResponseHistoricalDataEnd:
+    reqId: int
+    start: str
+    end: str
+
+
+@dataclass(slots=True)
+class HistoricalDataUpdate:
+    reqId: int
+    bar: BarData
+
+
+@dataclass(slots=True)
+class ResponseHistoricalTicks:
+    reqId: int
+    ticks: ListOfHistoricalTick
+    done: bool
+
+
+@dataclass(slots=True)
+class ResponseHistoricalTicksBidAsk:
+    reqId: int
+    ticks: ListOfHistoricalTickBidAsk
+    done: bool
+
+
+@dataclass(slots=True)
+class ResponseHistoricalTicksLast:
+    reqId: int
+    ticks: ListOfHistoricalTickLast
+    done: bool
+
+
+@dataclass(slots=True)
+class ResponseHeadTimestamp:
+    reqId: int
+    headTimestamp: str
+
+
+@dataclass(slots=True)
+class ResponseSecDefOptParamsEnd:
+    reqId: int
+
+
+@dataclass(slots=True)
+class ResponseSymbolSamples:
+    reqId: int
+    contractDescriptions: ListOfContractDescription
+
+
+@dataclass(slots=True)
+class ResponseFundamentalData:
+    reqId: TickerId
+    data: str
+
+
+@dataclass(slots=True)
+class PositionEnd:
+    pass
+
+
+@dataclass(slots=True)
+class PositionMulti:
+    reqId: int
+    account: str
+    modelCode: str
+    contract: Contract
+    pos: Decimal
+    avgCost: float
+
+
+@dataclass(slots=True)
+class PositionMultiEnd:
+    reqId: int
+
+
+@dataclass(slots=True)
+class AccountValue:
+    key: str
+    val: str
+    currency: str
+    accountName: str
+
+
+@dataclass(slots=True)
+class PortfolioUpdate:
+    contract: Contract
+    position: Decimal
+    marketPrice: float
+    marketValue: float
+    averageCost: float
+    unrealizedPNL: float
+    realizedPNL: float
+    accountName: str
+
+
+@dataclass(slots=True)
+class AccountDownloadEnd:
+    accountName: str
+
+
+@dataclass(slots=True)
+class AccountUpdateMulti:
+    reqId: int
+    account: str
+    modelCode: str
+    key: str
+    value: str
+    currency: str
+
+
+@dataclass(slots=True)
+class AccountUpdateMultiEnd:
+    reqId: int
+
+
+@dataclass(slots=True)
+class ManagedAccounts:
+    accountsList: str
+
+
+@dataclass(slots=True)
+class CurrentTime:
+    time: int
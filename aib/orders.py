@@ -0,0 +1,281 @@
+"""
+Incremental state of the orders and executions seen by a client, see IB.orders.
+
+OrderStore folds the order callbacks into one TrackedOrder per order:
+- openOrder and completedOrder set the contract, order and OrderState
+- orderStatus sets the status, filled and remaining quantities and prices,
+  and an orderStatus identical to the previous orderStatus of the order is a
+  duplicate. The state set by placeOrder or openOrder is not compared, so the
+  first orderStatus of an order is never dropped
+- execDetails adds a Fill to its order, the commissionReport of the execId
+  is joined to the Fill whichever of the two arrives first
+
+Orders are indexed by orderId (of the store's client_id only, orderIds are
+per client), permId and parentId, fills by execId, so every lookup is a dict
+access. TrackedOrder.a_fill() and a_done() wake up on the next fill and on a
+terminal status, and the listeners of the store are called with every order
+whose status changed.
+
+Terminal orders and their fills stay in the store until prune().
+"""
+
+
+import asyncio
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from ibapi.commission_report import CommissionReport
+from ibapi.contract import Contract
+from ibapi.execution import Execution
+from ibapi.order import Order
+from ibapi.order_state import OrderState
+
+from aib.objects import Error
+
+# Statuses after which an order does not change, Inactive is a rejected or expired order
+DONE_STATES = frozenset(('Filled', 'Cancelled', 'ApiCancelled', 'Inactive'))
+
+
+@dataclass(slots=True)
+class Fill:
+    contract: Contract
+    execution: Execution
+    commissionReport: Optional[CommissionReport] = None
+
+
+class TrackedOrder:
+    __slots__ = ('orderId', 'permId', 'parentId', 'clientId', 'contract', 'order', 'orderState',
+                 'status', 'filled', 'remaining', 'avgFillPrice', 'lastFillPrice', 'whyHeld', 'mktCapPrice',
+                 'fills', 'error', '_last_status', '_fill_waiters', '_done')
+
+    def __init__(self, orderId: int, permId: int = 0):
+        self.orderId = orderId
+        self.permId = permId
+        self.parentId = 0
+        self.clientId = 0
+        self.contract: Optional[Contract] = None
+        self.order: Optional[Order] = None
+        self.orderState: Optional[OrderState] = None
+        self.status = ''
+        self.filled = 0.0
+        self.remaining = 0.0
+        self.avgFillPrice = 0.0
+        self.lastFillPrice = 0.0
+        self.whyHeld = ''
+        self.mktCapPrice = 0.0
+        self.fills: List[Fill] = []
+        # Last error TWS reported for the orderId
+        self.error: Optional[Error] = None
+        # Fields of the last orderStatus, see OrderStore.is_duplicate_status()
+        self._last_status: Optional[tuple] = None
+        self._fill_waiters: List[asyncio.Future] = []
+        self._done: Optional[asyncio.Future] = None
+
+    def __repr__(self) -> str:
+        return f'TrackedOrder(orderId={self.orderId}, permId={self.permId}, status={self.status!r}, ' \
+               f'filled={self.filled}, remaining={self.remaining})'
+
+    @property
+    def done(self) -> bool:
+        return self.status in DONE_STATES
+
+    async def a_fill(self) -> Fill:
+        """ Wait for the next fill of the order """
+        future = asyncio.get_running_loop().create_future()
+        self._fill_waiters.append(future)
+        return await future
+
+    async def a_done(self) -> 'TrackedOrder':
+        """ Wait until the order reaches a terminal status """
+        if not self.done:
+            if self._done is None:
+                self._done = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._done)
+        return self
+
+    def _filled(self, fill: Fill):
+        self.fills.append(fill)
+        waiters = self._fill_waiters
+        if waiters:
+            self._fill_waiters = []
+            for future in waiters:
+                if not future.done():
+                    future.set_result(fill)
+
+    def _status_changed(self):
+        if self._done is not None and self.done:
+            if not self._done.done():
+                self._done.set_result(None)
+            self._done = None
+
+
+class OrderStore:
+    def __init__(self, client_id: Optional[int] = None):
+        # Orders of other clients are only indexed by permId
+        self.client_id = client_id
+        self.orders: Dict[int, TrackedOrder] = {}
+        self.by_perm_id: Dict[int, TrackedOrder] = {}
+        # Child orders by the orderId of their parent
+        self._children: Dict[int, Dict[int, TrackedOrder]] = {}
+        self.fills: Dict[str, Fill] = {}
+        # Commission reports that arrived before their execution
+        self._commissions: Dict[str, CommissionReport] = {}
+        # Called with the order after every orderStatus that is not a duplicate
+        self.listeners: List[Callable[[TrackedOrder], None]] = []
+
+    def get(self, orderId: int) -> Optional[TrackedOrder]:
+        return self.orders.get(orderId)
+
+    def get_by_perm_id(self, permId: int) -> Optional[TrackedOrder]:
+        return self.by_perm_id.get(permId)
+
+    def children(self, parentId: int) -> List[TrackedOrder]:
+        return list(self._children.get(parentId, {}).values())
+
+    def fill(self, execId: str) -> Optional[Fill]:
+        return self.fills.get(execId)
+
+    def open_orders(self) -> List[TrackedOrder]:
+        return [o for o in self._all() if not o.done]
+
+    def _all(self) -> List[TrackedOrder]:
+        orders = {id(o): o for o in self.orders.values()}
+        orders.update((id(o), o) for o in self.by_perm_id.values())
+        return list(orders.values())
+
+    ####################################################################################################################
+
+    def _order(self, orderId: int, permId: int, clientId: Optional[int] = None) -> TrackedOrder:
+        if clientId is not None and clientId != self.client_id:
+            orderId = 0
+        order = self.by_perm_id.get(permId) if permId else None
+        if order is None and orderId:
+            order = self.orders.get(orderId)
+        if order is None:
+            order = TrackedOrder(orderId, permId)
+        if orderId and order.orderId != orderId:
+            order.orderId = orderId
+        if orderId:
+            self.orders[orderId] = order
+        if permId and order.permId != permId:
+            order.permId = permId
+        if permId:
+            self.by_perm_id[permId] = order
+        return order
+
+    def _set_parent(self, order: TrackedOrder, parentId: int):
+        if parentId and order.parentId != parentId:
+            order.parentId = parentId
+            if order.orderId:
+                self._children.setdefault(parentId, {})[order.orderId] = order
+
+    def on_place(self, orderId: int, contract: Contract, order: Order) -> TrackedOrder:
+        tracked = self._order(orderId, order.permId)
+        tracked.contract = contract
+        tracked.order = order
+        if not tracked.status:
+            tracked.status = 'PendingSubmit'
+        tracked.remaining = order.totalQuantity
+        self._set_parent(tracked, order.parentId)
+        return tracked
+
+    def on_open_order(self, orderId: int, contract: Contract, order: Order, orderState: OrderState) -> TrackedOrder:
+        tracked = self._order(orderId, order.permId, order.clientId)
+        tracked.contract = contract
+        tracked.order = order
+        tracked.orderState = orderState
+        self._set_parent(tracked, order.parentId)
+        if orderState.status and orderState.status != tracked.status and not tracked.done:
+            tracked.status = orderState.status
+            tracked._status_changed()
+        return tracked
+
+    def on_completed_order(self, contract: Contract, order: Order, orderState: OrderState) -> TrackedOrder:
+        tracked = self._order(order.orderId, order.permId, order.clientId)
+        tracked.contract = contract
+        tracked.order = order
+        tracked.orderState = orderState
+        if orderState.status and orderState.status != tracked.status:
+            tracked.status = orderState.status
+            tracked._status_changed()
+        return tracked
+
+    def is_duplicate_status(self, orderId: int, status: str, filled, remaining, avgFillPrice: float, permId: int,
+                            parentId: int, lastFillPrice: float, clientId: int, whyHeld: str,
+                            mktCapPrice: float = 0.0) -> bool:
+        """ True when the orderStatus repeats the last one of the order """
+        tracked = self.by_perm_id.get(permId) if permId else None
+        if tracked is None and clientId == self.client_id:
+            tracked = self.orders.get(orderId)
+        return tracked is not None and tracked._last_status == (status, filled, remaining, avgFillPrice,
+                                                                lastFillPrice, whyHeld, mktCapPrice)
+
+    def on_order_status(self, orderId: int, status: str, filled, remaining, avgFillPrice: float, permId: int,
+                        parentId: int, lastFillPrice: float, clientId: int, whyHeld: str,
+                        mktCapPrice: float = 0.0) -> Optional[TrackedOrder]:
+        """ Returns the order, or None when the status is a duplicate """
+        if self.is_duplicate_status(orderId, status, filled, remaining, avgFillPrice, permId, parentId,
+                                    lastFillPrice, clientId, whyHeld, mktCapPrice):
+            return None
+        tracked = self._order(orderId, permId, clientId)
+        tracked.clientId = clientId
+        self._set_parent(tracked, parentId)
+        tracked.filled = filled
+        tracked.remaining = remaining
+        tracked.avgFillPrice = avgFillPrice
+        tracked.lastFillPrice = lastFillPrice
+        tracked.whyHeld = whyHeld
+        tracked.mktCapPrice = mktCapPrice
+        tracked._last_status = (status, filled, remaining, avgFillPrice, lastFillPrice, whyHeld, mktCapPrice)
+        if status != tracked.status:
+            tracked.status = status
+            tracked._status_changed()
+        for listener in self.listeners:
+            listener(tracked)
+        return tracked
+
+    def on_execution(self, contract: Contract, execution: Execution) -> Optional[Fill]:
+        """ Returns the new Fill, or None for an execution already seen """
+        if execution.execId in self.fills:
+            return None
+        fill = Fill(contract, execution, self._commissions.pop(execution.execId, None))
+        self.fills[execution.execId] = fill
+        self._order(execution.orderId, execution.permId, execution.clientId)._filled(fill)
+        return fill
+
+    def has_commission(self, execId: str) -> bool:
+        fill = self.fills.get(execId)
+        return execId in self._commissions if fill is None else fill.commissionReport is not None
+
+    def on_commission(self, commissionReport: CommissionReport) -> Optional[Fill]:
+        """ Returns the Fill the report was joined to, None if its execution did not arrive yet """
+        fill = self.fills.get(commissionReport.execId)
+        if fill is None:
+            self._commissions[commissionReport.execId] = commissionReport
+        else:
+            fill.commissionReport = commissionReport
+        return fill
+
+    def on_error(self, error: Error) -> Optional[TrackedOrder]:
+        tracked = self.orders.get(error.reqId)
+        if tracked is not None:
+            tracked.error = error
+        return tracked
+
+    def prune(self):
+        """ Drop the terminal orders and their fills """
+        for tracked in self._all():
+            if not tracked.done:
+                continue
+            if self.orders.get(tracked.orderId) is tracked:
+                del self.orders[tracked.orderId]
+            if self.by_perm_id.get(tracked.permId) is tracked:
+                del self.by_perm_id[tracked.permId]
+            children = self._children.get(tracked.parentId)
+            if children is not None and children.get(tracked.orderId) is tracked:
+                del children[tracked.orderId]
+                if not children:
+                    del self._children[tracked.parentId]
+            for fill in tracked.fills:
+                self.fills.pop(fill.execution.execId, None)
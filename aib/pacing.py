@@ -0,0 +1,159 @@
+"""
+Outbound pacing of the API requests.
+
+TWS disconnects clients that send more than 50 messages per second. The
+SendPipeline queues the messages of Connection.sendMsg and writes them at most
+at rate messages per second with bursts of up to burst messages (token bucket),
+so any one second window sees at most rate + burst messages. Orders, order
+cancels and exercises go out before the data requests, in the order they were
+sent, so a cancel never overtakes its order. The cancels of data requests stay
+behind their requests. Messages that are due together are coalesced into one
+write, and the socket is drained after every write. When the connection fails
+the queued messages are dropped and counted in dropped, as are the later ones.
+"""
+
+
+import time
+import asyncio
+import logging
+
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+from asyncio import StreamWriter
+
+from ibapi.message import OUT
+
+logger = logging.getLogger(__name__)
+
+ORDER = 0
+DATA = 1
+
+_ORDER_IDS = [OUT.PLACE_ORDER, OUT.CANCEL_ORDER, OUT.REQ_GLOBAL_CANCEL, OUT.EXERCISE_OPTIONS]
+# Priority class by the msgId field of a message, each class is sent FIFO
+PRIORITIES = {b"%d" % i: ORDER for i in _ORDER_IDS}
+
+
+def priority(msg: bytes) -> int:
+    """ Priority class of a message with its size prefix """
+    end = msg.find(b"\0", 4)
+    return PRIORITIES.get(msg[4:end], DATA)
+
+
+class SendPipeline:
+    def __init__(self, writer: StreamWriter, rate: float = 40.0, burst: int = 10, window: float = 1.0):
+        if rate <= 0 or burst < 1:
+            raise ValueError('rate must be positive and burst at least 1')
+        self.writer = writer
+        self.rate = rate
+        self.burst = burst
+        # Enqueue time and message, by priority class
+        self._queues: Tuple[Deque[Tuple[float, bytes]], ...] = (deque(), deque())
+        self._size = 0
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Metrics
+        self.sent = 0
+        self.writes = 0
+        self.bytes_sent = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # Messages not sent because the connection failed, and the error
+        self.dropped = 0
+        self.error: Optional[Exception] = None
+        self.window = window
+        self._recent: Deque[Tuple[float, int]] = deque()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        task = self._task
+        self._task = None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def put(self, msg: bytes):
+        if self.error is not None:
+            self.dropped += 1
+            logger.warning('message not sent, the connection failed: %r', self.error)
+            return
+        self._queues[priority(msg)].append((time.monotonic(), msg))
+        self._size += 1
+        self._wakeup.set()
+
+    ####################################################################################################################
+
+    @property
+    def wait_mean(self) -> float:
+        """ Mean time in seconds the sent messages spent in the queue """
+        return self.wait_total / self.sent if self.sent else 0.0
+
+    def send_rate(self) -> float:
+        """ Messages per second sent over the last window seconds """
+        self._expire(time.monotonic())
+        return sum(n for _, n in self._recent) / self.window
+
+    def _expire(self, now: float):
+        recent = self._recent
+        while recent and recent[0][0] <= now - self.window:
+            recent.popleft()
+
+    ####################################################################################################################
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _pop(self, n: int, now: float) -> List[bytes]:
+        msgs = []
+        for queue in self._queues:
+            while queue and len(msgs) < n:
+                queued, msg = queue.popleft()
+                wait = now - queued
+                self.wait_total += wait
+                if wait > self.wait_max:
+                    self.wait_max = wait
+                msgs.append(msg)
+        self._size -= len(msgs)
+        return msgs
+
+    async def _run(self):
+        writer = self.writer
+        try:
+            while True:
+                if not self._size:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens < 1:
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+                    continue
+                msgs = self._pop(int(self._tokens), now)
+                self._tokens -= len(msgs)
+                data = b"".join(msgs)
+                writer.write(data)
+                self.sent += len(msgs)
+                self.writes += 1
+                self.bytes_sent += len(data)
+                self._expire(now)
+                self._recent.append((now, len(msgs)))
+                await writer.drain()
+        except ConnectionError as e:
+            self.error = e
+            dropped = self._size
+            for queue in self._queues:
+                queue.clear()
+            self._size = 0
+            self.dropped += dropped
+            logger.error('SendPipeline stopped by %r, %d messages not sent', e, dropped)
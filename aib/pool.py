@@ -0,0 +1,245 @@
+"""
+Pool of connections to one gateway with distinct client ids.
+
+IBPool opens one IB per client id and places every subscription on the least
+loaded connected member, by number of subscriptions or by message rate, so
+the per-connection caps on tick-by-tick and depth lines and the throughput of
+a single socket no longer bound the number of instruments followed.
+
+Subscriptions get reqIds of the pool's own id space: the events of every
+member are rewritten to the pool reqId and put to the Subscription of the
+request. The events are built by the member for its route only, so their
+reqId is rewritten in place. With IBPool(merged=True) they go to the merged
+rx_queue as (recv_ns, event) instead, and the Subscriptions only get the
+warnings, errors and end of their request. Either way the events wait
+until they are read: iterate the Subscriptions or read rx_queue, bounded
+with rx_queue_size and rx_queue_policy as in ConvenientIB (see aib.queues),
+under block a full rx_queue pauses the members. When a member disconnects
+its subscriptions are requested again on the remaining members under the
+same pool reqId.
+
+Orders are not pooled: order ids belong to a client id, place them through
+one member.
+"""
+
+
+import time
+import asyncio
+import logging
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+from ibapi.contract import Contract
+
+from aib.aibrx import IB
+from aib.objects import Error
+from aib.queues import BoundedQueue, BLOCK, event_key
+from aib.routing import Route, Subscription
+
+logger = logging.getLogger(__name__)
+
+COUNT = 'count'
+RATE = 'rate'
+
+MemberRequest = Callable[[IB, int], None]
+
+
+class _Member(IB):
+    def __init__(self, pool: 'IBPool', client_id: int, host: str, port: int):
+        IB.__init__(self, client_id=client_id, host=host, port=port)
+        self.pool = pool
+        self.shards: Dict[int, '_Shard'] = {}
+        self.events = 0
+        self._rate = 0.0
+        self._rate_at = (time.monotonic(), 0)
+        self.run_task: Optional[asyncio.Task] = None
+
+    def rate(self) -> float:
+        """ Messages/sec of the member's subscriptions, over the last second at least """
+        now = time.monotonic()
+        at, events = self._rate_at
+        if now - at >= 1.0:
+            self._rate = (self.events - events) / (now - at)
+            self._rate_at = (now, self.events)
+        return self._rate
+
+    def connectionClosed(self):
+        IB.connectionClosed(self)
+        self.pool._member_closed(self)
+
+    async def a_wait_for_consumer(self):
+        rx_queue = self.pool.rx_queue
+        if rx_queue is not None and rx_queue.full():
+            await rx_queue.wait_for_room()
+
+
+class _Shard(Route):
+    """Route of a pool subscription on its current member"""
+
+    def __init__(self, pool: 'IBPool', subscription: Subscription, request: MemberRequest, cancel: MemberRequest):
+        self.pool = pool
+        self.subscription = subscription
+        self.request = request
+        self.cancel = cancel
+        self.member: Optional[_Member] = None
+        self.req_id: Optional[int] = None
+
+    def put(self, event):
+        # The event was built for this route, no one else holds it
+        event.reqId = self.subscription.req_id
+        self.member.events += 1
+        rx_queue = self.pool.rx_queue
+        if rx_queue is None:
+            self.subscription.put(event)
+        else:
+            rx_queue.put_nowait((self.member.recv_ns, event))
+
+    def warn(self, error: Error):
+        error.reqId = self.subscription.req_id
+        self.subscription.warn(error)
+
+    def end(self):
+        self.pool._forget(self)
+        self.subscription.end()
+
+    def fail(self, exc: BaseException):
+        if isinstance(exc, ConnectionError) and not self.pool.closing:
+            # Moved to another member by _member_closed
+            return
+        self.pool._forget(self)
+        self.subscription.fail(exc)
+
+
+class IBPool:
+    def __init__(self, host: str = '127.0.0.1', port: int = 7497, client_ids: Sequence[int] = (1, 2, 3),
+                 balance: str = COUNT, max_subscriptions: Optional[int] = None, merged: bool = False,
+                 rx_queue_size: int = 0, rx_queue_policy: str = BLOCK):
+        if balance not in (COUNT, RATE):
+            raise ValueError(f'balance must be {COUNT} or {RATE}')
+        self.host = host
+        self.port = port
+        self.balance = balance
+        # Subscriptions per member, e.g. the tick-by-tick lines of a connection
+        self.max_subscriptions = max_subscriptions
+        self.members: List[_Member] = [_Member(self, client_id, host, port) for client_id in client_ids]
+        # Events of all the pool subscriptions instead of their Subscriptions, merged only
+        self.rx_queue: Optional[BoundedQueue] = \
+            BoundedQueue(rx_queue_size, rx_queue_policy, event_key) if merged else None
+        self.closing = False
+        self._req_id = 1
+        self._shards: Dict[int, _Shard] = {}
+
+    async def connect(self, timeout: float = 10.0):
+        """ Connect every member and wait for their nextValidId """
+        self.closing = False
+        await asyncio.gather(*(self._a_connect_member(m, timeout) for m in self.members))
+        if not self.connected():
+            raise ConnectionError(f'No member of the pool connected to {self.host}:{self.port}')
+
+    async def _a_connect_member(self, member: _Member, timeout: float):
+        await member.connect(self.host, self.port, member.ib_client_id)
+        if not member.isConnected():
+            logger.warning('client id %d could not connect', member.ib_client_id)
+            return
+        member.run_task = asyncio.ensure_future(member.run())
+        try:
+            await member.a_wait_ready(timeout)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.warning('client id %d not ready: %s', member.ib_client_id, e)
+
+    async def disconnect(self):
+        self.closing = True
+        for member in self.members:
+            if member.isConnected():
+                await member.disconnect()
+            if member.run_task is not None:
+                member.run_task.cancel()
+                member.run_task = None
+
+    def connected(self) -> List[IB]:
+        return [m for m in self.members if m.isConnected() and m.ready]
+
+    def load(self, member: IB) -> float:
+        return member.rate() if self.balance == RATE else len(member.shards)
+
+    def member(self) -> IB:
+        """ Least loaded connected member, also for requests that are not subscriptions """
+        members = [m for m in self.connected()
+                   if self.max_subscriptions is None or len(m.shards) < self.max_subscriptions]
+        if not members:
+            raise ConnectionError('No pool member connected or with room for a subscription')
+        return min(members, key=self.load)
+
+    ####################################################################################################################
+
+    def _place(self, shard: _Shard, member: _Member):
+        shard.member = member
+        shard.req_id = member._new_req_id()
+        member.shards[shard.req_id] = shard
+        member._routes[shard.req_id] = shard
+        shard.request(member, shard.req_id)
+
+    def _forget(self, shard: _Shard):
+        self._shards.pop(shard.subscription.req_id, None)
+        if shard.member is not None:
+            shard.member.shards.pop(shard.req_id, None)
+            shard.member._routes.pop(shard.req_id, None)
+
+    def _cancel(self, pool_req_id: int):
+        shard = self._shards.get(pool_req_id)
+        if shard is None:
+            return
+        self._forget(shard)
+        if shard.member.isConnected():
+            shard.cancel(shard.member, shard.req_id)
+
+    def _member_closed(self, member: _Member):
+        if member.run_task is not None:
+            member.run_task.cancel()
+            member.run_task = None
+        shards = list(member.shards.values())
+        member.shards.clear()
+        if self.closing:
+            return
+        logger.warning('client id %d disconnected, moving %d subscriptions', member.ib_client_id, len(shards))
+        for shard in shards:
+            try:
+                self._place(shard, self.member())
+            except ConnectionError as e:
+                self._forget(shard)
+                shard.subscription.fail(e)
+
+    def _subscribe(self, request: MemberRequest, cancel: MemberRequest) -> Subscription:
+        member = self.member()
+        subscription = Subscription(self._req_id, cancel=self._cancel)
+        self._req_id += 1
+        shard = _Shard(self, subscription, request, cancel)
+        self._shards[subscription.req_id] = shard
+        self._place(shard, member)
+        return subscription
+
+    ####################################################################################################################
+
+    def subscribe_mkt_data(self, contract: Contract, genericTickList: str = '',
+                           mktDataOptions: Optional[list] = None) -> Subscription:
+        return self._subscribe(
+            lambda ib, req_id: ib.reqMktData(req_id, contract, genericTickList, False, False, mktDataOptions or []),
+            lambda ib, req_id: ib.cancelMktData(req_id))
+
+    def subscribe_tick_by_tick_data(self, contract: Contract, tickType: str, ignoreSize: bool = False) -> Subscription:
+        return self._subscribe(
+            lambda ib, req_id: ib.reqTickByTickData(req_id, contract, tickType, 0, ignoreSize),
+            lambda ib, req_id: ib.cancelTickByTickData(req_id))
+
+    def subscribe_mkt_depth(self, contract: Contract, numRows: int, isSmartDepth: bool,
+                            mktDepthOptions: Optional[list] = None) -> Subscription:
+        return self._subscribe(
+            lambda ib, req_id: ib.reqMktDepth(req_id, contract, numRows, isSmartDepth, mktDepthOptions or []),
+            lambda ib, req_id: ib.cancelMktDepth(req_id, isSmartDepth))
+
+    def subscribe_real_time_bars(self, contract: Contract, barSize: int, whatToShow: str, useRTH: bool,
+                                 realTimeBarsOptions: Optional[list] = None) -> Subscription:
+        return self._subscribe(
+            lambda ib, req_id: ib.reqRealTimeBars(req_id, contract, barSize, whatToShow, useRTH,
+                                                  realTimeBarsOptions or []),
+            lambda ib, req_id: ib.cancelRealTimeBars(req_id))
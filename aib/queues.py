@@ -0,0 +1,265 @@
+"""
+Bounded queues with an overflow policy for AsyncRxClient.msg_queue and ConvenientIB.rx_queue.
+
+- block: producers pause once the queue is full. The reader stops reading the
+  socket and run() stops decoding until the consumer catches up. Wrapper
+  callbacks put synchronously and are never refused, so the queue may exceed
+  maxsize by the events of one batch.
+- drop_oldest: the oldest queued quote is dropped to make room for the new item.
+- conflate: a quote whose key is already queued replaces it in place, so only
+  the newest quote per (reqId, event type) is kept. Otherwise as drop_oldest.
+
+Only the items the key function gives a key, quotes, are ever dropped or
+conflated. Order status, executions, errors, ...End markers and the like are
+state a client cannot recover, so they are always queued: when the queue is
+full of them drop_oldest and conflate block as block does.
+
+dropped and conflated count the items lost to each policy. instrument()
+records the dwell time of the items, see aib.metrics.
+"""
+
+
+import time
+import asyncio
+
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from ibapi.message import IN
+
+from aib.metrics import Histogram
+from aib.objects import Snap, MidPoint, TickPrice, TickSize, TickGeneric, TickOptionComputation, PnL, PnLSingle
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+CONFLATE = 'conflate'
+POLICIES = (BLOCK, DROP_OLDEST, CONFLATE)
+
+QueueKey = Callable[[Any], Optional[Hashable]]
+
+_DROPPED = object()
+
+
+class _Slot:
+    """ A queued quote, item is _DROPPED once it has been dropped """
+    __slots__ = ('key', 'item')
+
+    def __init__(self, key: Hashable, item: Any):
+        self.key = key
+        self.item = item
+
+
+class BoundedQueue:
+    def __init__(self, maxsize: int = 0, policy: str = BLOCK, key: Optional[QueueKey] = None):
+        """ Unbounded when maxsize <= 0. key gives the key of the items drop_oldest and conflate may drop, None for
+        the others; block ignores it """
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown queue policy {policy}, expected one of {POLICIES}')
+        if policy != BLOCK and key is None:
+            raise ValueError(f'{policy} needs a key function')
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key if policy != BLOCK else None
+        self.dropped = 0
+        self.conflated = 0
+        # Items and slots in order, dropped slots stay until taken or compacted
+        self._queue = deque()
+        self._size = 0
+        # Queued slots in order, and by key for conflate
+        self._keyed: deque = deque()
+        self._slots: Dict[Hashable, _Slot] = {}
+        self._getters: deque = deque()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._dwell: Optional[Histogram] = None
+        self._age: Optional[Histogram] = None
+        self._stamp: Optional[Callable[[Any], int]] = None
+        # perf_counter_ns() of the entries of _queue while instrumented
+        self._put_ns: Optional[deque] = None
+
+    def instrument(self, dwell: Histogram, age: Optional[Histogram] = None,
+                   stamp: Optional[Callable[[Any], int]] = None):
+        """ Record the time items spend in the queue to dwell, and their age when taken, perf_counter_ns() minus
+        stamp(item), to age; items stamped None are not aged """
+        self._dwell = dwell
+        self._age = age
+        self._stamp = stamp
+        now = time.perf_counter_ns()
+        self._put_ns = deque(now for _ in range(len(self._queue)))
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return not self._size
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= self._size
+
+    ####################################################################################################################
+
+    def put_nowait(self, item: Any):
+        """ Never refuses an item, see wait_for_room() """
+        key = self.key
+        if key is not None:
+            k = key(item)
+            if k is not None:
+                if self.policy == CONFLATE:
+                    slot = self._slots.get(k)
+                    if slot is not None:
+                        slot.item = item
+                        self.conflated += 1
+                        return
+                    slot = self._slots[k] = _Slot(k, item)
+                else:
+                    slot = _Slot(k, item)
+                if self.full():
+                    self._drop_oldest()
+                self._keyed.append(slot)
+                self._append(slot)
+                return
+            if self.full():
+                self._drop_oldest()
+        self._append(item)
+
+    async def put(self, item: Any):
+        await self.wait_for_room()
+        self.put_nowait(item)
+
+    def _append(self, entry: Any):
+        self._queue.append(entry)
+        self._size += 1
+        if self._put_ns is not None:
+            self._put_ns.append(time.perf_counter_ns())
+        if self._getters:
+            self._wake_getter()
+
+    def _drop_oldest(self):
+        # Only quotes are dropped, with none queued the item is queued over maxsize
+        if not self._keyed:
+            return
+        slot = self._keyed.popleft()
+        if self.policy == CONFLATE:
+            del self._slots[slot.key]
+        slot.item = _DROPPED
+        self._size -= 1
+        self.dropped += 1
+        if len(self._queue) > 2 * self._size + 64:
+            self._compact()
+
+    def _compact(self):
+        # Remove the dropped slots, which a slow consumer would otherwise let pile up
+        if self._put_ns is None:
+            self._queue = deque(e for e in self._queue if type(e) is not _Slot or e.item is not _DROPPED)
+            return
+        entries = [(e, ns) for e, ns in zip(self._queue, self._put_ns)
+                   if type(e) is not _Slot or e.item is not _DROPPED]
+        self._queue = deque(e for e, _ in entries)
+        self._put_ns = deque(ns for _, ns in entries)
+
+    ####################################################################################################################
+
+    def get_nowait(self) -> Any:
+        queue = self._queue
+        put_ns = self._put_ns
+        while queue:
+            entry = queue.popleft()
+            ns = put_ns.popleft() if put_ns is not None else 0
+            if type(entry) is _Slot:
+                item = entry.item
+                if item is _DROPPED:
+                    continue
+                # Live slots leave in order, the first queued is this one
+                self._keyed.popleft()
+                if self.policy == CONFLATE:
+                    del self._slots[entry.key]
+            else:
+                item = entry
+            self._size -= 1
+            if put_ns is not None:
+                self._record(item, ns)
+            if not self._room.is_set() and self._has_room():
+                self._room.set()
+            return item
+        raise asyncio.QueueEmpty
+
+    async def get(self) -> Any:
+        while not self._size:
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except asyncio.CancelledError:
+                if getter.done() and self._size:
+                    # Woken and cancelled: pass the wake-up on
+                    self._wake_getter()
+                raise
+        return self.get_nowait()
+
+    def _wake_getter(self):
+        getters = self._getters
+        while getters:
+            getter = getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                return
+
+    def _record(self, item: Any, put_ns: int):
+        now = time.perf_counter_ns()
+        self._dwell.record(now - put_ns)
+        if self._age is not None:
+            stamp = self._stamp(item)
+            if stamp is not None:
+                self._age.record(now - stamp)
+
+    ####################################################################################################################
+
+    def _has_room(self) -> bool:
+        # Queued quotes can be dropped to make room, except under block
+        n = self._size if self.policy == BLOCK else self._size - len(self._keyed)
+        return n < self.maxsize
+
+    async def wait_for_room(self):
+        """ Wait until a put would not exceed maxsize: under drop_oldest and conflate, until the items that are not
+        dropped leave room """
+        if self.maxsize <= 0:
+            return
+        while not self._has_room():
+            self._room.clear()
+            await self._room.wait()
+
+
+_TICK_PRICE = b"%d\0" % IN.TICK_PRICE
+_TICK_SIZE = b"%d\0" % IN.TICK_SIZE
+_TICK_BY_TICK = b"%d\0" % IN.TICK_BY_TICK
+
+
+def frame_key(item: Tuple[int, bytes]) -> Optional[Hashable]:
+    """ Conflation key of a (recv_ns, frame) of msg_queue: tick price/size by (reqId, tickType), tick-by-tick bid/ask
+    and midpoint by reqId """
+    frame = item[1]
+    if frame.startswith(_TICK_PRICE) or frame.startswith(_TICK_SIZE):
+        fields = frame.split(b"\0", 4)
+        if len(fields) == 5:
+            return fields[0], fields[2], fields[3]
+    if frame.startswith(_TICK_BY_TICK):
+        fields = frame.split(b"\0", 3)
+        # Trades are events, not state: Last and AllLast are never conflated
+        if len(fields) == 4 and (fields[2] == b"3" or fields[2] == b"4"):
+            return fields[0], fields[1], fields[2]
+    return None
+
+
+_BY_REQ_ID = frozenset([Snap, MidPoint, PnL, PnLSingle])
+_BY_TICK_TYPE = frozenset([TickPrice, TickSize, TickGeneric, TickOptionComputation])
+
+
+def event_key(item: tuple) -> Optional[Hashable]:
+    """ Conflation key of a (recv_ns, event) of ConvenientIB.rx_queue, quotes only """
+    e = item[1]
+    t = type(e)
+    if t in _BY_REQ_ID:
+        return t, e.reqId
+    if t in _BY_TICK_TYPE:
+        return t, e.reqId, e.tickType
+    return None
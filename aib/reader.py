@@ -12,49 +12,135 @@ remove the size prefix and put the rest in a Queue.
 """
 
 
+import time
 import logging
 
-from ibapi import comm
+from struct import Struct
+from typing import List, Optional
 from asyncio import CancelledError, Queue, all_tasks, current_task
 
+from aib.capture import CaptureWriter
+from aib.metrics import Metrics
+from aib.queues import BoundedQueue
+
 logger = logging.getLogger(__name__)
 
+_size_prefix = Struct("!I")
+
+# time_ns() - perf_counter_ns() at import, see epoch_time()
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+
+def epoch_time(recv_ns: int) -> float:
+    """ Seconds since the epoch of a perf_counter_ns() receive time """
+    return (recv_ns + _EPOCH_OFFSET_NS) / 1e9
+
+
+class FrameBuffer:
+    """
+    Receive buffer for length prefixed frames.
+
+    Data is appended at the tail of a preallocated bytearray and frames are cut
+    from the head by offset, so the unread rest of the buffer is never copied.
+    The head is compacted only once the tail runs out of space.
+    """
+
+    def __init__(self, size: int = 4096):
+        self._buf = bytearray(size)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def extend(self, data: bytes):
+        n = len(data)
+        if self._end + n > len(self._buf):
+            self._make_room(n)
+        self._buf[self._end:self._end + n] = data
+        self._end += n
+
+    def _make_room(self, n: int):
+        pending = self._end - self._start
+        if pending + n > len(self._buf):
+            buf = bytearray(max(2 * len(self._buf), pending + n))
+            buf[:pending] = self._buf[self._start:self._end]
+            self._buf = buf
+        elif pending:
+            # Only a partial frame is left over at this point
+            self._buf[:pending] = self._buf[self._start:self._end]
+        self._start = 0
+        self._end = pending
+
+    def pop_frames(self) -> List[bytes]:
+        frames = []
+        buf = self._buf
+        pos = self._start
+        end = self._end
+        unpack_from = _size_prefix.unpack_from
+        with memoryview(buf) as view:
+            while end - pos >= 4:
+                size = unpack_from(buf, pos)[0]
+                frame_end = pos + 4 + size
+                if frame_end > end:
+                    break
+                frames.append(bytes(view[pos + 4:frame_end]))
+                pos = frame_end
+        if pos == end:
+            self._start = self._end = 0
+        else:
+            self._start = pos
+        return frames
+
 
 class EReader:
-    def __init__(self, conn, msg_queue: Queue):
+    def __init__(self, conn, msg_queue: BoundedQueue):
         super().__init__()
         self.conn = conn
         self.msg_queue = msg_queue
+        self.frame_buffer = FrameBuffer(2 * conn.read_size)
+        # Records every inbound frame when set
+        self.capture: Optional[CaptureWriter] = None
+        # Counts the bytes and frames read when set
+        self.metrics: Optional[Metrics] = None
 
     async def run(self):
         # TODO: Check error handling for CancelledError & RuntimeError
         try:
             logger.debug("EReader thread started")
-            buf = b""
+            frame_buffer = self.frame_buffer
             while self.conn.isConnected():
 
                 data = await self.conn.recvMsg()
-                if data is None:
-                    # Connection closed:
+                if not data:
+                    # Connection closed, b"" once the peer closed the socket:
                     return
                 logger.debug("reader loop, recvd size %d", len(data))
-                buf += data
-
-                while len(buf) > 0:
-                    (size, msg, buf) = comm.read_msg(buf)
-                    #logger.debug("resp %s", buf.decode('ascii'))
-                    logger.debug("size:%d msg.size:%d msg:|%s| buf:%s|", size,
-                        len(msg), buf, "|")
+                # Monotonic receive time of every frame of the read, see AsyncRxClient.recv_ns
+                recv_ns = time.perf_counter_ns()
+                frame_buffer.extend(data)
 
-                    if msg:
-                        # self.msg_queue.put(msg)
-                        self.msg_queue.put_nowait(msg)
-                    else:
-                        logger.debug("more incoming packet(s) are needed ")
-                        break
+                capture = self.capture
+                if capture is not None:
+                    capture_ns = time.time_ns()
+                frames = frame_buffer.pop_frames()
+                metrics = self.metrics
+                if metrics is not None:
+                    metrics.counters['bytes_read'] += len(data)
+                    metrics.counters['frames_read'] += len(frames)
+                for msg in frames:
+                    if capture is not None:
+                        capture.write(capture_ns, msg)
+                    # self.msg_queue.put(msg)
+                    self.msg_queue.put_nowait((recv_ns, msg))
+                if self.msg_queue.full():
+                    # Stop reading, TCP flow control then pushes back on TWS
+                    await self.msg_queue.wait_for_room()
+                if len(frame_buffer) > 0:
+                    logger.debug("more incoming packet(s) are needed ")
 
             logger.debug("EReader thread finished")
         except CancelledError as e:
             logger.exception('EReader.run() exiting ...')
         except RuntimeError as e2:
-            logger.exception('unhandled exception in EReader thread')
\ No newline at end of file
+            logger.exception('unhandled exception in EReader thread')
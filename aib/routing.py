@@ -0,0 +1,129 @@
+import asyncio
+
+from typing import Any, Callable, List, Optional
+
+from aib.objects import Error
+
+# Error codes that are informational and do not end a request
+WARNING_CODES = frozenset(list(range(2100, 2200)) + [10167, 10197])
+# Market depth data has been RESET: TWS sends the book of the request again
+DEPTH_RESET = 317
+
+
+class RequestError(Exception):
+    def __init__(self, error: Error):
+        super().__init__(f'[{error.reqId}] {error.errorCode}: {error.errorString}')
+        self.error = error
+
+
+class Route:
+    """Receives the events of one reqId, see IB._routes"""
+
+    def put(self, event: Any):
+        raise NotImplementedError
+
+    def end(self):
+        raise NotImplementedError
+
+    def fail(self, exc: BaseException):
+        raise NotImplementedError
+
+    def warn(self, error: Error):
+        pass
+
+    def reset(self, error: Error):
+        """ TWS reset the market depth of the request (DEPTH_RESET), the stream goes on """
+        self.warn(error)
+
+    def resume(self, req_id: int):
+        """ The stream was requested again under req_id after a reconnect, see IB.a_supervise() """
+        pass
+
+
+class DepthSink(Route):
+    """Route that takes the market depth updates of its reqId as plain values, without event objects"""
+
+    def update(self, position: int, operation: int, side: int, price: float, size: float, marketMaker: str = ''):
+        raise NotImplementedError
+
+    def put(self, event: Any):
+        self.update(event.position, event.operation, event.side, event.price, float(event.size),
+                    getattr(event, 'marketMaker', ''))
+
+
+class Request(Route):
+    """Collects the events of a request until its end event arrives"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def put(self, event: Any):
+        self.items.append(event)
+
+    def end(self):
+        if not self.future.done():
+            self.future.set_result(self.items)
+
+    def fail(self, exc: BaseException):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+    async def result(self, timeout: Optional[float] = None) -> List[Any]:
+        return await asyncio.wait_for(self.future, timeout)
+
+
+_END = object()
+
+
+class Subscription(Route):
+    """
+    Async iterator over the events of a streaming request.
+
+    Iteration stops when the stream ends or is cancelled and raises
+    RequestError if TWS rejects the request.
+    """
+
+    def __init__(self, req_id: int, cancel: Optional[Callable[[int], None]] = None):
+        self.req_id = req_id
+        self._cancel = cancel
+        self._queue = asyncio.Queue()
+        self.done = False
+
+    def put(self, event: Any):
+        self._queue.put_nowait(event)
+
+    def warn(self, error: Error):
+        self._queue.put_nowait(error)
+
+    def end(self):
+        if not self.done:
+            self.done = True
+            self._queue.put_nowait(_END)
+
+    def fail(self, exc: BaseException):
+        if not self.done:
+            self.done = True
+            self._queue.put_nowait(exc)
+
+    def resume(self, req_id: int):
+        self.req_id = req_id
+
+    def cancel(self):
+        """ Cancel the request at TWS and stop the iteration """
+        if not self.done and self._cancel is not None:
+            self._cancel(self.req_id)
+        self.end()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self._queue.get()
+        if item is _END:
+            self._queue.put_nowait(_END)
+            raise StopAsyncIteration
+        if isinstance(item, BaseException):
+            self._queue.put_nowait(_END)
+            raise item
+        return item
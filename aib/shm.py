@@ -0,0 +1,522 @@
+"""
+Fan-out of one client's market data and order events to other processes through shared memory.
+
+One process owns the IB connection and runs a ShmBroadcaster. The streams it
+subscribes (for itself or for the readers) write fixed size records of
+RECORD_DTYPE to a ring in shared memory, without building event objects:
+
+- seq is the record's sequence number, 1 for the first record
+- kind is one of the record kinds below, stream the stream id returned by
+  the subscribe call (the orderId for ORDER_STATUS, the reqId for ERROR)
+- recv_ns is the receive time of the message in the owner, see
+  AsyncRxClient.recv_ns (perf_counter clocks are per machine, not per process)
+- code, time and f0..f3 hold the values of the kind, see the writers of
+  _RingRoute and _RingTicks
+
+Any number of ShmReaders map the ring by name and read it without locks.
+The single writer fills a record before it publishes its seq in the header,
+and a reader returns NumPy views of the records published since its last
+poll, so nothing is copied. A reader more than capacity records behind has
+lost the oldest ones: poll() skips them and counts them in lost. A view
+aliases the ring, so use it or copy it before the writer laps it.
+
+Readers send their requests to the owner over a Unix socket with ShmClient,
+as one JSON object per line. Contracts and orders are sent as their scalar
+attributes. The streams of a client connection are cancelled when it
+disconnects. Market makers of smart depth, tick strings, option computations
+and messages of other requests are not broadcast.
+
+Requires numpy (pip install aib[numpy]).
+"""
+
+
+import os
+import sys
+import json
+import struct
+import asyncio
+import logging
+
+from decimal import Decimal
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Set
+
+import numpy as np
+
+from ibapi.contract import Contract
+from ibapi.order import Order
+
+from aib.decoder import TickSink
+from aib.objects import Error, TickPrice, TickSize, TickGeneric
+from aib.orders import TrackedOrder
+from aib.routing import DepthSink, RequestError
+
+if TYPE_CHECKING:
+    from aib.aibrx import IB
+
+logger = logging.getLogger(__name__)
+
+RECORD_DTYPE = np.dtype([('seq', '<u8'), ('kind', '<u2'), ('code', '<i2'), ('stream', '<i4'),
+                         ('recv_ns', '<i8'), ('time', '<i8'),
+                         ('f0', '<f8'), ('f1', '<f8'), ('f2', '<f8'), ('f3', '<f8')])
+
+# Record kinds and their fields
+BID_ASK = 1         # time, f0 bid, f1 ask, f2 bid size, f3 ask size, code attribute mask
+LAST = 2            # time, f0 price, f1 size, code tickType << 8 | attribute mask
+MID_POINT = 3       # time, f0 mid point
+TICK_PRICE = 4      # code tickType, f0 price
+TICK_SIZE = 5       # code tickType, f1 size
+TICK_GENERIC = 6    # code tickType, f0 value
+DEPTH = 7           # code position, time operation << 1 | side, f0 price, f1 size
+ORDER_STATUS = 8    # stream orderId, time permId, code index in STATUSES, f0 filled, f1 remaining,
+                    # f2 avgFillPrice, f3 lastFillPrice
+ERROR = 9           # stream reqId, time errorCode, an END follows
+END = 10            # the stream ended
+DEPTH_RESET = 11    # TWS reset the book of a depth stream and sends it again, clear the rows
+
+STATUSES = ('', 'PendingSubmit', 'PendingCancel', 'PreSubmitted', 'Submitted', 'ApiPending',
+            'ApiCancelled', 'Cancelled', 'Filled', 'Inactive')
+_STATUS_CODES = {status: i for i, status in enumerate(STATUSES)}
+
+_MAGIC = 0x41494252
+_HEADER = struct.Struct('<IIQQ')   # magic, record size, capacity, last published seq
+_HEADER_SIZE = 64
+_SEQ = struct.Struct('<Q')
+_PAYLOAD = struct.Struct('<Hhiqqdddd')
+
+assert _SEQ.size + _PAYLOAD.size == RECORD_DTYPE.itemsize
+
+
+class ShmRing:
+    def __init__(self, shm: SharedMemory, capacity: int):
+        self.shm = shm
+        self.name = shm.name
+        self.capacity = capacity
+        self.records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=shm.buf, offset=_HEADER_SIZE)
+        # Last published seq, read and written as one aligned 8 byte word
+        self._published = np.ndarray((1,), dtype='<u8', buffer=shm.buf, offset=16)
+
+    @property
+    def seq(self) -> int:
+        return int(self._published[0])
+
+    def close(self):
+        # The views must be gone before the mapping is closed
+        del self.records, self._published
+        self.shm.close()
+
+
+class ShmWriter(ShmRing):
+    def __init__(self, capacity: int = 1 << 16, name: Optional[str] = None):
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError('capacity must be a power of two')
+        shm = SharedMemory(name, create=True, size=_HEADER_SIZE + capacity * RECORD_DTYPE.itemsize)
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, RECORD_DTYPE.itemsize, capacity, 0)
+        super().__init__(shm, capacity)
+        self._buf = shm.buf
+        self._mask = capacity - 1
+        self._seq = 0
+
+    def write(self, kind: int, stream: int, recv_ns: int, code: int = 0, time: int = 0,
+              f0: float = 0.0, f1: float = 0.0, f2: float = 0.0, f3: float = 0.0):
+        seq = self._seq + 1
+        offset = _HEADER_SIZE + ((seq - 1) & self._mask) * RECORD_DTYPE.itemsize
+        buf = self._buf
+        _PAYLOAD.pack_into(buf, offset + 8, kind, code, stream, recv_ns, time, f0, f1, f2, f3)
+        # The record's seq, then the header's, so a reader never sees a published record half written
+        _SEQ.pack_into(buf, offset, seq)
+        _SEQ.pack_into(buf, 16, seq)
+        self._seq = seq
+
+    def close(self):
+        del self._buf
+        super().close()
+        self.shm.unlink()
+
+
+def _attach(name: str) -> SharedMemory:
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name, track=False)
+    # Before 3.13 an attached segment is registered with the resource tracker, which unlinks it when this process
+    # exits. Unregistering it instead would break the creator's registration when the tracker is shared.
+    register = resource_tracker.register
+    resource_tracker.register = lambda n, rtype: None if rtype == 'shared_memory' else register(n, rtype)
+    try:
+        return SharedMemory(name)
+    finally:
+        resource_tracker.register = register
+
+
+class ShmReader(ShmRing):
+    def __init__(self, name: str):
+        shm = _attach(name)
+        magic, record_size, capacity, _ = _HEADER.unpack_from(shm.buf, 0)
+        if magic != _MAGIC or record_size != RECORD_DTYPE.itemsize:
+            shm.close()
+            raise ValueError(f'{name} is not an aib ring')
+        super().__init__(shm, capacity)
+        # Records published before the reader attached are skipped
+        self.next_seq = self.seq + 1
+        # Records overwritten before they were read
+        self.lost = 0
+
+    def poll(self, max_records: Optional[int] = None) -> np.ndarray:
+        """ View of the records published since the last poll, oldest first.
+        Stops at the end of the ring, the next poll returns the rest. """
+        last = self.seq
+        next_seq = self.next_seq
+        if last < next_seq:
+            return self.records[:0]
+        capacity = self.capacity
+        # The writer may be filling the slot of last + 1, which is the slot of last + 1 - capacity
+        oldest = last - capacity + 2
+        if next_seq < oldest:
+            self.lost += oldest - next_seq
+            next_seq = oldest
+        start = (next_seq - 1) & (capacity - 1)
+        n = min(last - next_seq + 1, capacity - start)
+        if max_records is not None:
+            n = min(n, max_records)
+        view = self.records[start:start + n]
+        if view['seq'][0] != next_seq:
+            # Lapped while reading the header
+            self.next_seq = next_seq
+            return self.poll(max_records)
+        self.next_seq = next_seq + n
+        return view
+
+    async def a_poll(self, max_records: Optional[int] = None, interval: float = 0.0005) -> np.ndarray:
+        """ Wait for records, checking the ring every interval seconds """
+        while True:
+            view = self.poll(max_records)
+            if len(view):
+                return view
+            await asyncio.sleep(interval)
+
+
+########################################################################################################################
+# Sinks of the broadcast streams, they write records instead of events
+
+
+class _RingRoute(DepthSink):
+    """Route of a market data or market depth stream"""
+
+    def __init__(self, broadcaster: 'ShmBroadcaster', stream: int):
+        self.broadcaster = broadcaster
+        self.ring = broadcaster.ring
+        self.ib = broadcaster.ib
+        # The reqId changes after a reconnect, the stream id does not
+        self.stream = stream
+        self.req_id = stream
+
+    def put(self, event: Any):
+        ib = self.ib
+        event_type = type(event)
+        if event_type is TickPrice:
+            self.ring.write(TICK_PRICE, self.stream, ib.recv_ns, event.tickType, f0=event.price)
+        elif event_type is TickSize:
+            self.ring.write(TICK_SIZE, self.stream, ib.recv_ns, event.tickType, f1=_float(event.size))
+        elif event_type is TickGeneric:
+            self.ring.write(TICK_GENERIC, self.stream, ib.recv_ns, event.tickType, f0=event.value)
+
+    def update(self, position: int, operation: int, side: int, price: float, size: float, marketMaker: str = ''):
+        self.ring.write(DEPTH, self.stream, self.ib.recv_ns, position, operation << 1 | side, price, size)
+
+    def end(self):
+        self.broadcaster._ended(self.stream)
+
+    def fail(self, exc: BaseException):
+        if isinstance(exc, RequestError):
+            self.ring.write(ERROR, self.stream, self.ib.recv_ns, time=exc.error.errorCode)
+        self.broadcaster._ended(self.stream)
+
+    def reset(self, error: Error):
+        self.ring.write(DEPTH_RESET, self.stream, self.ib.recv_ns)
+
+    def resume(self, req_id: int):
+        self.req_id = req_id
+
+
+class _RingTicks(TickSink):
+    """Tick sink of a tick-by-tick stream"""
+
+    def __init__(self, broadcaster: 'ShmBroadcaster', stream: int):
+        self.broadcaster = broadcaster
+        self.ring = broadcaster.ring
+        self.ib = broadcaster.ib
+        self.stream = stream
+        self.req_id = stream
+
+    def on_bid_ask(self, time: int, bidPrice: float, askPrice: float,
+                   bidSize: float, askSize: float, mask: int):
+        self.ring.write(BID_ASK, self.stream, self.ib.recv_ns, mask, time, bidPrice, askPrice, bidSize, askSize)
+
+    def on_last(self, tickType: int, time: int, price: float, size: float, mask: int,
+                exchange: str, specialConditions: str):
+        self.ring.write(LAST, self.stream, self.ib.recv_ns, tickType << 8 | mask, time, price, size)
+
+    def on_mid_point(self, time: int, midPoint: float):
+        self.ring.write(MID_POINT, self.stream, self.ib.recv_ns, 0, time, midPoint)
+
+    def fail(self, exc: BaseException):
+        if isinstance(exc, RequestError):
+            self.ring.write(ERROR, self.stream, self.ib.recv_ns, time=exc.error.errorCode)
+        self.broadcaster._ended(self.stream)
+
+
+def _float(size) -> float:
+    try:
+        return float(size)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+########################################################################################################################
+# Contracts and orders on the request channel
+
+
+def to_json(obj: Any) -> Dict[str, Any]:
+    """ Scalar attributes of a Contract or an Order """
+    out = {}
+    for k, v in vars(obj).items():
+        if isinstance(v, Decimal):
+            out[k] = str(v)
+        elif isinstance(v, (str, int, float, bool)):
+            out[k] = v
+    return out
+
+
+def from_json(cls, d: Dict[str, Any]):
+    obj = cls()
+    defaults = vars(obj)
+    for k, v in d.items():
+        default = defaults.get(k)
+        if default is None and k not in defaults:
+            continue
+        if isinstance(default, Decimal):
+            v = Decimal(v)
+        elif isinstance(default, bool):
+            v = bool(v)
+        elif isinstance(default, float):
+            v = float(v)
+        setattr(obj, k, v)
+    return obj
+
+
+########################################################################################################################
+
+
+class ShmBroadcaster:
+    def __init__(self, ib: 'IB', path: str, capacity: int = 1 << 16, name: Optional[str] = None):
+        """ Serves the requests of the readers on the Unix socket at path """
+        self.ib = ib
+        self.path = path
+        self.ring = ShmWriter(capacity, name)
+        self._sinks: Dict[int, Any] = {}
+        self._cancels: Dict[int, Callable[[], None]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+        ib.orders.listeners.append(self._order_status)
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve, self.path)
+        os.chmod(self.path, 0o600)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in list(self._connections):
+            task.cancel()
+        for stream in list(self._cancels):
+            self.cancel(stream)
+        if self._order_status in self.ib.orders.listeners:
+            self.ib.orders.listeners.remove(self._order_status)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.ring.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    ####################################################################################################################
+    # Streams, their ids are the reqIds of the first request
+
+    def _route(self, request: Callable[[int], None], cancel: Callable[[int], None]) -> int:
+        ib = self.ib
+        if not ib.isConnected():
+            raise ConnectionError('Not connected to TWS')
+        stream = ib._new_req_id()
+        route = _RingRoute(self, stream)
+        ib._routes[stream] = route
+        ib._streams[route] = request
+        self._sinks[stream] = route
+        self._cancels[stream] = lambda: ib._cancel_route(route.req_id, cancel, route)
+        request(stream)
+        return stream
+
+    def subscribe_mkt_data(self, contract: Contract, genericTickList: str = '') -> int:
+        return self._route(lambda req_id: self.ib.reqMktData(req_id, contract, genericTickList, False, False, []),
+                           self.ib.cancelMktData)
+
+    def subscribe_mkt_depth(self, contract: Contract, numRows: int = 10, isSmartDepth: bool = False) -> int:
+        return self._route(lambda req_id: self.ib.reqMktDepth(req_id, contract, numRows, isSmartDepth, []),
+                           lambda req_id: self.ib.cancelMktDepth(req_id, isSmartDepth))
+
+    def subscribe_tick_by_tick_data(self, contract: Contract, tickType: str, ignoreSize: bool = False) -> int:
+        ib = self.ib
+        if not ib.isConnected():
+            raise ConnectionError('Not connected to TWS')
+        stream = ib._new_req_id()
+        sink = _RingTicks(self, stream)
+        ib.tick_sinks[stream] = sink
+        ib._streams[sink] = lambda req_id: ib.reqTickByTickData(req_id, contract, tickType, 0, ignoreSize)
+        self._sinks[stream] = sink
+        self._cancels[stream] = lambda: ib.cancel_tick_by_tick_buffer(sink)
+        ib.reqTickByTickData(stream, contract, tickType, 0, ignoreSize)
+        return stream
+
+    def cancel(self, stream: int):
+        cancel = self._cancels.get(stream)
+        if cancel is not None:
+            cancel()
+            self._ended(stream)
+
+    def _ended(self, stream: int):
+        if self._sinks.pop(stream, None) is not None:
+            self._cancels.pop(stream, None)
+            self.ring.write(END, stream, self.ib.recv_ns)
+
+    def place_order(self, contract: Contract, order: Order) -> int:
+        return self.ib.place_order(contract, order).orderId
+
+    def cancel_order(self, orderId: int):
+        self.ib.cancelOrder(orderId, '')
+
+    def _order_status(self, order: TrackedOrder):
+        self.ring.write(ORDER_STATUS, order.orderId, self.ib.recv_ns, _STATUS_CODES.get(order.status, -1),
+                        order.permId, _float(order.filled), _float(order.remaining),
+                        order.avgFillPrice, order.lastFillPrice)
+
+    ####################################################################################################################
+    # Request channel
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        streams: Set[int] = set()
+        try:
+            hello = {'shm': self.ring.name, 'capacity': self.ring.capacity}
+            writer.write(json.dumps(hello).encode() + b'\n')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                try:
+                    result = self._call(request['method'], request.get('args', {}), streams)
+                    reply = {'id': request.get('id'), 'result': result}
+                except Exception as e:
+                    reply = {'id': request.get('id'), 'error': f'{type(e).__name__}: {e}'}
+                writer.write(json.dumps(reply).encode() + b'\n')
+        except (ConnectionError, asyncio.IncompleteReadError, json.JSONDecodeError):
+            pass
+        finally:
+            for stream in streams:
+                self.cancel(stream)
+            writer.close()
+            self._connections.discard(task)
+
+    def _call(self, method: str, args: Dict[str, Any], streams: Set[int]) -> Any:
+        if 'contract' in args:
+            args['contract'] = from_json(Contract, args['contract'])
+        if method == 'subscribe_mkt_data':
+            stream = self.subscribe_mkt_data(**args)
+        elif method == 'subscribe_mkt_depth':
+            stream = self.subscribe_mkt_depth(**args)
+        elif method == 'subscribe_tick_by_tick_data':
+            stream = self.subscribe_tick_by_tick_data(**args)
+        elif method == 'cancel':
+            streams.discard(args['stream'])
+            return self.cancel(args['stream'])
+        elif method == 'place_order':
+            return self.place_order(args['contract'], from_json(Order, args['order']))
+        elif method == 'cancel_order':
+            return self.cancel_order(args['orderId'])
+        else:
+            raise ValueError(f'Unknown method {method}')
+        streams.add(stream)
+        return stream
+
+
+class ShmClient:
+    """Reader process side: requests to the ShmBroadcaster and its ring"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ring: Optional[ShmReader] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._id = 0
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        hello = json.loads(await self._reader.readline())
+        self.ring = ShmReader(hello['shm'])
+
+    async def disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    async def a_call(self, method: str, **args) -> Any:
+        async with self._lock:
+            self._id += 1
+            self._writer.write(json.dumps({'id': self._id, 'method': method, 'args': args}).encode() + b'\n')
+            line = await self._reader.readline()
+        if not line:
+            raise ConnectionError('Broadcaster closed the connection')
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['result']
+
+    async def a_subscribe_mkt_data(self, contract: Contract, genericTickList: str = '') -> int:
+        return await self.a_call('subscribe_mkt_data', contract=to_json(contract), genericTickList=genericTickList)
+
+    async def a_subscribe_mkt_depth(self, contract: Contract, numRows: int = 10, isSmartDepth: bool = False) -> int:
+        return await self.a_call('subscribe_mkt_depth', contract=to_json(contract), numRows=numRows,
+                                 isSmartDepth=isSmartDepth)
+
+    async def a_subscribe_tick_by_tick_data(self, contract: Contract, tickType: str, ignoreSize: bool = False) -> int:
+        return await self.a_call('subscribe_tick_by_tick_data', contract=to_json(contract), tickType=tickType,
+                                 ignoreSize=ignoreSize)
+
+    async def a_cancel(self, stream: int):
+        await self.a_call('cancel', stream=stream)
+
+    async def a_place_order(self, contract: Contract, order: Order) -> int:
+        return await self.a_call('place_order', contract=to_json(contract), order=to_json(order))
+
+    async def a_cancel_order(self, orderId: int):
+        await self.a_call('cancel_order', orderId=orderId)
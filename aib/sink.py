@@ -0,0 +1,368 @@
+"""
+Archive of the events of a client to Parquet or Arrow IPC files, see ArrowSink.
+
+An ArrowSink takes the (recv_ns, event) items of ConvenientIB.rx_queue,
+either from ConvenientWrapper.add_sink(), before any queue policy drops or
+conflates them, or from put() by a consumer of the queue. On the loop put()
+reads the fields of the event into a tuple of plain values and appends it to
+the rows of its event type. The garbage collector untracks such tuples, so
+the rows waiting for the writer do not set off full collections. A batch of
+rows is handed to a writer thread once it has batch_rows rows or every
+flush_interval seconds, and the thread turns it into a typed record batch
+and writes it, so the loop never waits for disk I/O.
+
+- every event type has its own columns: recv_ns, the receive time in
+  perf_counter_ns() as in rx_queue, epoch_ns, the same time in nanoseconds
+  since the epoch (null when recv_ns is 0), then the fields of the event,
+  with the scalar attributes of objects such as Contract, Order or
+  TickAttribBidAsk flattened into "field.attribute" columns. Decimal sizes
+  are float64 with NaN for UNSET_DECIMAL. Fields holding lists or sets are
+  left out
+- the files of an event type are <directory>/<type>/<start>.<parquet|arrow>,
+  one per roll_interval seconds (UTC, aligned to the interval), each batch
+  going to the file of the interval it was handed over in
+- at most max_rows rows wait on the loop or in the thread, further events are
+  dropped and counted in dropped
+
+Building the columns in the thread still holds the GIL, so it takes the work
+off the loop but not off the core. The thread converts _CHUNK rows at a time
+and yields the GIL between them. Tick-by-tick data of a tick sink does not go
+through the wrapper and is not archived.
+
+Requires pyarrow (pip install aib[arrow]).
+"""
+
+
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+
+from dataclasses import fields, is_dataclass
+from decimal import Decimal
+from math import nan
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+from ibapi.common import UNSET_DECIMAL
+
+from aib.reader import _EPOCH_OFFSET_NS
+
+logger = logging.getLogger(__name__)
+
+PARQUET = 'parquet'
+IPC = 'arrow'
+
+_TYPES = {bool: pa.bool_(), int: pa.int64(), float: pa.float64(), str: pa.string(), Decimal: pa.float64()}
+
+# Nesting of the objects flattened into columns, e.g. contractDetails.contract.symbol
+_MAX_DEPTH = 3
+
+_STOP = object()
+
+# Arrow scalars for the compute functions: given a Python scalar, pyarrow tries to import pandas on every call
+_UNSET_FLOAT = pa.scalar(float(UNSET_DECIMAL), pa.float64())
+_NAN = pa.scalar(nan, pa.float64())
+_ZERO_NS = pa.scalar(0, pa.int64())
+_NULL_NS = pa.scalar(None, pa.int64())
+_EPOCH_OFFSET = pa.scalar(_EPOCH_OFFSET_NS, pa.int64())
+
+# Rows converted at a time, each conversion holds the GIL without a break
+_CHUNK = 512
+
+
+def _float(value) -> float:
+    return nan if value is None or value == UNSET_DECIMAL else float(value)
+
+
+def _floats(values: list) -> pa.Array:
+    try:
+        array = pa.array(list(map(float, values)), pa.float64())
+    except TypeError:
+        return pa.array([_float(v) for v in values], pa.float64())
+    return pc.if_else(pc.equal(array, _UNSET_FLOAT), _NAN, array)
+
+
+def _coerce(kind: type, value):
+    if value is None:
+        return None
+    try:
+        return _float(value) if kind is float or kind is Decimal else kind(value)
+    except (TypeError, ValueError, ArithmeticError):
+        return None
+
+
+def _get(getter: attrgetter, event):
+    try:
+        return getter(event)
+    except AttributeError:
+        return None
+
+
+def _attributes(prefix: str, obj, depth: int) -> List[Tuple[str, type]]:
+    columns = []
+    for name, value in vars(obj).items():
+        kind = type(value)
+        if kind in _TYPES:
+            columns.append((prefix + name, kind))
+        elif depth < _MAX_DEPTH and hasattr(value, '__dict__') and not isinstance(value, type):
+            columns.extend(_attributes(f'{prefix}{name}.', value, depth + 1))
+    return columns
+
+
+def _columns(cls: type, event) -> List[Tuple[str, type]]:
+    """ Names and Python types of the columns of an event type, objects are flattened as their defaults are """
+    if not is_dataclass(cls):
+        try:
+            return _attributes('', cls(), 1)
+        except TypeError:
+            return _attributes('', event, 1)
+    columns = []
+    for f in fields(cls):
+        if f.type in _TYPES:
+            columns.append((f.name, f.type))
+        elif isinstance(f.type, type) and f.type not in (list, set, dict, tuple):
+            try:
+                default = f.type()
+            except TypeError:
+                default = getattr(event, f.name)
+            if hasattr(default, '__dict__'):
+                columns.extend(_attributes(f'{f.name}.', default, 1))
+    return columns
+
+
+class _Table:
+    """ Schema of an event type and its open file """
+    __slots__ = ('name', 'columns', 'getters', '_values', 'types', 'schema', 'writer', 'period')
+
+    def __init__(self, cls: type, event):
+        self.name = cls.__name__
+        self.columns = _columns(cls, event)
+        self.getters = [attrgetter(name) for name, _ in self.columns]
+        # All the fields at once; attrgetter of a single name does not return a tuple
+        self._values = attrgetter(*[name for name, _ in self.columns]) if len(self.columns) > 1 else \
+            (lambda event: tuple(getter(event) for getter in self.getters))
+        self.types = [_TYPES[kind] for _, kind in self.columns]
+        self.schema = pa.schema([('recv_ns', pa.int64()), ('epoch_ns', pa.int64())] +
+                                [(name, _TYPES[kind]) for name, kind in self.columns])
+        self.writer = None
+        self.period: Optional[int] = None
+
+    def row(self, item: Tuple[int, Any]) -> tuple:
+        """ recv_ns and the column values of a (recv_ns, event) item """
+        event = item[1]
+        try:
+            return (item[0],) + self._values(event)
+        except AttributeError:
+            # An attribute set to None, e.g. an unset deltaNeutralContract
+            return (item[0],) + tuple(_get(getter, event) for getter in self.getters)
+
+    def table(self, rows: List[tuple]) -> pa.Table:
+        batches = []
+        for i in range(0, len(rows), _CHUNK):
+            batches.append(self.batch(rows[i:i + _CHUNK]))
+            # Hands the GIL to the loop if it waits for it, instead of after the switch interval
+            time.sleep(0)
+        return pa.Table.from_batches(batches, self.schema)
+
+    def batch(self, rows: List[tuple]) -> pa.RecordBatch:
+        recv_ns, *columns = zip(*rows)
+        recv_ns = pa.array(recv_ns, pa.int64())
+        arrays = [recv_ns, pc.if_else(pc.equal(recv_ns, _ZERO_NS), _NULL_NS, pc.add(recv_ns, _EPOCH_OFFSET))]
+        for (_, kind), values, arrow_type in zip(self.columns, columns, self.types):
+            # Sizes are Decimal, also in the fields annotated float
+            if kind is Decimal or (kind is float and values and isinstance(values[0], Decimal)):
+                arrays.append(_floats(values))
+                continue
+            try:
+                arrays.append(pa.array(values, arrow_type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                # e.g. Decimal sizes in a float field, or an attribute that is not of its default's type
+                arrays.append(pa.array([_coerce(kind, v) for v in values], arrow_type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+class _Writer(threading.Thread):
+    def __init__(self, sink: 'ArrowSink'):
+        super().__init__(name='ArrowSink', daemon=True)
+        self.sink = sink
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.tables: Dict[type, _Table] = {}
+
+    def run(self):
+        sink = self.sink
+        poll = min(sink.flush_interval, 1.0)
+        while True:
+            try:
+                item = self.queue.get(timeout=poll)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            if item is not None:
+                cls, wall_time, rows = item
+                try:
+                    self._write(cls, wall_time, rows)
+                except Exception as e:
+                    sink.errors += 1
+                    sink.error = e
+                    logger.exception('%d %s events not written', len(rows), cls.__name__)
+                sink.rows_out += len(rows)
+            self._roll(time.time())
+        for table in self.tables.values():
+            self._close(table)
+
+    def _period(self, wall_time: float) -> int:
+        interval = self.sink.roll_interval
+        return 0 if interval is None else int(wall_time // interval)
+
+    def _write(self, cls: type, wall_time: float, rows: List[tuple]):
+        table = self.tables.get(cls)
+        if table is None:
+            # Created by put() on the loop
+            table = self.tables[cls] = self.sink._tables[cls]
+        data = table.table(rows)
+        period = self._period(wall_time)
+        if table.writer is None or table.period != period:
+            self._close(table)
+            self._open(table, period, wall_time)
+        table.writer.write_table(data)
+
+    def _open(self, table: _Table, period: int, wall_time: float):
+        sink = self.sink
+        start = wall_time if sink.roll_interval is None else period * sink.roll_interval
+        directory = os.path.join(sink.directory, table.name)
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, time.strftime('%Y%m%dT%H%M%S', time.gmtime(start)))
+        # A file of the same interval written by an earlier sink is not overwritten
+        path, n = f'{stem}.{sink.format}', 0
+        while os.path.exists(path):
+            n += 1
+            path = f'{stem}-{n}.{sink.format}'
+        if sink.format == PARQUET:
+            table.writer = pq.ParquetWriter(path, table.schema, compression=sink.compression)
+        else:
+            table.writer = pa.ipc.new_file(path, table.schema)
+        table.period = period
+        sink.files.append(path)
+
+    def _roll(self, wall_time: float):
+        # Files of a past interval are closed even when no new batch arrives
+        if self.sink.roll_interval is None:
+            return
+        period = self._period(wall_time)
+        for table in self.tables.values():
+            if table.writer is not None and table.period != period:
+                self._close(table)
+
+    @staticmethod
+    def _close(table: _Table):
+        if table.writer is not None:
+            table.writer.close()
+            table.writer = None
+
+
+class ArrowSink:
+    def __init__(self, directory: str, format: str = PARQUET, types: Optional[Iterable[type]] = None,
+                 batch_rows: int = 65536, flush_interval: float = 1.0, roll_interval: Optional[float] = 3600.0,
+                 max_rows: int = 1 << 20, compression: str = 'snappy'):
+        """ Archives the events of the types given, or of all types, under directory. roll_interval None
+        writes one file per event type. """
+        if format not in (PARQUET, IPC):
+            raise ValueError(f'format must be {PARQUET} or {IPC}')
+        self.directory = directory
+        self.format = format
+        self.types = None if types is None else frozenset(types)
+        # Rows of a batch, a Parquet row group
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.roll_interval = roll_interval
+        self.max_rows = max_rows
+        self.compression = compression
+        # Rows put and rows written (or failed) by the thread, each counter has a single writer
+        self.rows_in = 0
+        self.rows_out = 0
+        self.dropped = 0
+        self.errors = 0
+        self.error: Optional[Exception] = None
+        # Paths of the files opened, in order
+        self.files: List[str] = []
+        self._rows: Dict[type, List[tuple]] = {}
+        self._tables: Dict[type, _Table] = {}
+        self._writer: Optional[_Writer] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def pending(self) -> int:
+        return self.rows_in - self.rows_out
+
+    def start(self):
+        """ Start the writer thread and the flush timer, on the event loop """
+        if self._writer is None:
+            self._writer = _Writer(self)
+            self._writer.start()
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._on_timer)
+
+    async def stop(self):
+        """ Write the rows put so far and close the files """
+        writer = self._writer
+        if writer is None:
+            return
+        self._writer = None
+        self._timer.cancel()
+        self._timer = None
+        self._flush(writer)
+        writer.queue.put(_STOP)
+        await asyncio.get_running_loop().run_in_executor(None, writer.join)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    ####################################################################################################################
+
+    def put(self, item: Tuple[int, Any]):
+        """ Add a (recv_ns, event) item of rx_queue """
+        cls = type(item[1])
+        rows = self._rows.get(cls)
+        if rows is None:
+            if self.types is not None and cls not in self.types:
+                return
+            self._tables[cls] = _Table(cls, item[1])
+            rows = self._rows[cls] = []
+        if self.rows_in - self.rows_out >= self.max_rows:
+            if not self.dropped:
+                logger.warning('writer behind by %d rows, dropping events', self.max_rows)
+            self.dropped += 1
+            return
+        rows.append(self._tables[cls].row(item))
+        self.rows_in += 1
+        if len(rows) >= self.batch_rows and self._writer is not None:
+            self._rows[cls] = []
+            self._writer.queue.put((cls, time.time(), rows))
+
+    def flush(self):
+        """ Hand the rows put so far to the writer thread """
+        if self._writer is not None:
+            self._flush(self._writer)
+
+    def _flush(self, writer: _Writer):
+        wall_time = time.time()
+        for cls, rows in self._rows.items():
+            if rows:
+                self._rows[cls] = []
+                writer.queue.put((cls, wall_time, rows))
+
+    def _on_timer(self):
+        self.flush()
+        self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._on_timer)
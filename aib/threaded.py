@@ -0,0 +1,194 @@
+"""
+Decoding off the event loop, see AsyncRxClient(decode_thread=True).
+
+After the handshake the client stops reading the socket on the loop and a
+DecodeThread reads a duplicate of it, cuts the frames and decodes them into
+recorded wrapper calls. The calls of every read are queued as one batch. Only
+the first batch queued while the loop is not already draining them costs a
+call_soon_threadsafe (and a wake-up of the loop); the loop then runs the
+batches for at most time_budget seconds before it yields to the other
+callbacks and resumes. The wrapper callbacks run on the loop as usual. Sending
+stays on the loop.
+
+Decoding still holds the GIL, so the thread takes the reads, framing and
+parsing off the loop but does not run in parallel with Python code on it.
+At most max_pending batches wait for the loop, then the thread stops reading
+and TCP flow control pushes back on TWS. Tick sinks are not called from the
+thread: tick-by-tick data goes through the wrapper, which IB hands to its
+sinks on the loop.
+"""
+
+
+import time
+import socket
+import collections
+import asyncio
+import logging
+import selectors
+import threading
+
+from typing import Callable, List, Optional, Tuple
+
+from ibapi import comm
+from ibapi.common import MAX_MSG_LEN, NO_VALID_ID
+from ibapi.errors import BAD_LENGTH
+from ibapi.utils import BadMessage
+
+from aib.capture import CaptureWriter
+from aib.metrics import Metrics
+from aib.reader import FrameBuffer
+
+logger = logging.getLogger(__name__)
+
+WrapperCall = Tuple[str, tuple]
+Dispatch = Callable[[int, List[WrapperCall]], None]
+
+
+class CallRecorder:
+    """Stands in for the wrapper in the decoder thread and records the calls"""
+
+    def __init__(self):
+        self.calls: List[WrapperCall] = []
+
+    def __getattr__(self, name: str) -> Callable:
+        def record(*args):
+            self.calls.append((name, args))
+        # Cached, __getattr__ runs once per callback name
+        self.__dict__[name] = record
+        return record
+
+
+class DecodeThread(threading.Thread):
+    def __init__(self, sock: socket.socket, decoder, dispatch: Dispatch,
+                 closed: Callable[[], None], loop: asyncio.AbstractEventLoop, read_size: int = 4096,
+                 fast_decode: bool = True, capture: Optional[CaptureWriter] = None, max_pending: int = 64,
+                 metrics: Optional[Metrics] = None, time_budget: float = 0.002):
+        super().__init__(name='aib-decoder', daemon=True)
+        # Duplicate of the connection's socket, closed by the thread
+        self.sock = sock
+        self.decoder = decoder
+        self.recorder = CallRecorder()
+        decoder.wrapper = self.recorder
+        # Tick sinks are not thread safe, their ticks go to the wrapper instead
+        decoder.tick_sinks = {}
+        self.dispatch = dispatch
+        self.closed = closed
+        self.loop = loop
+        self.read_size = read_size
+        self.fast_decode = fast_decode
+        self.capture = capture
+        self.metrics = metrics
+        self.pending = threading.Semaphore(max_pending)
+        self.time_budget = time_budget
+        # Batches waiting for the loop, and whether a _drain() is scheduled; both under _lock
+        self._batches = collections.deque()
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+        # Unblocks a thread waiting for the loop to take a batch
+        self.pending.release()
+        try:
+            # Wakes up the select() of the thread
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def run(self):
+        sock = self.sock
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        frame_buffer = FrameBuffer(2 * self.read_size)
+        recorder = self.recorder
+        try:
+            while not self._stopped:
+                if not selector.select(0.5):
+                    continue
+                try:
+                    data = sock.recv(self.read_size)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+                if not data:
+                    break
+                recv_ns = time.perf_counter_ns()
+                frame_buffer.extend(data)
+                capture = self.capture
+                if capture is not None:
+                    capture_ns = time.time_ns()
+                frames = frame_buffer.pop_frames()
+                metrics = self.metrics
+                if metrics is not None:
+                    metrics.counters['bytes_read'] += len(data)
+                    metrics.counters['frames_read'] += len(frames)
+                    decode = self._decode_timed
+                else:
+                    decode = self._decode
+                for msg in frames:
+                    if capture is not None:
+                        capture.write(capture_ns, msg)
+                    decode(msg)
+                if recorder.calls:
+                    batch = recorder.calls
+                    recorder.calls = []
+                    self.pending.acquire()
+                    if self._stopped:
+                        break
+                    with self._lock:
+                        self._batches.append((recv_ns, batch))
+                        if self._scheduled:
+                            continue
+                        self._scheduled = True
+                    self.loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:
+            # The loop was closed
+            logger.exception('decoder thread exiting')
+        finally:
+            selector.close()
+            sock.close()
+        if not self._stopped:
+            try:
+                self.loop.call_soon_threadsafe(self.closed)
+            except RuntimeError:
+                pass
+
+    def _drain(self):
+        # On the loop
+        deadline = time.perf_counter() + self.time_budget
+        batches = self._batches
+        while True:
+            with self._lock:
+                if not batches or self._stopped:
+                    self._scheduled = False
+                    return
+                recv_ns, batch = batches.popleft()
+            self.pending.release()
+            self.dispatch(recv_ns, batch)
+            if time.perf_counter() >= deadline:
+                # Still scheduled, the thread does not wake the loop again
+                self.loop.call_soon(self._drain)
+                return
+
+    def _decode_timed(self, text: bytes):
+        histogram = self.metrics.decode_histogram(text)
+        t0 = time.perf_counter_ns()
+        self._decode(text)
+        histogram.record(time.perf_counter_ns() - t0)
+
+    def _decode(self, text: bytes):
+        try:
+            if len(text) > MAX_MSG_LEN:
+                self.recorder.error(NO_VALID_ID, BAD_LENGTH.code(),
+                                    "%s:%d:%s" % (BAD_LENGTH.msg(), len(text), text))
+                return
+            if self.fast_decode:
+                self.decoder.interpret_msg(text)
+            else:
+                self.decoder.interpret(comm.read_fields(text))
+        except BadMessage:
+            logger.info("BadMessage")
+        except Exception:
+            logger.exception('could not decode %s', text)
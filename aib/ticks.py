@@ -0,0 +1,93 @@
+"""
+Fixed capacity ring buffers of tick-by-tick data backed by NumPy structured arrays.
+
+Every tick is written twice, at its slot and at slot + capacity, so the last n
+ticks are always one contiguous slice of the array and last() can return a view
+instead of a copy. Views alias the buffer: copy them to keep data that newer
+ticks will overwrite.
+
+Requires numpy (pip install aib[numpy]).
+"""
+
+
+import numpy as np
+
+from aib.decoder import TickSink
+
+BID_ASK_DTYPE = np.dtype([('time', 'i8'), ('bid', 'f8'), ('ask', 'f8'),
+                          ('bidSize', 'f8'), ('askSize', 'f8'), ('flags', 'u1')])
+LAST_DTYPE = np.dtype([('time', 'i8'), ('price', 'f8'), ('size', 'f8'), ('flags', 'u1')])
+MID_POINT_DTYPE = np.dtype([('time', 'i8'), ('midPoint', 'f8')])
+
+
+class TickRingBuffer(TickSink):
+    def __init__(self, capacity: int, dtype: np.dtype):
+        if capacity <= 0:
+            raise ValueError('capacity must be positive')
+        self.capacity = capacity
+        self.dtype = dtype
+        self.req_id = None
+        # Number of ticks appended since creation
+        self.count = 0
+        self._pos = 0
+        self._data = np.zeros(2 * capacity, dtype=dtype)
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, row: tuple):
+        pos = self._pos
+        data = self._data
+        data[pos] = row
+        data[pos + self.capacity] = row
+        pos += 1
+        self._pos = 0 if pos == self.capacity else pos
+        self.count += 1
+
+    def last(self, n: int = None) -> np.ndarray:
+        """ View of the last n ticks, oldest first """
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = self._pos + self.capacity
+        return self._data[end - n:end]
+
+    def clear(self):
+        self.count = 0
+        self._pos = 0
+
+
+class BidAskTicks(TickRingBuffer):
+    def __init__(self, capacity: int):
+        super().__init__(capacity, BID_ASK_DTYPE)
+
+    def on_bid_ask(self, time: int, bidPrice: float, askPrice: float,
+                   bidSize: float, askSize: float, mask: int):
+        self.append((time, bidPrice, askPrice, bidSize, askSize, mask & 3))
+
+
+class LastTicks(TickRingBuffer):
+    def __init__(self, capacity: int):
+        super().__init__(capacity, LAST_DTYPE)
+
+    def on_last(self, tickType: int, time: int, price: float, size: float, mask: int,
+                exchange: str, specialConditions: str):
+        self.append((time, price, size, mask & 3))
+
+
+class MidPointTicks(TickRingBuffer):
+    def __init__(self, capacity: int):
+        super().__init__(capacity, MID_POINT_DTYPE)
+
+    def on_mid_point(self, time: int, midPoint: float):
+        self.append((time, midPoint))
+
+
+def tick_ring_buffer(tickType: str, capacity: int) -> TickRingBuffer:
+    """ Buffer for a reqTickByTickData tickType: 'BidAsk', 'Last', 'AllLast' or 'MidPoint' """
+    if tickType == 'BidAsk':
+        return BidAskTicks(capacity)
+    if tickType in ('Last', 'AllLast'):
+        return LastTicks(capacity)
+    if tickType == 'MidPoint':
+        return MidPointTicks(capacity)
+    raise ValueError(f'Unknown tick type {tickType}')
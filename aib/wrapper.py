@@ -1,4 +1,3 @@
-from datetime import datetime
 from asyncio import Queue, Future
 from typing import Tuple, Optional, Callable, Any, Self, Dict
 from ibapi.commission_report import CommissionReport
@@ -8,21 +7,41 @@ from aib.objects import Error, Snap, OrderUpdate, OpenOrder, \
                         CompletedOrder, OpenOrderEnd, CompletedOrdersEnd, \
                         Position, ResponseContractDetails, ResponseContractDetailsEnd, \
                         ResponseExecDetails, ResponseExecDetailsEnd, \
-                        ResponseAccountSummary, ResponseAccountSummaryEnd
+                        ResponseAccountSummary, ResponseAccountSummaryEnd, \
+                        Last, MidPoint, TickPrice, TickSize, TickString, TickGeneric, TickOptionComputation, \
+                        TickSnapshotEnd, MarketDataType, MktDepth, MktDepthL2, RealTimeBar, \
+                        ResponseHistoricalData, ResponseHistoricalDataEnd, HistoricalDataUpdate, \
+                        ResponseHistoricalTicks, ResponseHistoricalTicksBidAsk, ResponseHistoricalTicksLast, \
+                        ResponseHeadTimestamp, ResponseSecDefOptParams, ResponseSecDefOptParamsEnd, \
+                        ResponseSymbolSamples, ResponseFundamentalData, PnL, PnLSingle, \
+                        PositionEnd, PositionMulti, PositionMultiEnd, AccountValue, PortfolioUpdate, \
+                        AccountDownloadEnd, AccountUpdateMulti, AccountUpdateMultiEnd, ManagedAccounts, CurrentTime
 
-NoDatetime = None
-
-ConvenientWrapperCallable = Callable[['ConvenientWrapper', Any, Any], Tuple[float, Any]]
+ConvenientWrapperCallable = Callable[['ConvenientWrapper', Any, Any], Tuple[int, Any]]
 
 
 class ConvenientWrapper(EWrapper):
+    """Puts (recv_ns, event) to rx_queue for every callback, recv_ns is the receive time of the message, see
+    AsyncRxClient.recv_ns"""
+
+    # Set by the client for every message
+    recv_ns: int = 0
+    # Get every (recv_ns, event) before rx_queue does, see add_sink()
+    sinks: tuple = ()
+    # Set by the client, tick-by-tick data of these reqIds goes to the TickSink only, see AsyncRxClient.tick_sinks
+    tick_sinks: dict = {}
 
     @staticmethod
     def put_and_prior(func: ConvenientWrapperCallable) -> ConvenientWrapperCallable:
-        def new_func(self: Self, *args, **kwargs) -> Tuple[float, Any]:
+        def new_func(self: Self, *args, **kwargs) -> Tuple[int, Any]:
             e = func(self, *args, **kwargs)
-            self.rx_queue.put_nowait(e)
-            getattr(EWrapper, func.__name__)(self, *args, **kwargs)
+            # None: nothing to put, e.g. a duplicate execution
+            if e is not None:
+                for sink in self.sinks:
+                    sink.put(e)
+                self.rx_queue.put_nowait(e)
+            # Prior is the next class in the MRO, e.g. IB which routes the event by reqId
+            getattr(super(ConvenientWrapper, self), func.__name__)(*args, **kwargs)
             return e
         return new_func
 
@@ -30,81 +49,301 @@ class ConvenientWrapper(EWrapper):
     def rx_queue(self) -> Queue:
         raise NotImplementedError
 
+    def add_sink(self, sink):
+        """ Pass every event to sink.put(), e.g. an ArrowSink (aib.sink), also those the rx_queue policy drops """
+        self.sinks = self.sinks + (sink,)
+
+    def remove_sink(self, sink):
+        self.sinks = tuple(s for s in self.sinks if s is not sink)
+
+    def intern_contract(self, contract):
+        """ Shared Contract instance for the events, provided by the next class in the MRO if any, e.g. IB """
+        prior = getattr(super(ConvenientWrapper, self), 'intern_contract', None)
+        return contract if prior is None else prior(contract)
+
+    def is_duplicate_execution(self, reqId, execution) -> bool:
+        """ Provided by the next class in the MRO if any, e.g. IB after a reconnect """
+        prior = getattr(super(ConvenientWrapper, self), 'is_duplicate_execution', None)
+        return False if prior is None else prior(reqId, execution)
+
+    def is_duplicate_commission(self, commissionReport) -> bool:
+        prior = getattr(super(ConvenientWrapper, self), 'is_duplicate_commission', None)
+        return False if prior is None else prior(commissionReport)
+
+    def is_duplicate_order_status(self, *args) -> bool:
+        prior = getattr(super(ConvenientWrapper, self), 'is_duplicate_order_status', None)
+        return False if prior is None else prior(*args)
+
+    @put_and_prior
+    def error(self, *args, **kwargs) -> Tuple[int, Error]:
+        e = (self.recv_ns, Error(*args, **kwargs))
+        return e
+
+    @put_and_prior
+    def tickByTickBidAsk(self, *args) -> Optional[Tuple[int, Snap]]:
+        # Only the stock decoder calls the wrapper with the ticks of a tick sink, FastDecoder skips it
+        if args[0] in self.tick_sinks:
+            return None
+        e = (self.recv_ns, Snap(*args))
+        return e
+
+    @put_and_prior
+    def orderStatus(self, *args) -> Optional[Tuple[int, OrderUpdate]]:
+        if self.is_duplicate_order_status(*args):
+            return None
+        e = (self.recv_ns, OrderUpdate(*args))
+        return e
+
+    ####################################################################################################################
+
+    @put_and_prior
+    def openOrder(self, orderId, contract, order, orderState) -> Tuple[int, OpenOrder]:
+        e = (self.recv_ns, OpenOrder(orderId, self.intern_contract(contract), order, orderState))
+        return e
+
+    @put_and_prior
+    def openOrderEnd(self) -> Tuple[int, OpenOrderEnd]:
+        e = (self.recv_ns, OpenOrderEnd())
+        return e
+
+    @put_and_prior
+    def completedOrder(self, contract, order, orderState) -> Tuple[int, CompletedOrder]:
+        e = (self.recv_ns, CompletedOrder(self.intern_contract(contract), order, orderState))
+        return e
+
+    @put_and_prior
+    def completedOrdersEnd(self) -> Tuple[int, CompletedOrdersEnd]:
+        e = (self.recv_ns, CompletedOrdersEnd())
+        return e
+
+    @put_and_prior
+    def position(self, account, contract, position, avgCost) -> Tuple[int, Position]:
+        e = (self.recv_ns, Position(account, self.intern_contract(contract), position, avgCost))
+        return e
+
+    @put_and_prior
+    def contractDetails(self, reqId, contractDetails) -> Tuple[int, ResponseContractDetails]:
+        contractDetails.contract = self.intern_contract(contractDetails.contract)
+        e = (self.recv_ns, ResponseContractDetails(reqId, contractDetails))
+        return e
+
+    @put_and_prior
+    def contractDetailsEnd(self, *args) -> Tuple[int, ResponseContractDetailsEnd]:
+        e = (self.recv_ns, ResponseContractDetailsEnd(*args))
+        return e
+
+    @put_and_prior
+    def commissionReport(self, commissionReport: CommissionReport) -> Optional[Tuple[int, CommissionReport]]:
+        if self.is_duplicate_commission(commissionReport):
+            return None
+        e = (self.recv_ns, commissionReport)
+        return e
+
+    @put_and_prior
+    def execDetails(self, reqId, contract, execution) -> Optional[Tuple[int, ResponseExecDetails]]:
+        if self.is_duplicate_execution(reqId, execution):
+            return None
+        e = (self.recv_ns, ResponseExecDetails(reqId, self.intern_contract(contract), execution))
+        return e
+
     @put_and_prior
-    def error(self, *args, **kwargs) -> Tuple[Optional[float], Error]:
-        e = (NoDatetime, Error(*args, **kwargs))
+    def execDetailsEnd(self, *args) -> Tuple[int, ResponseExecDetailsEnd]:
+        e = (self.recv_ns, ResponseExecDetailsEnd(*args))
         return e
 
+    ####################################################################################################################
+
     @put_and_prior
-    def tickByTickBidAsk(self, *args) -> Tuple[float, Snap]:
-        e = (datetime.now().timestamp(), Snap(*args))
+    def accountSummary(self, *args) -> Tuple[int, ResponseAccountSummary]:
+        e = (self.recv_ns, ResponseAccountSummary(*args))
         return e
 
     @put_and_prior
-    def orderStatus(self, *args) -> Tuple[float, OrderUpdate]:
-        e = (datetime.now().timestamp(), OrderUpdate(*args))
+    def accountSummaryEnd(self, *args) -> Tuple[int, ResponseAccountSummaryEnd]:
+        e = (self.recv_ns, ResponseAccountSummaryEnd(*args))
         return e
 
     ####################################################################################################################
 
     @put_and_prior
-    def openOrder(self, *args) -> Tuple[Optional[float], OpenOrder]:
-        e = (NoDatetime, OpenOrder(*args))
+    def tickByTickAllLast(self, *args) -> Optional[Tuple[int, Last]]:
+        if args[0] in self.tick_sinks:
+            return None
+        e = (self.recv_ns, Last(*args))
+        return e
+
+    @put_and_prior
+    def tickByTickMidPoint(self, *args) -> Optional[Tuple[int, MidPoint]]:
+        if args[0] in self.tick_sinks:
+            return None
+        e = (self.recv_ns, MidPoint(*args))
         return e
 
     @put_and_prior
-    def openOrderEnd(self) -> Tuple[Optional[float], OpenOrderEnd]:
-        e = (NoDatetime, OpenOrderEnd())
+    def tickPrice(self, *args) -> Tuple[int, TickPrice]:
+        e = (self.recv_ns, TickPrice(*args))
         return e
 
     @put_and_prior
-    def completedOrder(self, *args) -> Tuple[Optional[float], CompletedOrder]:
-        e = (NoDatetime, CompletedOrder(*args))
+    def tickSize(self, *args) -> Tuple[int, TickSize]:
+        e = (self.recv_ns, TickSize(*args))
         return e
 
     @put_and_prior
-    def completedOrdersEnd(self) -> Tuple[Optional[float], CompletedOrdersEnd]:
-        e = (NoDatetime, CompletedOrdersEnd())
+    def tickString(self, *args) -> Tuple[int, TickString]:
+        e = (self.recv_ns, TickString(*args))
         return e
 
     @put_and_prior
-    def position(self, *args) -> Tuple[Optional[float], Position]:
-        e = (NoDatetime, Position(*args))
+    def tickGeneric(self, *args) -> Tuple[int, TickGeneric]:
+        e = (self.recv_ns, TickGeneric(*args))
         return e
 
     @put_and_prior
-    def contractDetails(self, *args) -> Tuple[Optional[float], ResponseContractDetails]:
-        e = (NoDatetime, ResponseContractDetails(*args))
+    def tickOptionComputation(self, *args) -> Tuple[int, TickOptionComputation]:
+        e = (self.recv_ns, TickOptionComputation(*args))
         return e
 
     @put_and_prior
-    def contractDetailsEnd(self, *args) -> Tuple[Optional[float], ResponseContractDetailsEnd]:
-        e = (NoDatetime, ResponseContractDetailsEnd(*args))
+    def tickSnapshotEnd(self, *args) -> Tuple[int, TickSnapshotEnd]:
+        e = (self.recv_ns, TickSnapshotEnd(*args))
         return e
 
     @put_and_prior
-    def commissionReport(self, commissionReport: CommissionReport) -> Tuple[Optional[float], CommissionReport]:
-        e = (NoDatetime, commissionReport)
+    def marketDataType(self, *args) -> Tuple[int, MarketDataType]:
+        e = (self.recv_ns, MarketDataType(*args))
         return e
 
     @put_and_prior
-    def execDetails(self, *args) -> Tuple[Optional[float], ResponseExecDetails]:
-        e = (NoDatetime, ResponseExecDetails(*args))
+    def updateMktDepth(self, *args) -> Tuple[int, MktDepth]:
+        e = (self.recv_ns, MktDepth(*args))
         return e
 
     @put_and_prior
-    def execDetailsEnd(self, *args) -> Tuple[Optional[float], ResponseExecDetailsEnd]:
-        e = (NoDatetime, ResponseExecDetailsEnd(*args))
+    def updateMktDepthL2(self, *args) -> Tuple[int, MktDepthL2]:
+        e = (self.recv_ns, MktDepthL2(*args))
+        return e
+
+    @put_and_prior
+    def realtimeBar(self, *args) -> Tuple[int, RealTimeBar]:
+        e = (self.recv_ns, RealTimeBar(*args))
         return e
 
     ####################################################################################################################
 
     @put_and_prior
-    def accountSummary(self, *args) -> Tuple[Optional[float], ResponseAccountSummary]:
-        e = (NoDatetime, ResponseAccountSummary(*args))
+    def historicalData(self, *args) -> Tuple[int, ResponseHistoricalData]:
+        e = (self.recv_ns, ResponseHistoricalData(*args))
+        return e
+
+    @put_and_prior
+    def historicalDataEnd(self, *args) -> Tuple[int, ResponseHistoricalDataEnd]:
+        e = (self.recv_ns, ResponseHistoricalDataEnd(*args))
+        return e
+
+    @put_and_prior
+    def historicalDataUpdate(self, *args) -> Tuple[int, HistoricalDataUpdate]:
+        e = (self.recv_ns, HistoricalDataUpdate(*args))
+        return e
+
+    @put_and_prior
+    def historicalTicks(self, *args) -> Tuple[int, ResponseHistoricalTicks]:
+        e = (self.recv_ns, ResponseHistoricalTicks(*args))
+        return e
+
+    @put_and_prior
+    def historicalTicksBidAsk(self, *args) -> Tuple[int, ResponseHistoricalTicksBidAsk]:
+        e = (self.recv_ns, ResponseHistoricalTicksBidAsk(*args))
+        return e
+
+    @put_and_prior
+    def historicalTicksLast(self, *args) -> Tuple[int, ResponseHistoricalTicksLast]:
+        e = (self.recv_ns, ResponseHistoricalTicksLast(*args))
+        return e
+
+    @put_and_prior
+    def headTimestamp(self, *args) -> Tuple[int, ResponseHeadTimestamp]:
+        e = (self.recv_ns, ResponseHeadTimestamp(*args))
+        return e
+
+    @put_and_prior
+    def securityDefinitionOptionParameter(self, *args) -> Tuple[int, ResponseSecDefOptParams]:
+        e = (self.recv_ns, ResponseSecDefOptParams(*args))
+        return e
+
+    @put_and_prior
+    def securityDefinitionOptionParameterEnd(self, *args) -> Tuple[int, ResponseSecDefOptParamsEnd]:
+        e = (self.recv_ns, ResponseSecDefOptParamsEnd(*args))
+        return e
+
+    @put_and_prior
+    def symbolSamples(self, *args) -> Tuple[int, ResponseSymbolSamples]:
+        e = (self.recv_ns, ResponseSymbolSamples(*args))
+        return e
+
+    @put_and_prior
+    def fundamentalData(self, *args) -> Tuple[int, ResponseFundamentalData]:
+        e = (self.recv_ns, ResponseFundamentalData(*args))
+        return e
+
+    @put_and_prior
+    def currentTime(self, *args) -> Tuple[int, CurrentTime]:
+        e = (self.recv_ns, CurrentTime(*args))
+        return e
+
+    ####################################################################################################################
+
+    @put_and_prior
+    def pnl(self, *args) -> Tuple[int, PnL]:
+        e = (self.recv_ns, PnL(*args))
+        return e
+
+    @put_and_prior
+    def pnlSingle(self, *args) -> Tuple[int, PnLSingle]:
+        e = (self.recv_ns, PnLSingle(*args))
+        return e
+
+    @put_and_prior
+    def positionEnd(self) -> Tuple[int, PositionEnd]:
+        e = (self.recv_ns, PositionEnd())
+        return e
+
+    @put_and_prior
+    def positionMulti(self, reqId, account, modelCode, contract, pos, avgCost) -> Tuple[int, PositionMulti]:
+        e = (self.recv_ns, PositionMulti(reqId, account, modelCode, self.intern_contract(contract), pos, avgCost))
+        return e
+
+    @put_and_prior
+    def positionMultiEnd(self, *args) -> Tuple[int, PositionMultiEnd]:
+        e = (self.recv_ns, PositionMultiEnd(*args))
+        return e
+
+    @put_and_prior
+    def updateAccountValue(self, *args) -> Tuple[int, AccountValue]:
+        e = (self.recv_ns, AccountValue(*args))
+        return e
+
+    @put_and_prior
+    def updatePortfolio(self, contract, *args) -> Tuple[int, PortfolioUpdate]:
+        e = (self.recv_ns, PortfolioUpdate(self.intern_contract(contract), *args))
+        return e
+
+    @put_and_prior
+    def accountDownloadEnd(self, *args) -> Tuple[int, AccountDownloadEnd]:
+        e = (self.recv_ns, AccountDownloadEnd(*args))
+        return e
+
+    @put_and_prior
+    def accountUpdateMulti(self, *args) -> Tuple[int, AccountUpdateMulti]:
+        e = (self.recv_ns, AccountUpdateMulti(*args))
+        return e
+
+    @put_and_prior
+    def accountUpdateMultiEnd(self, *args) -> Tuple[int, AccountUpdateMultiEnd]:
+        e = (self.recv_ns, AccountUpdateMultiEnd(*args))
         return e
 
     @put_and_prior
-    def accountSummaryEnd(self, *args) -> Tuple[Optional[float], ResponseAccountSummaryEnd]:
-        e = (NoDatetime, ResponseAccountSummaryEnd(*args))
+    def managedAccounts(self, *args) -> Tuple[int, ManagedAccounts]:
+        e = (self.recv_ns, ManagedAccounts(*args))
         return e
@@ -0,0 +1,107 @@
+import time
+import random
+import asyncio
+
+from argparse import ArgumentParser
+from ibapi.contract import Contract
+
+from aib import IB
+from aib.bars import BarAggregator, BarSpec, TIME, TICK, VOLUME, DOLLAR
+from aib.mock import MockTWS, tick_by_tick_all_last
+
+SPECS = (BarSpec(TIME, 60), BarSpec(TICK, 100), BarSpec(VOLUME, 1000), BarSpec(DOLLAR, 1e6))
+
+
+class DictBars:
+    """OHLCV dict per spec updated on every tick, what a strategy would usually do"""
+
+    def __init__(self, specs):
+        self.specs = specs
+        self.open = {spec: None for spec in specs}
+        self.bars = {spec: [] for spec in specs}
+
+    def add(self, time, price, size):
+        for spec in self.specs:
+            bar = self.open[spec]
+            if spec.kind == TIME and bar is not None and time >= bar['time'] + spec.size:
+                self.bars[spec].append(bar)
+                bar = None
+            if bar is None:
+                start = time - time % spec.size if spec.kind == TIME else time
+                bar = self.open[spec] = {'time': start, 'open': price, 'high': price, 'low': price,
+                                         'volume': 0.0, 'dollar': 0.0, 'count': 0}
+            bar['high'] = max(bar['high'], price)
+            bar['low'] = min(bar['low'], price)
+            bar['close'] = price
+            bar['volume'] += size
+            bar['dollar'] += price * size
+            bar['count'] += 1
+            if (spec.kind == TICK and bar['count'] >= spec.size or spec.kind == VOLUME and bar['volume'] >= spec.size
+                    or spec.kind == DOLLAR and bar['dollar'] >= spec.size):
+                self.bars[spec].append(bar)
+                self.open[spec] = None
+
+
+def random_ticks(n: int):
+    rng = random.Random(1)
+    t = 1700000000
+    ticks = []
+    for _ in range(n):
+        t += rng.choice((0, 0, 1, 2))
+        ticks.append((t, 4500.0 + rng.randrange(-20, 20) * 0.25, float(rng.randrange(1, 20))))
+    return ticks
+
+
+def check_and_time(n: int):
+    ticks = random_ticks(n)
+    bars, reference = BarAggregator(SPECS, capacity=n), DictBars(SPECS)
+    for name, target in (('BarAggregator', bars), ('dict bars', reference)):
+        add = target.add
+        t0 = time.perf_counter()
+        for tick in ticks:
+            add(*tick)
+        dt = time.perf_counter() - t0
+        print(f'{name:>13}: {n / dt:>12,.0f} ticks/sec')
+    for spec in SPECS:
+        closed = bars.last(spec)
+        expected = reference.bars[spec]
+        assert len(closed) == len(expected), (spec, len(closed), len(expected))
+        for bar, ref in zip(closed, expected):
+            assert (bar['time'], bar['open'], bar['high'], bar['low'], bar['close'], bar['volume'], bar['count']) == \
+                   (ref['time'], ref['open'], ref['high'], ref['low'], ref['close'], ref['volume'], ref['count'])
+        print(f'{spec.kind:>13}: {len(closed)} bars match')
+
+
+async def bench_e2e(n: int):
+    ticks = random_ticks(n)
+    async with MockTWS() as tws:
+        ib = IB()
+        ib.send_rate = None
+        await ib.connect(tws.host, tws.port, 1)
+        run = asyncio.ensure_future(ib.run())
+        while not ib.ready:
+            await asyncio.sleep(0.01)
+        closed = 0
+
+        def on_bar(spec, row):
+            nonlocal closed
+            closed += 1
+
+        bars = ib.req_tick_by_tick_bars(Contract(), 'AllLast', SPECS, capacity=1000, on_bar=on_bar)
+        t0 = time.perf_counter()
+        await tws.blast(tick_by_tick_all_last(bars.req_id, *tick) for tick in ticks)
+        while bars.count < n:
+            await asyncio.sleep(0.001)
+        dt = time.perf_counter() - t0
+        print(f'       IB e2e: {n / dt:>12,.0f} ticks/sec, {closed} bars')
+        ib.cancel_tick_by_tick_buffer(bars)
+        run.cancel()
+        await ib.disconnect()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--ticks", type=int, default=200000, required=False, help="Ticks (default: 200000)")
+    args = parser.parse_args()
+    check_and_time(args.ticks)
+    asyncio.run(bench_e2e(args.ticks))
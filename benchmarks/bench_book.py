@@ -0,0 +1,117 @@
+import time
+import random
+import asyncio
+
+from argparse import ArgumentParser
+from ibapi.contract import Contract
+
+from aib import IB
+from aib.book import OrderBook, INSERT, UPDATE, DELETE
+from aib.mock import MockTWS, market_depth
+
+ROWS = 10
+
+
+class ListBook:
+    """Book kept in Python lists of [price, size], what a wrapper subclass would usually do"""
+
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.sides = ([], [])
+
+    def update(self, position, operation, side, price, size, marketMaker=''):
+        levels = self.sides[side]
+        if operation == INSERT:
+            levels.insert(min(position, len(levels)), [price, size])
+            del levels[self.rows:]
+        elif operation == UPDATE:
+            if position < len(levels):
+                levels[position] = [price, size]
+            elif position == len(levels):
+                levels.append([price, size])
+        elif operation == DELETE and position < len(levels):
+            del levels[position]
+
+
+def random_ops(n: int, rows: int = ROWS):
+    rng = random.Random(1)
+    sizes = [0, 0]
+    ops = []
+    for _ in range(n):
+        side = rng.randrange(2)
+        if sizes[side] == 0:
+            operation = INSERT
+        elif sizes[side] == rows:
+            operation = rng.choice((UPDATE, DELETE, INSERT))
+        else:
+            operation = rng.choice((INSERT, UPDATE, UPDATE, UPDATE, DELETE))
+        position = rng.randrange(sizes[side] + (operation == INSERT))
+        if operation == INSERT:
+            sizes[side] = min(rows, sizes[side] + 1)
+        elif operation == DELETE:
+            sizes[side] -= 1
+        ops.append((position, operation, side, 4500.0 + rng.randrange(40) * 0.25, float(rng.randrange(1, 100))))
+    return ops
+
+
+def check_and_time(n: int):
+    ops = random_ops(n)
+    book, reference = OrderBook(ROWS), ListBook(ROWS)
+    for i, op in enumerate(ops):
+        book.update(*op)
+        reference.update(*op)
+        if i % 997 == 0:
+            for levels, ref in ((book.asks, reference.sides[0]), (book.bids, reference.sides[1])):
+                assert levels.tolist() == [tuple(r) for r in ref], (i, levels, ref)
+    for name, target in (('OrderBook', OrderBook(ROWS)), ('list book', ListBook(ROWS))):
+        update = target.update
+        t0 = time.perf_counter()
+        for op in ops:
+            update(*op)
+        dt = time.perf_counter() - t0
+        print(f'{name:>10}: {n / dt:>12,.0f} updates/sec')
+
+
+async def bench_e2e(n: int):
+    ops = random_ops(n)
+    # Inserts below a full book are dropped without a version bump
+    expected = OrderBook(ROWS)
+    for op in ops:
+        expected.update(*op)
+    async with MockTWS() as tws:
+        ib = IB()
+        ib.send_rate = None
+        await ib.connect(tws.host, tws.port, 1)
+        run = asyncio.ensure_future(ib.run())
+        while not ib.ready:
+            await asyncio.sleep(0.01)
+        book = ib.subscribe_order_book(Contract(), ROWS)
+        wakeups = 0
+
+        async def watch_top():
+            nonlocal wakeups
+            while True:
+                await book.changed(depth=1)
+                wakeups += 1
+
+        watcher = asyncio.ensure_future(watch_top())
+        t0 = time.perf_counter()
+        await tws.blast(market_depth(book.req_id, *op) for op in ops)
+        while book.version < expected.version:
+            await asyncio.sleep(0.001)
+        dt = time.perf_counter() - t0
+        assert book.bids.tolist() == expected.bids.tolist() and book.asks.tolist() == expected.asks.tolist()
+        print(f'  IB e2e: {n / dt:>12,.0f} updates/sec, {wakeups} top of book wake-ups, '
+              f'mid {book.mid:.2f} spread {book.spread:.2f} imbalance(5) {book.imbalance(5):+.2f}')
+        watcher.cancel()
+        book.cancel()
+        run.cancel()
+        await ib.disconnect()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--updates", type=int, default=200000, required=False, help="Depth updates (default: 200000)")
+    args = parser.parse_args()
+    check_and_time(args.updates)
+    asyncio.run(bench_e2e(args.updates))
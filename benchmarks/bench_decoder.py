@@ -0,0 +1,56 @@
+import time
+import random
+
+from argparse import ArgumentParser
+from ibapi import comm
+from ibapi.decoder import Decoder
+from ibapi.server_versions import MAX_CLIENT_VER
+
+from aib.decoder import FastDecoder
+
+# The message mix of the equivalence test in tests/test_decoder.py
+from tests.test_decoder import random_messages
+
+
+class NullWrapper:
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+def bench(n, repeat):
+    rnd = random.Random(0)
+    msgs = [m for m in random_messages(rnd, n, truncated=0) if m.split(b'\0')[0] != b'9']
+    stock = Decoder(NullWrapper(), MAX_CLIENT_VER)
+    fast = FastDecoder(NullWrapper(), MAX_CLIENT_VER)
+
+    def run_stock():
+        for msg in msgs:
+            try:
+                stock.interpret(comm.read_fields(msg))
+            except Exception:
+                pass
+
+    def run_fast():
+        for msg in msgs:
+            try:
+                fast.interpret_msg(msg)
+            except Exception:
+                pass
+
+    for name, func in [('Decoder', run_stock), ('FastDecoder', run_fast)]:
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func()
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        print(f'{name:>12}: {len(msgs) / best:>12,.0f} msgs/sec')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=100000, required=False, help="Number of messages (default: 100000)")
+    parser.add_argument("--repeat", type=int, default=5, required=False, help="Repetitions, best is reported (default: 5)")
+    args = parser.parse_args()
+
+    bench(args.messages, args.repeat)
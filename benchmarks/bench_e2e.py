@@ -0,0 +1,199 @@
+import time
+import asyncio
+import resource
+
+from argparse import ArgumentParser
+from ibapi.wrapper import EWrapper
+
+from aib import AsyncRxClient, IB, ConvenientIB
+from aib.objects import Snap
+from aib.mock import MockTWS, tick_by_tick_bid_ask, market_depth, order_status
+
+REQ_ID = 1
+
+
+def bid_ask_frames(n: int):
+    # The tick time carries the send time in ns for the latency measurement
+    for i in range(n):
+        yield tick_by_tick_bid_ask(REQ_ID, time.perf_counter_ns(), 4500.25, 4500.5, i % 40, 12)
+
+
+def depth_frames(n: int):
+    for i in range(n):
+        yield market_depth(REQ_ID, i % 10, 1, i % 2, 4500.25 + (i % 10) * 0.25, i % 90)
+
+
+def order_status_frames(n: int):
+    # Every status of an order fills one more share, repeated statuses are duplicates the client drops
+    for i in range(n):
+        yield order_status(i % 100 + 1, 'Submitted', i // 100, n - i // 100, 0.0, 1000 + i % 100)
+
+
+STREAMS = {'bid_ask': bid_ask_frames, 'depth': depth_frames, 'order_status': order_status_frames}
+
+
+class Probe:
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.count = 0
+        self.latencies = []
+        # Socket read to rx_queue delivery, ConvenientIB only
+        self.queued = []
+        self.done = asyncio.Event()
+
+    def hit(self, sent_ns: int = None):
+        if sent_ns is not None:
+            self.latencies.append(time.perf_counter_ns() - sent_ns)
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+
+class ProbeWrapper(EWrapper):
+    def __init__(self, probe: Probe):
+        EWrapper.__init__(self)
+        self.probe = probe
+
+    def tickByTickBidAsk(self, reqId, time, *args):
+        self.probe.hit(time)
+
+    def updateMktDepth(self, *args):
+        self.probe.hit()
+
+    def orderStatus(self, *args):
+        self.probe.hit()
+
+
+class ProbeIB(IB):
+    def __init__(self, probe: Probe):
+        IB.__init__(self)
+        self.probe = probe
+
+    def tickByTickBidAsk(self, reqId, time, *args):
+        IB.tickByTickBidAsk(self, reqId, time, *args)
+        self.probe.hit(time)
+
+    def updateMktDepth(self, *args):
+        IB.updateMktDepth(self, *args)
+        self.probe.hit()
+
+    def orderStatus(self, *args):
+        IB.orderStatus(self, *args)
+        self.probe.hit()
+
+
+async def consume_rx_queue(ib: ConvenientIB, probe: Probe):
+    # Latency up to rx_queue delivery to the strategy, and from the socket read on
+    while True:
+        recv_ns, e = await ib.rx_queue.get()
+        probe.queued.append(time.perf_counter_ns() - recv_ns)
+        if isinstance(e, Snap):
+            probe.hit(e.time)
+        elif type(e).__name__ in ('MktDepth', 'OrderUpdate'):
+            probe.hit()
+
+
+def make_client(kind: str, probe: Probe, mode: str):
+    if kind == 'AsyncRxClient':
+        client = AsyncRxClient(ProbeWrapper(probe))
+    elif kind == 'IB':
+        client = ProbeIB(probe)
+    else:
+        client = ConvenientIB()
+    client.decode_thread = mode == 'thread'
+    return client
+
+
+async def loop_lag(lags: list, period: float = 0.001):
+    # Lateness of a 1ms timer, what a strategy coroutine on the loop waits for
+    loop = asyncio.get_running_loop()
+    while True:
+        t = loop.time()
+        await asyncio.sleep(period)
+        lags.append(loop.time() - t - period)
+
+
+def rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+async def send(tws: MockTWS, frames, rate: float, batch: int = 16):
+    if not rate:
+        await tws.blast(frames)
+        return
+    # Paced batches, so the latency is not dominated by the queues of a saturated client
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    sent = 0
+    chunk = []
+    for f in frames:
+        chunk.append(f)
+        if len(chunk) == batch:
+            sent += batch
+            delay = t0 + sent / rate - loop.time()
+            await asyncio.sleep(delay if delay > 0 else 0)
+            await tws.blast(chunk, batch)
+            chunk = []
+    if chunk:
+        await tws.blast(chunk, batch)
+
+
+async def bench(kind: str, stream: str, n: int, timeout: float, rate: float, mode: str):
+    probe = Probe(n)
+    lags = []
+    async with MockTWS() as tws:
+        client = make_client(kind, probe, mode)
+        await client.connect(tws.host, tws.port, 1)
+        tasks = [asyncio.ensure_future(client.run())]
+        if kind == 'ConvenientIB':
+            tasks.append(asyncio.ensure_future(consume_rx_queue(client, probe)))
+        while not tws.clients or (isinstance(client, IB) and not client.ready):
+            await asyncio.sleep(0.01)
+        rss0 = rss_kb()
+        t0 = time.perf_counter()
+        tasks.append(asyncio.ensure_future(loop_lag(lags)))
+        tasks.append(asyncio.ensure_future(send(tws, STREAMS[stream](n), rate)))
+        try:
+            await asyncio.wait_for(probe.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        dt = time.perf_counter() - t0
+        rss1 = rss_kb()
+        for task in tasks:
+            task.cancel()
+        await client.disconnect()
+
+    lat = probe.latencies
+    latency = f'  p50 {percentile(lat, 0.5) / 1e3:>9.1f}us  p99 {percentile(lat, 0.99) / 1e3:>9.1f}us' if lat else ' ' * 32
+    if probe.queued:
+        latency += f'  read to rx_queue p99 {percentile(probe.queued, 0.99) / 1e3:>9.1f}us'
+    print(f'{kind:>13} {mode:>6} {stream:>12}: {probe.count:>8} msgs {probe.count / dt:>10,.0f} msgs/sec'
+          f'{latency}  loop lag p99 {percentile(lags, 0.99) * 1e3:>6.2f}ms  max rss +{(rss1 - rss0) / 1024:.1f}MB')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=100000, required=False, help="Messages per stream (default: 100000)")
+    parser.add_argument("-k", "--clients", nargs='+', default=['AsyncRxClient', 'IB', 'ConvenientIB'],
+                        choices=['AsyncRxClient', 'IB', 'ConvenientIB'], help="Clients to benchmark")
+    parser.add_argument("-s", "--streams", nargs='+', default=list(STREAMS), choices=list(STREAMS), help="Streams to send")
+    parser.add_argument("-r", "--rate", type=float, default=0, required=False,
+                        help="Messages/sec sent by the mock TWS, 0 for as fast as possible (default: 0)")
+    parser.add_argument("-m", "--modes", nargs='+', default=['loop', 'thread'], choices=['loop', 'thread'],
+                        help="Decode in run() on the loop or in a decoder thread (default: both)")
+    parser.add_argument("--timeout", type=float, default=60.0, required=False, help="Timeout per run in seconds (default: 60)")
+    args = parser.parse_args()
+
+    print('latency (bid_ask): frame creation at the mock TWS to the callback (rx_queue delivery for ConvenientIB)')
+    print('loop lag: lateness of a 1ms timer on the event loop during the run')
+    for kind in args.clients:
+        for stream in args.streams:
+            for mode in args.modes:
+                asyncio.run(bench(kind, stream, args.messages, args.timeout, args.rate, mode))
@@ -0,0 +1,115 @@
+import time
+import random
+import asyncio
+
+from argparse import ArgumentParser
+from decimal import Decimal
+from ibapi import comm
+from ibapi.contract import Contract
+from ibapi.order import Order
+
+from aib import IB
+from aib.mock import MockTWS
+
+
+def contract() -> Contract:
+    c = Contract()
+    c.symbol, c.secType, c.exchange, c.currency = 'ES', 'FUT', 'CME', 'USD'
+    c.lastTradeDateOrContractMonth = '20241220'
+    return c
+
+
+def order(orderType: str, action: str = 'BUY') -> Order:
+    o = Order()
+    o.action, o.orderType, o.totalQuantity, o.tif, o.account = action, orderType, Decimal(1), 'DAY', 'DU0000001'
+    if orderType in ('LMT', 'STP LMT'):
+        o.lmtPrice = 4500.25
+    if orderType in ('STP', 'STP LMT'):
+        o.auxPrice = 4490.0
+    return o
+
+
+def stock_msg(ib: IB, order_id: int, c: Contract, o: Order) -> bytes:
+    sent = []
+    ib.sendMsg = sent.append
+    try:
+        ib.placeOrder(order_id, c, o)
+    finally:
+        del ib.sendMsg
+    return comm.make_msg(sent[0])
+
+
+def check(ib: IB, n: int):
+    rng = random.Random(1)
+    c = contract()
+    for orderType in ('MKT', 'LMT', 'STP', 'STP LMT'):
+        prototype = order(orderType)
+        template = ib.order_template(c, prototype)
+        for _ in range(n):
+            o = order(orderType)
+            order_id = rng.randrange(1, 1 << 30)
+            o.totalQuantity = Decimal(rng.randrange(1, 500))
+            lmt = aux = None
+            if template.has_lmt_price:
+                lmt = o.lmtPrice = 4000 + rng.randrange(4000) * 0.25
+            if template.has_aux_price:
+                aux = o.auxPrice = 4000 + rng.randrange(4000) * 0.25
+            assert template.encode(order_id, o.totalQuantity, lmt, aux) == stock_msg(ib, order_id, c, o), orderType
+    print(f'{n} orders of each of MKT, LMT, STP, STP LMT encode the same bytes as placeOrder')
+
+
+def percentiles(samples):
+    samples.sort()
+    return samples[len(samples) // 2] / 1000, samples[int(0.99 * len(samples))] / 1000
+
+
+def bench(ib: IB, n: int):
+    c = contract()
+    o = order('LMT')
+    template = ib.order_template(c, o)
+    encode_stock, encode_fast, wire_stock, wire_fast = [], [], [], []
+    clock = time.perf_counter_ns
+    for i in range(n):
+        o.lmtPrice = 4500.0 + (i % 40) * 0.25
+        t0 = clock()
+        stock_msg(ib, i, c, o)
+        t1 = clock()
+        template.encode(i, o.totalQuantity, o.lmtPrice)
+        t2 = clock()
+        encode_stock.append(t1 - t0)
+        encode_fast.append(t2 - t1)
+    for i in range(n):
+        o.lmtPrice = 4500.0 + (i % 40) * 0.25
+        t0 = clock()
+        ib.placeOrder(ib.req_id, c, o)
+        ib.req_id += 1
+        t1 = clock()
+        ib.place_order_fast(template, o.totalQuantity, o.lmtPrice)
+        t2 = clock()
+        wire_stock.append(t1 - t0)
+        wire_fast.append(t2 - t1)
+    for name, stock, fast in (('encode', encode_stock, encode_fast), ('to the socket', wire_stock, wire_fast)):
+        (s50, s99), (f50, f99) = percentiles(stock), percentiles(fast)
+        print(f'{name:>14}: placeOrder p50 {s50:6.1f}us p99 {s99:6.1f}us, '
+              f'template p50 {f50:6.1f}us p99 {f99:6.1f}us')
+
+
+async def main(n: int):
+    async with MockTWS() as tws:
+        ib = IB()
+        ib.send_rate = None
+        await ib.connect(tws.host, tws.port, 1)
+        run = asyncio.ensure_future(ib.run())
+        while not ib.ready:
+            await asyncio.sleep(0.01)
+        check(ib, 200)
+        bench(ib, n)
+        run.cancel()
+        await ib.disconnect()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--orders", type=int, default=20000, required=False, help="Orders (default: 20000)")
+    args = parser.parse_args()
+    asyncio.run(main(args.orders))
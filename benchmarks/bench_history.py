@@ -0,0 +1,71 @@
+import time
+import asyncio
+import tempfile
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+from ibapi.contract import Contract
+from ibapi.message import OUT
+
+from aib import IB
+from aib.history import duration_str
+from aib.mock import MockTWS, historical_data
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_duration(duration: str) -> timedelta:
+    n, unit = duration.split(' ')
+    return timedelta(seconds=int(n) * {'S': 1, 'D': 86400, 'W': 7 * 86400, 'Y': 364 * 86400}[unit])
+
+
+def serve_minute_bars(tws: MockTWS, writer, fields):
+    # reqHistoricalData: reqId, contract fields, ..., endDateTime, barSize, duration at 1, 15, 16 and 17
+    req_id = int(fields[1])
+    end = datetime.strptime(fields[15].decode(), '%Y%m%d-%H:%M:%S').replace(tzinfo=timezone.utc)
+    start = end - parse_duration(fields[17].decode())
+    t0, t1 = int(start.timestamp()), int(end.timestamp())
+    bars = ((t, 100.0, 100.5, 99.5, 100.25, 10, 100.1, 5) for t in range(t0, t1, 60))
+    writer.write(historical_data(req_id, str(t0), str(t1), bars))
+
+
+def contract() -> Contract:
+    c = Contract()
+    c.symbol = 'ES'
+    c.secType = 'FUT'
+    c.exchange = 'CME'
+    c.currency = 'USD'
+    c.lastTradeDateOrContractMonth = '20240621'
+    return c
+
+
+async def bench(days: int, concurrency: int):
+    async with MockTWS() as tws:
+        tws.handlers[OUT.REQ_HISTORICAL_DATA] = serve_minute_bars
+        ib = IB()
+        ib.send_rate = None
+        await ib.connect(tws.host, tws.port, 1)
+        run = asyncio.ensure_future(ib.run())
+        while not ib.ready:
+            await asyncio.sleep(0.01)
+        end = START + timedelta(days=days)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for pass_ in ('TWS', 'cache'):
+                downloader = ib.historical_downloader(cache_dir=cache_dir, concurrency=concurrency)
+                t0 = time.perf_counter()
+                bars = await downloader.a_bars(contract(), START, end, '1 min', 'TRADES', useRTH=False)
+                dt = time.perf_counter() - t0
+                print(f'{pass_:>5}: {len(bars):>8} bars of {days} days in {dt:6.2f}s, '
+                      f'{downloader.requests} requests of {duration_str(timedelta(days=1))}, {downloader.cache_hits} cache hits')
+            table = await downloader.a_bars(contract(), START, end, '1 min', 'TRADES', useRTH=False, output='arrow')
+            print(f'arrow: {table.num_rows} rows, columns {table.column_names}')
+        run.cancel()
+        await ib.disconnect()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-d", "--days", type=int, default=10, required=False, help="Days of 1 min bars (default: 10)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, required=False, help="Concurrent requests (default: 4)")
+    args = parser.parse_args()
+    asyncio.run(bench(args.days, args.concurrency))
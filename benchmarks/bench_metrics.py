@@ -0,0 +1,89 @@
+import time
+import random
+import asyncio
+
+from argparse import ArgumentParser
+
+from aib import ConvenientIB
+from aib.metrics import Histogram, Metrics
+from aib.mock import MockTWS, tick_by_tick_bid_ask, market_depth
+
+REQ_ID = 1
+
+
+def frames(n: int):
+    for i in range(n):
+        if i % 2:
+            yield tick_by_tick_bid_ask(REQ_ID, 1700000000, 4500.25, 4500.5, i % 40, 12)
+        else:
+            yield market_depth(REQ_ID, i % 10, 1, i % 2, 4500.25 + (i % 10) * 0.25, i % 90)
+
+
+def check_histogram(n: int = 100000):
+    values = [int(random.lognormvariate(10, 2)) for _ in range(n)]
+    h = Histogram()
+    t0 = time.perf_counter()
+    for v in values:
+        h.record(v)
+    dt = time.perf_counter() - t0
+    values.sort()
+    errors = []
+    for p in (0.5, 0.9, 0.99, 0.999):
+        exact = values[max(0, int(p * n + 0.5) - 1)]
+        errors.append(abs(h.percentile(p) - exact) / max(exact, 1))
+    print(f'histogram: {dt / n * 1e9:.0f}ns per record, max percentile error {max(errors):.2%}')
+
+
+async def consume(ib: ConvenientIB, n: int, done: asyncio.Event):
+    seen = 0
+    while True:
+        await ib.rx_queue.get()
+        seen += 1
+        if seen == n:
+            done.set()
+
+
+async def bench(n: int, metrics: Metrics = None):
+    async with MockTWS() as tws:
+        ib = ConvenientIB()
+        ib.metrics = metrics
+        await ib.connect(tws.host, tws.port, 1)
+        tasks = [asyncio.ensure_future(ib.run())]
+        while not ib.ready:
+            await asyncio.sleep(0.01)
+        # Events before the stream, e.g. nextValidId, are not counted
+        while not ib.rx_queue.empty():
+            ib.rx_queue.get_nowait()
+        done = asyncio.Event()
+        tasks.append(asyncio.ensure_future(consume(ib, n, done)))
+        t0 = time.perf_counter()
+        await tws.blast(frames(n))
+        await done.wait()
+        dt = time.perf_counter() - t0
+        for task in tasks:
+            task.cancel()
+        await ib.disconnect()
+    print(f'metrics {"on " if metrics else "off"}: {n / dt:>10,.0f} msgs/sec')
+
+
+def report(metrics: Metrics):
+    snapshot = metrics.snapshot()
+    for name, value in sorted(snapshot['counters'].items()):
+        print(f'{name:>32} {value:>12,}')
+    for name, value in sorted(snapshot['gauges'].items()):
+        print(f'{name:>32} {value:>12,}')
+    print(f'{"histogram (us)":>32} {"count":>12} {"p50":>9} {"p99":>9} {"p99.9":>9} {"max":>9}')
+    for name, s in sorted(snapshot['histograms'].items()):
+        print(f'{name:>32} {s["count"]:>12,} {s["p50"] / 1e3:>9.1f} {s["p99"] / 1e3:>9.1f} '
+              f'{s["p99.9"] / 1e3:>9.1f} {s["max"] / 1e3:>9.1f}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=100000, required=False, help="Messages (default: 100000)")
+    args = parser.parse_args()
+    check_histogram()
+    asyncio.run(bench(args.messages))
+    metrics = Metrics()
+    asyncio.run(bench(args.messages, metrics))
+    report(metrics)
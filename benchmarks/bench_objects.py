@@ -0,0 +1,78 @@
+import gc
+import tracemalloc
+
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from ibapi.common import TickAttribBidAsk
+from ibapi.server_versions import MAX_CLIENT_VER
+
+from aib.objects import Snap, TickPrice, MktDepth
+from aib.decoder import FastDecoder
+
+
+@dataclass
+class DictSnap:
+    # Snap as it was before slots
+    reqId: int
+    time: int
+    bidPrice: float
+    askPrice: float
+    bidSize: float
+    askSize: float
+    tickAttribBidAsk: TickAttribBidAsk
+
+
+def footprint(make, n: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    events = [make(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del events
+    # Less the list of references that holds the events
+    return (after - before) / n - 8
+
+
+class Recorder:
+    def __init__(self):
+        self.args = {}
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.args[name] = args
+        return record
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--events", type=int, default=200000, required=False, help="Number of events (default: 200000)")
+    args = parser.parse_args()
+
+    decoder = FastDecoder(Recorder(), MAX_CLIENT_VER)
+
+    def decoded(name: str, text: str):
+        decoder.interpret_msg(text.encode())
+        return decoder.wrapper.args[name]
+
+    def bid_ask(i):
+        # The same decoded arguments, shared Decimal sizes and a TickAttribBidAsk per event, for both layouts
+        return decoded('tickByTickBidAsk', f'99\x001\x003\x00{1700000000 + i}\x00{4500.25 + i}\x00{4500.5 + i}\x00'
+                                           f'{i % 50}\x00{i % 70}\x000\x00')
+
+    def make_dict_snap(i):
+        return 1000000000000 + i, DictSnap(*bid_ask(i))
+
+    def make_snap(i):
+        return 1000000000000 + i, Snap(*bid_ask(i))
+
+    def make_tick_price(i):
+        return 1000000000000 + i, TickPrice(*decoded('tickPrice', f'1\x006\x001\x001\x00{4500.25 + i}\x00{i % 50}\x000\x00'))
+
+    def make_mkt_depth(i):
+        return 1000000000000 + i, MktDepth(*decoded('updateMktDepth', f'12\x001\x001\x00{i % 10}\x001\x000\x00{4500.25 + i}\x00{i % 50}\x00'))
+
+    print('bytes per (recv_ns, event) including the int receive time and payload objects:')
+    for name, make in [('Snap, __dict__', make_dict_snap), ('Snap, slots', make_snap),
+                       ('TickPrice, slots', make_tick_price), ('MktDepth, slots', make_mkt_depth)]:
+        print(f'{name:>18}: {footprint(make, args.events):>7.1f}')
@@ -0,0 +1,73 @@
+import time
+import random
+
+from argparse import ArgumentParser
+from ibapi.contract import Contract
+from ibapi.execution import Execution
+from ibapi.order import Order
+
+from aib.objects import OrderUpdate
+from aib.orders import OrderStore
+
+
+def messages(n_orders: int, repeats: int):
+    """ orderStatus arguments of n_orders orders going Submitted then Filled, every status sent repeats times """
+    rng = random.Random(1)
+    msgs = []
+    for order_id in range(1, n_orders + 1):
+        perm_id = 1000000 + order_id
+        parent_id = order_id - order_id % 3 if order_id % 3 else 0
+        for status, filled, remaining in (('Submitted', 0, 100), ('Filled', 100, 0)):
+            msgs += [(order_id, status, filled, remaining, 0.0, perm_id, parent_id, 0.0, 1, '', 0.0)] * repeats
+    rng.shuffle(msgs)
+    msgs.sort(key=lambda m: m[1] == 'Filled')
+    return msgs
+
+
+def bench(n_orders: int, repeats: int, lookups: int):
+    msgs = messages(n_orders, repeats)
+    store = OrderStore(client_id=1)
+    contract = Contract()
+    for order_id in range(1, n_orders + 1):
+        order = Order()
+        order.totalQuantity = 100
+        store.on_place(order_id, contract, order)
+    t0 = time.perf_counter()
+    updates = sum(store.on_order_status(*m) is not None for m in msgs)
+    dt = time.perf_counter() - t0
+    print(f'orderStatus: {len(msgs) / dt:>12,.0f} msgs/sec, {len(msgs) - updates} duplicates of {len(msgs)} dropped')
+
+    t0 = time.perf_counter()
+    for i in range(n_orders):
+        execution = Execution()
+        execution.execId, execution.orderId, execution.clientId, execution.permId = f'e{i}', i + 1, 1, 1000001 + i
+        store.on_execution(contract, execution)
+    dt = time.perf_counter() - t0
+    print(f'execDetails: {n_orders / dt:>12,.0f} msgs/sec')
+
+    # What a strategy does without the store: scan the OrderUpdate events it kept
+    events = [OrderUpdate(*m) for m in msgs]
+    rng = random.Random(2)
+    ids = [rng.randrange(1, n_orders + 1) for _ in range(lookups)]
+    t0 = time.perf_counter()
+    for order_id in ids:
+        store.get(order_id).status
+        store.children(order_id)
+    dt_store = (time.perf_counter() - t0) / lookups
+    scans = max(1, lookups // 100)
+    t0 = time.perf_counter()
+    for order_id in ids[:scans]:
+        [e for e in events if e.orderId == order_id][-1].status
+        [e for e in events if e.parentId == order_id]
+    dt_scan = (time.perf_counter() - t0) / scans
+    print(f'state and children of an order: store {dt_store * 1e6:.2f}us, list scan {dt_scan * 1e6:.0f}us')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--orders", type=int, default=5000, required=False, help="Orders (default: 5000)")
+    parser.add_argument("-r", "--repeats", type=int, default=3, required=False,
+                        help="Times every orderStatus is sent (default: 3)")
+    parser.add_argument("-l", "--lookups", type=int, default=100000, required=False, help="Lookups (default: 100000)")
+    args = parser.parse_args()
+    bench(args.orders, args.repeats, args.lookups)
@@ -0,0 +1,73 @@
+import time
+import asyncio
+
+from argparse import ArgumentParser
+from ibapi.contract import Contract
+from ibapi.message import OUT
+from ibapi.wrapper import EWrapper
+
+from aib import AsyncRxClient
+from aib.mock import MockTWS
+
+
+def contract(i: int) -> Contract:
+    c = Contract()
+    c.symbol = f'S{i}'
+    c.secType = 'STK'
+    c.exchange = 'SMART'
+    c.currency = 'USD'
+    return c
+
+
+def max_in_window(times, window: float = 1.0) -> int:
+    best = 0
+    j = 0
+    for i, t in enumerate(times):
+        while times[j] <= t - window:
+            j += 1
+        best = max(best, i - j + 1)
+    return best
+
+
+async def bench(n: int, cancels: int, rate: float, burst: int):
+    arrivals = []
+
+    def record(tws, writer, fields):
+        arrivals.append((time.monotonic(), int(fields[0])))
+
+    async with MockTWS() as tws:
+        tws.handlers[OUT.REQ_MKT_DATA] = record
+        tws.handlers[OUT.CANCEL_ORDER] = record
+        client = AsyncRxClient(EWrapper(), send_rate=rate, send_burst=burst)
+        await client.connect(tws.host, tws.port, 1)
+        run = asyncio.ensure_future(client.run())
+        t0 = time.monotonic()
+        # One burst of data requests, then cancels that should overtake them
+        for i in range(n):
+            client.reqMktData(1000 + i, contract(i), '', False, False, [])
+        for i in range(cancels):
+            client.cancelOrder(i + 1, '')
+        while len(arrivals) < n + cancels:
+            await asyncio.sleep(0.05)
+        pipeline = client.conn.pipeline
+        rate_now = pipeline.send_rate() if pipeline is not None else float('nan')
+        run.cancel()
+        await client.disconnect()
+
+    times = [t for t, _ in arrivals]
+    last_cancel = max(i for i, (_, msg_id) in enumerate(arrivals) if msg_id == OUT.CANCEL_ORDER) if cancels else -1
+    print(f'rate={rate} burst={burst}: {n + cancels} msgs in {times[-1] - t0:.2f}s, '
+          f'max {max_in_window(times)} msgs in any 1s window, last cancel arrived #{last_cancel + 1}')
+    if pipeline is not None:
+        print(f'  {pipeline.sent} msgs in {pipeline.writes} writes, mean wait {pipeline.wait_mean * 1e3:.0f}ms, '
+              f'max wait {pipeline.wait_max * 1e3:.0f}ms, send rate over the last second {rate_now:.1f} msgs/sec')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--requests", type=int, default=200, required=False, help="Market data requests (default: 200)")
+    parser.add_argument("-c", "--cancels", type=int, default=5, required=False, help="Order cancels sent after them (default: 5)")
+    parser.add_argument("-r", "--rate", type=float, default=40.0, required=False, help="Messages/sec (default: 40)")
+    parser.add_argument("-b", "--burst", type=int, default=10, required=False, help="Burst (default: 10)")
+    args = parser.parse_args()
+    asyncio.run(bench(args.requests, args.cancels, args.rate, args.burst))
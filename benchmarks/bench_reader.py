@@ -0,0 +1,67 @@
+import time
+
+from argparse import ArgumentParser
+from ibapi import comm
+
+from aib.reader import FrameBuffer
+
+
+def make_burst(n_frames: int) -> bytes:
+    # Tick-by-tick BidAsk frames as sent by TWS
+    frames = []
+    for i in range(n_frames):
+        text = '\0'.join(['99', '1', '3', str(1700000000 + i), '4500.25', '4500.5', '10', '12', '0']) + '\0'
+        frames.append(comm.make_msg(text))
+    return b''.join(frames)
+
+
+def chunks(data: bytes, read_size: int):
+    return [data[i:i + read_size] for i in range(0, len(data), read_size)]
+
+
+def run_bytes(reads) -> int:
+    # The former EReader loop: immutable bytes and comm.read_msg
+    n = 0
+    buf = b''
+    for data in reads:
+        buf += data
+        while len(buf) > 0:
+            (size, msg, buf) = comm.read_msg(buf)
+            if msg:
+                n += 1
+            else:
+                break
+    return n
+
+
+def run_frame_buffer(reads, read_size: int) -> int:
+    n = 0
+    frame_buffer = FrameBuffer(2 * read_size)
+    for data in reads:
+        frame_buffer.extend(data)
+        n += len(frame_buffer.pop_frames())
+    return n
+
+
+def bench(name, func, n_frames, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        n = func()
+        dt = time.perf_counter() - t0
+        assert n == n_frames, (name, n, n_frames)
+        best = dt if best is None else min(best, dt)
+    print(f'{name:>14}: {n_frames / best:>12,.0f} frames/sec')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--frames", type=int, default=200000, required=False, help="Frames in the burst (default: 200000)")
+    parser.add_argument("-r", "--read-size", type=int, default=4096, required=False, help="Socket read size (default: 4096)")
+    parser.add_argument("--repeat", type=int, default=5, required=False, help="Repetitions, best is reported (default: 5)")
+    args = parser.parse_args()
+
+    reads = chunks(make_burst(args.frames), args.read_size)
+    print(f'{args.frames} frames in {len(reads)} reads of {args.read_size} bytes')
+    bench('bytes', lambda: run_bytes(reads), args.frames, args.repeat)
+    bench('FrameBuffer', lambda: run_frame_buffer(reads, args.read_size), args.frames, args.repeat)
@@ -0,0 +1,71 @@
+import os
+import time
+import asyncio
+import tempfile
+
+from argparse import ArgumentParser
+from ibapi.wrapper import EWrapper
+from ibapi.server_versions import MAX_CLIENT_VER
+
+from aib import AsyncRxClient
+from aib.capture import CaptureWriter
+
+
+class CountingWrapper(EWrapper):
+    def __init__(self):
+        EWrapper.__init__(self)
+        self.count = 0
+
+    def tickByTickBidAsk(self, *args):
+        self.count += 1
+
+    def tickByTickAllLast(self, *args):
+        self.count += 1
+
+    def updateMktDepth(self, *args):
+        self.count += 1
+
+
+def synthesize(path: str, n: int):
+    # Mix of BidAsk, AllLast and depth frames 10us apart
+    writer = CaptureWriter(path, MAX_CLIENT_VER)
+    t0 = time.time_ns()
+    for i in range(n):
+        kind = i % 3
+        if kind == 0:
+            text = f'99\x001\x003\x00{1700000000 + i}\x004500.25\x004500.5\x00{i % 40}\x0012\x000\x00'
+        elif kind == 1:
+            text = f'99\x002\x002\x00{1700000000 + i}\x004500.5\x00{i % 7}\x000\x00CME\x00\x00'
+        else:
+            text = f'12\x001\x003\x00{i % 10}\x001\x000\x004500.25\x00{i % 90}\x00'
+        writer.write(t0 + 10000 * i, text.encode())
+    writer.close()
+
+
+async def replay(path: str, fast_decode: bool, realtime: bool, speed: float):
+    wrapper = CountingWrapper()
+    client = AsyncRxClient(wrapper, fast_decode=fast_decode)
+    t0 = time.perf_counter()
+    await client.a_replay(path, realtime=realtime, speed=speed)
+    dt = time.perf_counter() - t0
+    print(f'fast_decode={fast_decode!s:>5}: {wrapper.count} callbacks in {dt:.2f}s, {wrapper.count / dt:>10,.0f} msgs/sec')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-f", "--file", required=False, help="Capture file, recorded with AsyncRxClient(capture_path=...)")
+    parser.add_argument("-n", "--frames", type=int, default=300000, required=False, help="Frames of the synthetic capture when no file is given (default: 300000)")
+    parser.add_argument("--realtime", action='store_true', help="Replay at the original pacing")
+    parser.add_argument("--speed", type=float, default=1.0, required=False, help="Pacing multiplier with --realtime (default: 1.0)")
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'synthetic.cap')
+        synthesize(path, args.frames)
+    try:
+        for fast_decode in (False, True):
+            asyncio.run(replay(path, fast_decode, args.realtime, args.speed))
+    finally:
+        if args.file is None:
+            os.remove(path)
@@ -0,0 +1,100 @@
+import os
+import time
+import asyncio
+import tempfile
+import multiprocessing
+
+from argparse import ArgumentParser
+from ibapi.contract import Contract
+from ibapi.order import Order
+
+from aib import IB
+from aib.mock import MockTWS, tick_by_tick_bid_ask, order_status
+from aib.shm import ShmBroadcaster, ShmClient, BID_ASK, ORDER_STATUS, STATUSES
+
+
+def reader(path: str, n: int, index: int, results):
+    async def main():
+        async with ShmClient(path) as client:
+            contract = Contract()
+            contract.symbol = 'ES'
+            stream = await client.a_subscribe_tick_by_tick_data(contract, 'BidAsk')
+            order = Order()
+            order.action, order.orderType, order.totalQuantity, order.lmtPrice = 'BUY', 'LMT', 1, 4500.0
+            order_id = await client.a_place_order(contract, order)
+            ring = client.ring
+            ticks = 0
+            status = ''
+            latency = []
+            t0 = None
+            while ticks < n or status != 'Filled':
+                records = await ring.a_poll(interval=0.0001)
+                now = time.perf_counter_ns()
+                if t0 is None:
+                    t0 = time.perf_counter()
+                mine = records[(records['stream'] == stream) & (records['kind'] == BID_ASK)]
+                ticks += len(mine)
+                if len(mine):
+                    # From the socket read in the broadcaster to here
+                    latency.append(now - int(mine['recv_ns'][0]))
+                orders = records[(records['kind'] == ORDER_STATUS) & (records['stream'] == order_id)]
+                if len(orders):
+                    status = STATUSES[orders['code'][-1]]
+            dt = time.perf_counter() - t0
+            latency.sort()
+            results.put((index, stream, ticks / dt, latency[len(latency) // 2], latency[int(0.99 * len(latency))],
+                         ring.lost, status))
+    asyncio.run(main())
+
+
+async def bench(n: int, readers: int, capacity: int, rate: float):
+    path = os.path.join(tempfile.mkdtemp(), 'aib.sock')
+    async with MockTWS() as tws:
+        ib = IB()
+        ib.send_rate = None
+        await ib.connect(tws.host, tws.port, 1)
+        run = asyncio.ensure_future(ib.run())
+        while not ib.ready:
+            await asyncio.sleep(0.01)
+        async with ShmBroadcaster(ib, path, capacity) as broadcaster:
+            ctx = multiprocessing.get_context('spawn')
+            results = ctx.Queue()
+            procs = [ctx.Process(target=reader, args=(path, n, i, results)) for i in range(readers)]
+            for p in procs:
+                p.start()
+            while len(broadcaster._sinks) < readers or len(ib.orders.orders) < readers:
+                await asyncio.sleep(0.01)
+            t0 = time.perf_counter()
+            streams = list(broadcaster._sinks)
+            for i in range(0, n, 100):
+                # One batch of 100 ticks per stream
+                tws.send(b''.join(tick_by_tick_bid_ask(stream, 1700000000 + j // 1000, 4500.0, 4500.25, 10, 12)
+                                  for stream in streams for j in range(i, min(n, i + 100))))
+                await asyncio.sleep(100 / rate if rate else 0)
+            for order_id in list(ib.orders.orders):
+                await tws.blast([order_status(order_id, 'Submitted', 0, 1, 0.0, 1000 + order_id),
+                                 order_status(order_id, 'Filled', 1, 0, 4500.0, 1000 + order_id)])
+            dt = time.perf_counter() - t0
+            print(f'broadcaster: {readers * n / dt:>12,.0f} ticks/sec sent')
+            for _ in procs:
+                index, stream, rate, p50, p99, lost, status = await asyncio.get_running_loop().run_in_executor(
+                    None, results.get)
+                print(f'   reader {index}: stream {stream} {rate:>12,.0f} ticks/sec, read latency p50 {p50 / 1000:.0f}us '
+                      f'p99 {p99 / 1000:.0f}us, {lost} lost, order {status}')
+            for p in procs:
+                p.join()
+        run.cancel()
+        await ib.disconnect()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--ticks", type=int, default=100000, required=False,
+                        help="Ticks per reader (default: 100000)")
+    parser.add_argument("-r", "--readers", type=int, default=2, required=False, help="Reader processes (default: 2)")
+    parser.add_argument("-c", "--capacity", type=int, default=1 << 16, required=False,
+                        help="Ring records (default: 65536)")
+    parser.add_argument("-R", "--rate", type=float, default=0, required=False,
+                        help="Ticks per second per reader, 0 for as fast as possible (default: 0)")
+    args = parser.parse_args()
+    asyncio.run(bench(args.ticks, args.readers, args.capacity, args.rate))
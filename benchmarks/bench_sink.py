@@ -0,0 +1,151 @@
+import csv
+import time
+import shutil
+import asyncio
+import tempfile
+
+from argparse import ArgumentParser
+
+import pyarrow.parquet as pq
+
+from aib import ConvenientIB
+from aib.objects import Snap, OrderUpdate
+from aib.mock import MockTWS, tick_by_tick_bid_ask, order_status
+from aib.sink import ArrowSink
+
+REQ_ID = 1
+ORDER_EVERY = 100
+
+
+def frames(n: int):
+    for i in range(n):
+        if i % ORDER_EVERY == 0:
+            yield order_status(i // ORDER_EVERY + 1, 'Submitted', 0, 10, 0.0, 1000 + i // ORDER_EVERY)
+        else:
+            yield tick_by_tick_bid_ask(REQ_ID, i, 4500.25, 4500.5, i % 40, 12)
+
+
+class RowWriter:
+    """ One CSV row per event written on the loop, the archive this replaces """
+
+    def __init__(self, directory: str):
+        self.file = open(f'{directory}/events.csv', 'w', newline='')
+        self.writer = csv.writer(self.file)
+
+    def put(self, item):
+        recv_ns, e = item
+        self.writer.writerow((recv_ns, type(e).__name__, *(getattr(e, f) for f in e.__slots__)))
+
+    def close(self):
+        self.file.close()
+
+
+async def loop_lag(lags: list, period: float = 0.001):
+    loop = asyncio.get_running_loop()
+    while True:
+        t = loop.time()
+        await asyncio.sleep(period)
+        lags.append(loop.time() - t - period)
+
+
+async def send(tws: MockTWS, n: int, rate: float, batch: int = 16):
+    if not rate:
+        await tws.blast(frames(n))
+        return
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    sent = 0
+    chunk = []
+    for f in frames(n):
+        chunk.append(f)
+        if len(chunk) == batch:
+            sent += batch
+            delay = t0 + sent / rate - loop.time()
+            await asyncio.sleep(delay if delay > 0 else 0)
+            await tws.blast(chunk, batch)
+            chunk = []
+    if chunk:
+        await tws.blast(chunk, batch)
+
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else float('nan')
+
+
+async def run(archive: str, n: int, rate: float, directory: str, batch_rows: int):
+    lags = []
+    sink = None
+    async with MockTWS() as tws:
+        ib = ConvenientIB()
+        ib.send_rate = None
+        if archive == 'arrow':
+            sink = ArrowSink(directory, batch_rows=batch_rows)
+            sink.start()
+        elif archive == 'rows':
+            sink = RowWriter(directory)
+        if sink is not None:
+            ib.add_sink(sink)
+        await ib.connect(tws.host, tws.port, 1)
+        tasks = [asyncio.ensure_future(ib.run())]
+        await ib.a_wait_ready(5)
+        tasks.append(asyncio.ensure_future(loop_lag(lags)))
+        t0 = time.perf_counter()
+        tasks.append(asyncio.ensure_future(send(tws, n, rate)))
+        count = 0
+        while count < n:
+            _, e = await ib.rx_queue.get()
+            if isinstance(e, (Snap, OrderUpdate)):
+                count += 1
+        dt = time.perf_counter() - t0
+        for task in tasks:
+            task.cancel()
+        t1 = time.perf_counter()
+        if archive == 'arrow':
+            await sink.stop()
+        elif archive == 'rows':
+            sink.close()
+        close = time.perf_counter() - t1
+        await ib.disconnect()
+    print(f'{archive:>6}: {n / dt:>9,.0f} msgs/sec  loop lag p99 {percentile(lags, 0.99) * 1e3:6.2f}ms '
+          f'max {max(lags) * 1e3:6.2f}ms  close {close * 1e3:6.1f}ms')
+    return sink
+
+
+def check(sink: ArrowSink, n: int):
+    assert sink.dropped == 0 and sink.errors == 0, (sink.dropped, sink.errors)
+    snaps = pq.read_table(f'{sink.directory}/Snap')
+    orders = pq.read_table(f'{sink.directory}/OrderUpdate')
+    expected_orders = (n + ORDER_EVERY - 1) // ORDER_EVERY
+    assert orders.num_rows == expected_orders and snaps.num_rows == n - expected_orders
+    times = snaps.column('time').to_pylist()
+    assert times == [i for i in range(n) if i % ORDER_EVERY], 'ticks out of order or missing'
+    assert snaps.column('bidSize').to_pylist() == [float(i % 40) for i in times]
+    epoch_ns = snaps.column('epoch_ns').to_pylist()
+    assert abs(epoch_ns[-1] / 1e9 - time.time()) < 60 and epoch_ns == sorted(epoch_ns), 'bad epoch_ns'
+    assert orders.column('orderId').to_pylist() == list(range(1, expected_orders + 1))
+    print(f'{snaps.num_rows} Snap and {orders.num_rows} OrderUpdate rows read back from {len(sink.files)} files')
+
+
+async def main(n: int, rate: float, batch_rows: int):
+    for archive in ('none', 'rows', 'arrow'):
+        directory = tempfile.mkdtemp()
+        try:
+            sink = await run(archive, n, rate, directory, batch_rows)
+            if archive == 'arrow':
+                check(sink, n)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=200000, required=False,
+                        help="Messages (default: 200000)")
+    parser.add_argument("-r", "--rate", type=float, default=20000, required=False,
+                        help="Messages/sec sent by the mock TWS, 0 for as fast as possible (default: 20000)")
+    parser.add_argument("-b", "--batch-rows", type=int, default=65536, required=False,
+                        help="Rows per record batch (default: 65536)")
+    args = parser.parse_args()
+    print('loop lag: lateness of a 1ms timer on the event loop during the run')
+    asyncio.run(main(args.messages, args.rate, args.batch_rows))
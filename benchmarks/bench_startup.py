@@ -0,0 +1,89 @@
+import sys
+import time
+import logging
+import asyncio
+import subprocess
+
+from argparse import ArgumentParser
+
+from aib import IB
+from aib.mock import MockTWS
+
+IMPORTS = ('import aib', 'import aib.ticks', 'import aib.shm', 'from aib import IB')
+
+
+def import_time(statement: str) -> float:
+    code = f'import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)'
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return float(out)
+
+
+def bench_imports(n: int):
+    for statement in IMPORTS:
+        samples = sorted(import_time(statement) for _ in range(n))
+        print(f'{statement:>18}: p50 {1000 * samples[n // 2]:6.1f}ms')
+
+
+def summary(name: str, samples):
+    samples.sort()
+    print(f'{name:>18}: p50 {1000 * samples[len(samples) // 2]:6.2f}ms max {1000 * samples[-1]:6.2f}ms')
+
+
+async def bench_connect(tws: MockTWS, n: int):
+    """ connect() to nextValidId, with the time of every lifecycle event """
+    ib = IB()
+    run = asyncio.ensure_future(ib.run())
+    connected, handshake, ready = [], [], []
+    clock = time.perf_counter
+    for _ in range(n):
+        t0 = clock()
+        connect = asyncio.ensure_future(ib.connect(tws.host, tws.port, 1))
+        await ib.a_wait_connected(5)
+        connected.append(clock() - t0)
+        await ib.a_wait_server_version(5)
+        handshake.append(clock() - t0)
+        await connect
+        await ib.a_wait_ready(5)
+        ready.append(clock() - t0)
+        await ib.disconnect()
+        await ib.a_wait_disconnected(5)
+    run.cancel()
+    summary('socket open', connected)
+    summary('server version', handshake)
+    summary('nextValidId', ready)
+
+
+async def bench_reconnect(tws: MockTWS, n: int):
+    """ Time from a dropped connection to nextValidId on the new one under a_supervise() """
+    ib = IB(port=tws.port)
+    supervise = asyncio.ensure_future(ib.a_supervise(connect_timeout=5))
+    await ib.a_wait_ready(5)
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        tws.disconnect(1)
+        await ib.a_wait_disconnected(5)
+        await ib.a_wait_ready(5)
+        samples.append(time.perf_counter() - t0)
+    supervise.cancel()
+    await asyncio.gather(supervise, return_exceptions=True)
+    summary('drop to ready', samples)
+
+
+async def main(n: int):
+    # The dropped connections are logged as warnings
+    logging.getLogger('aib').setLevel(logging.ERROR)
+    async with MockTWS() as tws:
+        await bench_connect(tws, n)
+        await bench_reconnect(tws, n)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-i", "--imports", type=int, default=10, required=False,
+                        help="Interpreters started per import (default: 10)")
+    parser.add_argument("-n", "--connects", type=int, default=50, required=False,
+                        help="Connects and reconnects (default: 50)")
+    args = parser.parse_args()
+    bench_imports(args.imports)
+    asyncio.run(main(args.connects))
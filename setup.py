@@ -7,4 +7,5 @@ setup(name='aib',
       author='Dimitris Dimitropoulos',
       author_email='ddimitrgr@gmail.com',
       packages=['aib'],
-      install_requires=[])
\ No newline at end of file
+      install_requires=[],
+      extras_require={'numpy': ['numpy'], 'arrow': ['numpy', 'pyarrow']})
\ No newline at end of file
@@ -0,0 +1,103 @@
+import random
+import logging
+
+import pytest
+
+from ibapi import comm
+from ibapi.decoder import Decoder
+from ibapi.server_versions import MAX_CLIENT_VER
+
+from aib.decoder import FastDecoder
+
+
+class RecordingWrapper:
+    """Records every wrapper call made by a decoder"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.calls.append((name, tuple(normalize(a) for a in args)))
+        return record
+
+
+def normalize(arg):
+    if hasattr(arg, '__dict__'):
+        return type(arg).__name__, tuple(sorted(vars(arg).items()))
+    return type(arg).__name__, arg
+
+
+def field(v) -> str:
+    return str(v) + '\0'
+
+
+def random_size(rnd):
+    return rnd.choice(['100', '0', '', '2147483647', '9223372036854775807', '1.7976931348623157E308',
+                       '12.5', '0.0001', str(rnd.randint(1, 10000))])
+
+
+def random_price(rnd):
+    return rnd.choice(['4500.25', '0', '', '-1', 'Infinity', '1.7976931348623157E308', str(rnd.random() * 1000)])
+
+
+def random_messages(rnd, n, truncated=0.05):
+    msgs = []
+    for i in range(n):
+        kind = rnd.randrange(9)
+        req_id = str(rnd.randint(1, 50))
+        if kind == 0:
+            text = '1\x006\x00' + ''.join(field(v) for v in [req_id, rnd.choice([1, 2, 4, 6, 9, 66, 67, 68, 14]),
+                                                               random_price(rnd), random_size(rnd), rnd.randint(-1, 7)])
+        elif kind == 1:
+            text = '2\x006\x00' + ''.join(field(v) for v in [req_id, rnd.choice([0, 3, 5, 8, -1, 69]), random_size(rnd)])
+        elif kind == 2:
+            text = '12\x001\x00' + ''.join(field(v) for v in [req_id, rnd.randint(0, 9), rnd.randint(0, 2),
+                                                                rnd.randint(0, 1), random_price(rnd), random_size(rnd)])
+        elif kind == 3:
+            text = '13\x001\x00' + ''.join(field(v) for v in [req_id, rnd.randint(0, 9), rnd.choice(['NSDQ', 'ARCA', '', 'é']),
+                                                                rnd.randint(0, 2), rnd.randint(0, 1), random_price(rnd),
+                                                                random_size(rnd), rnd.randint(0, 1)])
+        elif kind == 4:
+            text = '50\x003\x00' + ''.join(field(v) for v in [req_id, 1700000000 + i] + [random_price(rnd) for _ in range(4)]
+                                                                + [random_size(rnd), random_size(rnd), rnd.randint(0, 99)])
+        elif kind == 5:
+            text = '99\x00' + ''.join(field(v) for v in [req_id, 3, 1700000000 + i, random_price(rnd), random_price(rnd),
+                                                         random_size(rnd), random_size(rnd), rnd.randint(0, 3)])
+        elif kind == 6:
+            text = '99\x00' + ''.join(field(v) for v in [req_id, rnd.choice([1, 2]), 1700000000 + i, random_price(rnd),
+                                                         random_size(rnd), rnd.randint(0, 3), rnd.choice(['ISLAND', '']),
+                                                         rnd.choice(['', 'T I'])])
+        elif kind == 7:
+            text = '99\x00' + ''.join(field(v) for v in [req_id, rnd.choice([0, 4]), 1700000000 + i, random_price(rnd)])
+        else:
+            # Other messages go through the stock decoder
+            text = '9\x001\x00' + field(rnd.randint(1, 1000))
+        if rnd.random() < truncated:
+            # Truncated message
+            text = text[:text.rindex('\0', 0, len(text) - 1) + 1]
+        msgs.append(text.encode())
+    return msgs
+
+
+def decode_calls(decoder, decode, msg):
+    decoder.wrapper.calls = []
+    try:
+        decode(msg)
+        exc = None
+    except Exception as e:
+        exc = type(e).__name__
+    return decoder.wrapper.calls, exc
+
+
+@pytest.mark.parametrize('server_version', [100, 120, 140, MAX_CLIENT_VER])
+def test_fast_decoder_matches_stock_decoder(server_version, caplog):
+    # The stock decoder logs the truncated messages as errors
+    caplog.set_level(logging.CRITICAL, logger='ibapi')
+    msgs = random_messages(random.Random(1), 20000)
+    stock = Decoder(RecordingWrapper(), server_version)
+    fast = FastDecoder(RecordingWrapper(), server_version)
+    for msg in msgs:
+        expected = decode_calls(stock, lambda m: stock.interpret(comm.read_fields(m)), msg)
+        got = decode_calls(fast, fast.interpret_msg, msg)
+        assert got == expected, f'message {msg}'